@@ -0,0 +1,408 @@
+"""
+Micro-benchmarks for the simulation hot paths.
+
+Every case runs against fixed inputs, is warmed up before it is measured and reports
+median/percentile timings per call together with the memory allocated per call.
+Results are written as JSON so that two runs can be compared with ``--compare``.
+
+The suite runs fully offline: the PEM controller is given an ``OfflineMQTTManager``
+instead of a broker connection.
+
+Usage (from the repository root):
+    python -m Benchmarks.hot_paths
+    python -m Benchmarks.hot_paths --only calculate_R_PEM --repeat 5
+    python -m Benchmarks.hot_paths --compare Benchmarks/results/hot_paths-<stamp>.json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import paho.mqtt.client as mqtt
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class _PublishResult:
+    def __init__(self, rc):
+        self.rc = rc
+
+
+class OfflineMQTTManager:
+    """Drop-in replacement for MQTTManager that accepts every publish without touching the network."""
+
+    def __init__(self):
+        self.published = 0
+
+    def send_sensor_data(self, device_id, topic, payload):
+        self.published += 1
+        return _PublishResult(mqtt.MQTT_ERR_SUCCESS)
+
+    def stop_clients(self):
+        pass
+
+
+# Benchmark cases. Each setup function builds its fixed inputs once and returns the callable to time.
+
+def _setup_calculate_r_pem():
+    from State.CentralizedState import CentralizedState
+    from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import PEMParametersOhmic, PEMOhmicOverpotentialModel
+
+    model = PEMOhmicOverpotentialModel()
+    params = PEMParametersOhmic(T=300, z=2, F=96500, R=8.314)
+    state = CentralizedState(initial_values={'lambda_a': 20, 'lambda_c': 10, 'L': 0.01, 'J': 0.1})
+    return lambda: model.calculate_R_PEM(params, state)
+
+
+def _setup_compressibility_factor():
+    from Units.Compressor.Models.liquid_density_effects import (
+        CRITICAL_PROPERTIES, compressibility_factor, peng_robinson_parameters, ureg
+    )
+
+    T = 343.15 * ureg.K
+    P = 30 * ureg.bar
+    a, b = peng_robinson_parameters(T, **CRITICAL_PROPERTIES["H2"])
+    return lambda: compressibility_factor(T, P, a, b)
+
+
+def _setup_van_der_waals_equation():
+    from Units.Storage.Container import HydrogenContainerParameters, HydrogenContainerModel
+
+    model = HydrogenContainerModel()
+    params = HydrogenContainerParameters(V=2, T=300, n=1000, a=0.025, b=0.0002, inflow_rate=1, outflow_rate=0.5,
+                                         heat_exchange_rate=1000)
+    return lambda: model.van_der_waals_equation(params)
+
+
+def _setup_efficiency_kernels():
+    from State.CentralizedState import CentralizedState
+    from Units.PEMHydrogenGenerator.Efficiency.Efficiency import H2GeneratorEfficiencyParameters, H2GeneratorEfficiency
+
+    calculator = H2GeneratorEfficiency()
+    params = H2GeneratorEfficiencyParameters(LHV_H2=120, Q_heatpEM=10, Q_heat_H2O=10, E_H2=10, E_electric=10,
+                                             E_heatpEM=10, E_heat_H2O=10)
+    state = CentralizedState(initial_values={'N_H2_out_dot': 5, 'Q_electric': 10})
+    return lambda: calculator.update(params, state)
+
+
+def _setup_exergy_kernel():
+    import simpy
+    from State.CentralizedState import CentralizedState
+    from Units.PEMHydrogenGenerator.Efficiency.Exergy import ExergyParameters, ExergyCalculator
+
+    state = CentralizedState(initial_values={'T': 300})
+    params = ExergyParameters(E_chem=100, E_phy=50, H=200, S=1, T0=273.15, S0=0.8)
+    calculator = ExergyCalculator(simpy.Environment(), params, state, 1)
+    return calculator.compute_total_exergy
+
+
+def _setup_heat_exergy_kernels():
+    from State.CentralizedState import CentralizedState
+    from Units.PEMHydrogenGenerator.Models.HeatExergy import PEMHeatExergyParameters, PEMHeatExergyCalculator
+
+    calculator = PEMHeatExergyCalculator()
+    params = PEMHeatExergyParameters(F=96500, eta_act_a=0.1, eta_act_c=0.1, eta_ohm=0.1, Delta_S=10, T0=300)
+    state = CentralizedState(initial_values={'J': 10, 'T': 300})
+    return lambda: calculator.update(params, state)
+
+
+def _setup_activation_overpotential():
+    from State.CentralizedState import CentralizedState
+    from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters, ActivationOverpotential
+
+    model = ActivationOverpotential()
+    params = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000, E_act_c=80000)
+    state = CentralizedState(initial_values={'J': 10})
+    return lambda: model.update(params, state)
+
+
+def _setup_megapack_charge_discharge():
+    import simpy
+    from Units.Batteries.Model.TeslaMegapack import TeslaMegapack
+
+    battery = TeslaMegapack(simpy.Environment(), capacity_mwh=4.32, max_charge_rate_mw=1, max_discharge_rate_mw=1)
+
+    def cycle():
+        battery.charge(0.75)
+        battery.discharge(0.5)
+
+    return cycle
+
+
+def _setup_pem_controller_tick():
+    import simpy
+    from Controllers.PEMHydrogenGeneratorController import PEMHydrogenGeneratorController
+
+    controller = PEMHydrogenGeneratorController(simpy.Environment(), mqtt_manager=OfflineMQTTManager(),
+                                                real_time=False)
+    return controller.step
+
+
+def _setup_operating_point_solve():
+    import itertools
+    from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+    from Units.PEMHydrogenGenerator.Models.OperatingPoint import PEMOperatingPointParameters, PEMOperatingPointSolver
+
+    params = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000, E_act_c=80000)
+    solver = PEMOperatingPointSolver(params, PEMOperatingPointParameters(V0=1.23, R_PEM=1.5e-3, area=1.0,
+                                                                         n_cells=200))
+    # Cycle through distinct set-points so the repeated-set-point shortcut is not measured
+    power_w = itertools.cycle([2.5e5 * (i + 1) for i in range(97)])
+    return lambda: solver.solve(next(power_w))
+
+
+def _setup_polarization_surrogate_year():
+    import numpy as np
+    from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+    from Units.PEMHydrogenGenerator.Models.PolarizationSurrogate import PolarizationSurrogate
+
+    params = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000, E_act_c=80000)
+    surrogate = PolarizationSurrogate(params, V0=1.23, lambda_a=20, lambda_c=10, L=0.01, cache_dir=None)
+    rng = np.random.default_rng(0)
+    # One hourly year of operating points per call
+    J = rng.uniform(0, 20000, 8760)
+    T = rng.uniform(293.15, 353.15, 8760)
+    return lambda: surrogate.evaluate(J, T)
+
+
+def _setup_sensor_ingest_batch():
+    from Sensors.Ingestion import SENSOR_TOPICS, SensorIngestor, encode_frame
+    from State.CentralizedState import CentralizedState
+
+    ingestor = SensorIngestor(CentralizedState())
+    topics = [topic.replace("#", "value") for topic in SENSOR_TOPICS]
+    # 1000 messages per call: binary frames, bare numbers and JSON readings, then one drain
+    messages = [(topics[i % len(topics)],
+                 [encode_frame(i % 8, float(i), 300.0 + i), str(300.0 + i).encode(),
+                  b'{"value": %d, "timestamp": %d}' % (i, i)][i % 3]) for i in range(1000)]
+    ingest = ingestor.ingest
+
+    def run():
+        for topic, payload in messages:
+            ingest(topic, payload)
+        ingestor.drain()
+    return run
+
+
+def _setup_enkf_update():
+    import itertools
+    from State.EnsembleKalmanFilter import ElectrolyzerModelParameters, EnsembleKalmanFilter
+    from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+
+    activation = PEMParameters(R=8.314, T=333.15, F=96500, J_ref_a=1e5, J_ref_c=1e7, E_act_a=50000, E_act_c=30000)
+    enkf = EnsembleKalmanFilter(ElectrolyzerModelParameters(activation, L=1.78e-4),
+                                initial_mean=[333.15, 10000.0, 14.0, 12.0, 0.0],
+                                initial_std=[0.5, 500.0, 2.0, 2.0, 1e-5], members=200)
+    # One assimilation of T, J and V per second of sensor data
+    t = itertools.count()
+    return lambda: enkf.update(float(next(t)), {"T": 333.2, "J": 10000.0, "V": 1.95})
+
+
+def _setup_membrane_transport_step():
+    from Units.PEMHydrogenGenerator.Models.MembraneWaterTransport import (
+        MembraneWaterTransportParameters, MembraneWaterTransport
+    )
+
+    # One tick of 1000 stacks at different loads: implicit step plus resistance
+    transport = MembraneWaterTransport(MembraneWaterTransportParameters(), stacks=1000, lambda0=14.0)
+    J = [20.0 * (i + 1) for i in range(1000)]
+
+    def run():
+        transport.step(3600.0, J, 353.15, 20.0, 10.0)
+        return transport.resistance(353.15)
+    return run
+
+
+def _setup_liquid_piston_step():
+    from Units.Compressor.Models.LiquidPistonVOF import LiquidPistonParameters, LiquidPistonVOF
+
+    # One adaptive step on 2000 cells, restarting the cycle so the timed steps stay within the first one
+    params = LiquidPistonParameters(n_cells=2000)
+    state = {"solver": LiquidPistonVOF(params)}
+
+    def run():
+        solver = state["solver"]
+        if solver.t > 0.9 / params.frequency:
+            solver = state["solver"] = LiquidPistonVOF(params)
+        return solver.step()
+    return run
+
+
+CASES = {
+    "calculate_R_PEM": _setup_calculate_r_pem,
+    "compressibility_factor": _setup_compressibility_factor,
+    "van_der_waals_equation": _setup_van_der_waals_equation,
+    "H2GeneratorEfficiency.update": _setup_efficiency_kernels,
+    "ExergyCalculator.compute_total_exergy": _setup_exergy_kernel,
+    "PEMHeatExergyCalculator.update": _setup_heat_exergy_kernels,
+    "ActivationOverpotential.update": _setup_activation_overpotential,
+    "TeslaMegapack.charge_discharge": _setup_megapack_charge_discharge,
+    "PEMHydrogenGeneratorController.step": _setup_pem_controller_tick,
+    "PEMOperatingPointSolver.solve": _setup_operating_point_solve,
+    "PolarizationSurrogate.evaluate[8760]": _setup_polarization_surrogate_year,
+    "SensorIngestor.ingest[1000]": _setup_sensor_ingest_batch,
+    "EnsembleKalmanFilter.update[200]": _setup_enkf_update,
+    "MembraneWaterTransport.step[1000]": _setup_membrane_transport_step,
+    "LiquidPistonVOF.step[2000]": _setup_liquid_piston_step,
+}
+
+
+def _percentile(sorted_values, fraction):
+    # Linear interpolation between closest ranks
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def _calibrate(func, min_sample_ns):
+    """Find how many calls make up one sample so that a sample lasts at least min_sample_ns."""
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= min_sample_ns or number >= 1_000_000:
+            return number
+        number *= 10 if elapsed == 0 else max(2, min(10, int(min_sample_ns / elapsed) + 1))
+
+
+def measure(func, warmup=5, repeat=30, min_sample_ns=2_000_000, alloc_calls=20):
+    """
+    Time a zero-argument callable.
+
+    Parameters:
+    - func: The callable to benchmark.
+    - warmup: Number of calls made before anything is measured.
+    - repeat: Number of timed samples.
+    - min_sample_ns: Minimum duration of one sample; fast callables are looped to reach it.
+    - alloc_calls: Number of calls traced with tracemalloc to estimate allocations.
+
+    Returns:
+    - dict with per-call timings in nanoseconds and allocation figures in bytes.
+    """
+    for _ in range(warmup):
+        func()
+
+    number = _calibrate(func, min_sample_ns)
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                func()
+            samples.append((time.perf_counter_ns() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Allocations are measured in a separate pass, tracing slows every call down considerably
+    tracemalloc.start()
+    try:
+        peaks = []
+        net_total = 0
+        for _ in range(alloc_calls):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            net_total += after - before
+    finally:
+        tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "calls_per_sample": number,
+        "samples": repeat,
+        "median_ns": statistics.median(samples),
+        "mean_ns": statistics.fmean(samples),
+        "min_ns": samples[0],
+        "p90_ns": _percentile(samples, 0.90),
+        "p99_ns": _percentile(samples, 0.99),
+        "max_ns": samples[-1],
+        "stdev_ns": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "alloc_peak_bytes_per_call": max(peaks) if peaks else 0,
+        "alloc_net_bytes_per_call": net_total / alloc_calls if alloc_calls else 0,
+    }
+
+
+def run(names=None, warmup=5, repeat=30, min_sample_ns=2_000_000, quiet=True):
+    """Run the selected benchmark cases (all by default) and return the results document."""
+    names = list(CASES) if not names else names
+    results = {}
+    for name in names:
+        # The models print and log on every call; keep that out of the terminal and out of the timings
+        with open(os.devnull, "w") as devnull, contextlib.ExitStack() as stack:
+            if quiet:
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            func = CASES[name]()
+            results[name] = measure(func, warmup=warmup, repeat=repeat, min_sample_ns=min_sample_ns)
+        print(f"{name:<40} median {results[name]['median_ns'] / 1e3:12.2f} us  "
+              f"p90 {results[name]['p90_ns'] / 1e3:12.2f} us  "
+              f"peak alloc {results[name]['alloc_peak_bytes_per_call'] / 1024:10.1f} KiB")
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "warmup": warmup,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def save(document, path=None):
+    """Write a results document as JSON and return the path written to."""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"hot_paths-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+
+def compare(baseline, current):
+    """Return {case: current median / baseline median} for the cases present in both documents."""
+    ratios = {}
+    for name, result in current["results"].items():
+        if name in baseline["results"]:
+            ratios[name] = result["median_ns"] / baseline["results"][name]["median_ns"]
+    return ratios
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the simulation hot paths.")
+    parser.add_argument("--only", nargs="+", choices=list(CASES), help="Run only these cases.")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--min-sample-ms", type=float, default=2.0)
+    parser.add_argument("--output", help="Path of the JSON results file (default: Benchmarks/results/).")
+    parser.add_argument("--compare", help="Baseline JSON results file to compare against.")
+    args = parser.parse_args(argv)
+
+    document = run(args.only, warmup=args.warmup, repeat=args.repeat, min_sample_ns=int(args.min_sample_ms * 1e6))
+    path = save(document, args.output)
+    print(f"Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        for name, ratio in compare(baseline, document).items():
+            print(f"{name:<40} {ratio:6.2f}x baseline median")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Import-time budget check.
+
+Each module is imported in a fresh interpreter so nothing is shared through sys.modules,
+and the wall time of the import is compared against a budget. Worker processes (scenario
+runs, process pools) pay this cost on every start, so importing a module must not run
+simulations, open connections or load libraries the module does not need yet.
+
+Usage (from the repository root):
+    python -m Benchmarks.import_time
+    python -m Benchmarks.import_time --budget-ms 500 State.CentralizedState
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Default budget per module in milliseconds, on top of the bare interpreter start-up
+DEFAULT_BUDGET_MS = 750
+
+MODULES = [
+    "State.CentralizedState",
+    "State.TimeSeriesStore",
+    "State.EnsembleKalmanFilter",
+    "Sensors.IoTSensors",
+    "Sensors.PublishingPolicy",
+    "Sensors.StreamRecorder",
+    "Sensors.Ingestion",
+    "Sensors.MQTTManager",
+    "Monitoring.TickProfiler",
+    "Controllers.OptimalDispatch",
+    "Controllers.ModelPredictiveDispatch",
+    "Controllers.PararealDriver",
+    "SimulationData.compute_energy_difference",
+    "SimulationData.EnergyStats",
+    "Units.Batteries.Model.TeslaMegapack",
+    "Units.Batteries.Model.MegapackFleet",
+    "Units.Batteries.Model.Degradation",
+    "Units.SolarFarmAndHouses.SolarFarmHouses",
+    "Units.SolarFarmAndHouses.TimeIndex",
+    "Units.Storage.Container",
+    "Units.PEMHydrogenGenerator.Models.ActivationOverpotential",
+    "Units.PEMHydrogenGenerator.Models.ButlerVolmer",
+    "Units.PEMHydrogenGenerator.Models.Electrochemical",
+    "Units.PEMHydrogenGenerator.Models.HeatExergy",
+    "Units.PEMHydrogenGenerator.Models.MembraneWaterTransport",
+    "Units.PEMHydrogenGenerator.Models.OhmicOverpotential",
+    "Units.PEMHydrogenGenerator.Models.OperatingPoint",
+    "Units.PEMHydrogenGenerator.Models.PolarizationSurrogate",
+    "Units.PEMHydrogenGenerator.Efficiency.Efficiency",
+    "Units.PEMHydrogenGenerator.Efficiency.Exergy",
+    "Units.PEMHydrogenGenerator.Efficiency.FlowRates",
+    "Units.PEMHydrogenGenerator.Thermodynamics.HeatExchangerThermodynamics",
+    "Units.PEMHydrogenGenerator.run",
+    "Units.PEMFuelCell.Models.ReferenceEnvironment",
+    "Units.PEMFuelCell.Controller.Controller",
+    "Units.Compressor.Models.Compressor",
+    "Units.Compressor.Models.liquid_density_effects",
+    "Units.Compressor.Models.LiquidPistonVOF",
+    "Units.Compressor.Models.turbulent_kinetic_energy",
+    "Controllers.PEMHydrogenGeneratorController",
+    "Controllers.SimulationController",
+    "Controllers.TickScheduler",
+]
+
+# Libraries that should only be loaded once a module actually uses them
+HEAVY_MODULES = ["sympy", "pandas", "matplotlib", "seaborn", "pendulum"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+# Modules registered through Utils.lazy_import stay a _LazyModule until first attribute access
+loaded = [m for m in {heavy!r} if m in sys.modules and type(sys.modules[m]).__name__ != "_LazyModule"]
+print(json.dumps({{"seconds": elapsed, "heavy": loaded}}))
+"""
+
+
+def measure_import(module, repeat=3):
+    """Return (best import time in seconds, heavy libraries loaded) for a module in a fresh interpreter."""
+    best = None
+    heavy = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                   cwd=REPO_ROOT, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{completed.stderr.strip()}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best:
+            best = result["seconds"]
+        heavy = result["heavy"]
+    return best, heavy
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check module import times against a budget.")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for module in args.modules:
+        try:
+            seconds, heavy = measure_import(module, args.repeat)
+        except RuntimeError as e:
+            print(f"ERROR {module}: {e}")
+            failures += 1
+            continue
+        over_budget = seconds * 1e3 > args.budget_ms
+        failures += over_budget
+        heavy_note = f"  loads {', '.join(heavy)}" if heavy else ""
+        print(f"{'OVER ' if over_budget else 'ok   '}{module:<70} {seconds * 1e3:8.1f} ms{heavy_note}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Rolling-horizon (model-predictive) dispatch of the battery and electrolyzer.
+
+Every hour the dispatch LP of OptimalDispatch is solved over a short look-ahead window of the
+supply and demand forecasts (by default the SolarFarm/Houses profiles themselves), and only the
+first hour of the schedule is applied.
+
+Consecutive windows share everything but the right-hand side: the balance rows take the new
+demand - supply window, the first battery row and the terminal storage bound take the current
+stored energy. The LP is therefore built once in a persistent HiGHS instance and only those
+bounds are changed per hour; HiGHS keeps the optimal basis of the previous window and hot-starts
+the dual simplex from it, which takes a few dozen iterations instead of a solve from scratch.
+
+HiGHS is taken from highspy when it is installed, otherwise from the copy bundled with scipy
+(a private module whose API may change). Without either, or if the persistent model cannot be
+built or run, every window is solved from scratch through scipy.optimize.linprog.
+"""
+import copy
+import logging
+import time
+import unittest
+
+import numpy as np
+
+from Controllers.OptimalDispatch import VARIABLES, STORED, DispatchNotSolvedError, DispatchParameters, DispatchPlan, \
+    OptimalDispatch
+
+try:
+    from highspy import Highs as _Highs, HighsLp, MatrixFormat
+except ImportError:
+    try:
+        # Bindings bundled with scipy >= 1.15
+        from scipy.optimize._highspy._core import _Highs, HighsLp, MatrixFormat
+    except ImportError:
+        _Highs = None
+
+
+class ModelPredictiveDispatch:
+    """
+    Receding-horizon dispatch controller.
+
+    Parameters:
+    - params: DispatchParameters; initial_stored_mwh is replaced by the stored energy of each solve.
+    - horizon: Look-ahead window in time steps (e.g. 24-48 hours).
+    - time_step_h: Length of a time step in hours.
+    - warm_start: Keep a persistent HiGHS model (if available) instead of solving each window from scratch.
+    """
+
+    def __init__(self, params: DispatchParameters, horizon=48, time_step_h=1.0, warm_start=True):
+        self.params = copy.copy(params)
+        self.horizon = horizon
+        self.problem = OptimalDispatch(horizon, time_step_h)
+        self.solves = 0
+        self.solve_time_s = 0.0
+        self.max_solve_time_s = 0.0
+        self.simplex_iterations = 0
+        self._highs = None
+        if warm_start and _Highs is not None:
+            try:
+                self._highs = self._build_highs()
+            except Exception as e:
+                logging.warning(f"Persistent HiGHS model unavailable, solving every window with linprog: {e!r}")
+
+    def _build_highs(self):
+        params = self.params
+        matrix = self.problem.matrix(params.charge_efficiency, params.discharge_efficiency).tocsc()
+        bounds = self.problem.bounds(params)
+        highs = _Highs()
+        highs.setOptionValue("output_flag", False)
+        infinity = highs.getInfinity()
+
+        lp = HighsLp()
+        lp.num_col_ = matrix.shape[1]
+        lp.num_row_ = matrix.shape[0]
+        lp.col_cost_ = self.problem.costs(params)
+        lp.col_lower_ = bounds[:, 0]
+        lp.col_upper_ = np.where(np.isinf(bounds[:, 1]), infinity, bounds[:, 1])
+        # Placeholder right-hand side; every solve sets the real one
+        lp.row_lower_ = lp.row_upper_ = np.zeros(matrix.shape[0])
+        lp.a_matrix_.format_ = MatrixFormat.kColwise
+        lp.a_matrix_.num_col_ = matrix.shape[1]
+        lp.a_matrix_.num_row_ = matrix.shape[0]
+        lp.a_matrix_.start_ = matrix.indptr
+        lp.a_matrix_.index_ = matrix.indices
+        lp.a_matrix_.value_ = matrix.data
+        highs.passModel(lp)
+        return highs
+
+    def plan(self, supply_window_mwh, demand_window_mwh, stored_mwh):
+        """
+        Solve one window starting from stored_mwh.
+
+        Returns:
+        - DispatchPlan over the horizon; its first step is the decision for the current hour.
+
+        Raises:
+        - DispatchNotSolvedError: If the window LP is not solved to optimality.
+        """
+        start = time.perf_counter()
+        params = self.params
+        params.initial_stored_mwh = stored_mwh
+        plan = None
+        if self._highs is not None:
+            try:
+                plan = self._solve_highs(supply_window_mwh, demand_window_mwh, stored_mwh)
+            except DispatchNotSolvedError:
+                raise
+            except Exception as e:
+                logging.warning(f"Persistent HiGHS model failed, solving every window with linprog: {e!r}")
+                self._highs = None
+        if plan is None:
+            plan = self.problem.solve(supply_window_mwh, demand_window_mwh, params)
+        elapsed = time.perf_counter() - start
+        plan.solve_time_s = elapsed
+        self.solves += 1
+        self.solve_time_s += elapsed
+        self.max_solve_time_s = max(self.max_solve_time_s, elapsed)
+        return plan
+
+    def _solve_highs(self, supply_window_mwh, demand_window_mwh, stored_mwh):
+        params = self.params
+        highs = self._highs
+        rhs = self.problem.rhs(supply_window_mwh, demand_window_mwh, params)
+        # Balance rows and the first battery row; the other battery rows are always 0
+        for row in range(self.horizon + 1):
+            highs.changeRowBounds(row, rhs[row], rhs[row])
+        if params.terminal_storage:
+            terminal = self.problem.column(STORED, self.horizon - 1)
+            highs.changeColBounds(terminal, min(stored_mwh, params.capacity_mwh), params.capacity_mwh)
+        highs.run()
+        status = highs.getModelStatus()
+        if highs.modelStatusToString(status) != "Optimal":
+            raise DispatchNotSolvedError(f"Dispatch window not solved: {highs.modelStatusToString(status)}")
+        self.simplex_iterations += highs.getInfo().simplex_iteration_count
+        return DispatchPlan(np.asarray(highs.getSolution().col_value), self.horizon, highs.getObjectiveValue(),
+                            0, "Optimal", 0.0)
+
+    def windows(self, supply_mwh, demand_mwh, t):
+        """Forecast windows starting at row t; the profiles wrap around like the simulation time index."""
+        rows = np.arange(t, t + self.horizon)
+        return np.take(supply_mwh, rows, mode="wrap"), np.take(demand_mwh, rows, mode="wrap")
+
+    def decide(self, supply_mwh, demand_mwh, t, stored_mwh):
+        """Decision for row t: dict of charge, discharge, electrolyzer, curtailment, unmet and stored (MWh)."""
+        plan = self.plan(*self.windows(supply_mwh, demand_mwh, t), stored_mwh)
+        return {name: float(schedule[0]) for name, schedule in
+                zip(VARIABLES, (plan.charge, plan.discharge, plan.electrolyzer, plan.curtailment, plan.unmet,
+                                plan.stored))}
+
+    def replay(self, supply_mwh, demand_mwh, hours=None):
+        """
+        Replay the controller over a profile with perfect forecasts, applying the first step of each window.
+
+        Returns:
+        - DispatchPlan of the applied decisions.
+        """
+        hours = len(supply_mwh) if hours is None else hours
+        applied = np.zeros((len(VARIABLES), hours))
+        stored = self.params.initial_stored_mwh
+        start = time.perf_counter()
+        for t in range(hours):
+            decision = self.decide(supply_mwh, demand_mwh, t, stored)
+            applied[:, t] = [decision[name] for name in VARIABLES]
+            stored = decision["stored"]
+        elapsed = time.perf_counter() - start
+        logging.info(f"MPC replay of {hours} steps: {elapsed:.2f} s, {1e3 * elapsed / max(hours, 1):.2f} ms per step")
+        costs = self.problem.costs(self.params).reshape(len(VARIABLES), -1)[:, 0]
+        return DispatchPlan(applied.ravel(), hours, float(costs @ applied.sum(axis=1)), 0, "Replayed", elapsed)
+
+    def stats(self):
+        return {"solves": self.solves, "warm_start": self._highs is not None,
+                "mean_solve_ms": 1e3 * self.solve_time_s / self.solves if self.solves else 0.0,
+                "max_solve_ms": 1e3 * self.max_solve_time_s,
+                "mean_simplex_iterations": self.simplex_iterations / self.solves if self.solves else 0.0}
+
+
+# Test Suite
+class TestModelPredictiveDispatch(unittest.TestCase):
+    PARAMS = DispatchParameters(capacity_mwh=10.0, max_charge_rate_mw=4.0, max_discharge_rate_mw=4.0,
+                                electrolyzer_rating_mw=2.0, charge_efficiency=0.95, discharge_efficiency=0.95)
+
+    @staticmethod
+    def _profiles(hours=60):
+        rng = np.random.default_rng(0)
+        solar = np.clip(np.sin(np.arange(hours) * 2 * np.pi / 24), 0.0, None)
+        return 8.0 * solar * rng.uniform(0.5, 1.0, hours), rng.uniform(1.0, 3.0, hours)
+
+    @unittest.skipIf(_Highs is None, "No HiGHS bindings")
+    def test_persistent_highs_matches_linprog(self):
+        supply, demand = self._profiles()
+        warm = ModelPredictiveDispatch(self.PARAMS, horizon=24)
+        cold = ModelPredictiveDispatch(self.PARAMS, horizon=24, warm_start=False)
+        self.assertIsNotNone(warm._highs)
+        stored = 0.0
+        for t in range(36):
+            windows = warm.windows(supply, demand, t)
+            warm_plan = warm.plan(*windows, stored)
+            cold_plan = cold.plan(*windows, stored)
+            self.assertAlmostEqual(warm_plan.objective, cold_plan.objective, delta=1e-8)
+            stored = warm_plan.stored[0]
+        self.assertTrue(warm.stats()["warm_start"])
+
+    def test_falls_back_to_linprog_when_highs_fails(self):
+        class BrokenHighs:
+            def changeRowBounds(self, *args):
+                raise RuntimeError("binding changed")
+
+        supply, demand = self._profiles()
+        mpc = ModelPredictiveDispatch(self.PARAMS, horizon=24, warm_start=False)
+        mpc._highs = BrokenHighs()
+        plan = mpc.plan(*mpc.windows(supply, demand, 0), 0.0)
+        self.assertIsNone(mpc._highs)
+        reference = OptimalDispatch(24).solve(*mpc.windows(supply, demand, 0), copy.copy(self.PARAMS))
+        self.assertAlmostEqual(plan.objective, reference.objective, places=8)
+        self.assertFalse(mpc.stats()["warm_start"])
+
+    def test_window_not_solved_is_raised_not_retried(self):
+        class InfeasibleHighs:
+            def changeRowBounds(self, *args):
+                pass
+
+            changeColBounds = changeRowBounds
+
+            def run(self):
+                pass
+
+            def getModelStatus(self):
+                return 8
+
+            def modelStatusToString(self, status):
+                return "Infeasible"
+
+        supply, demand = self._profiles()
+        mpc = ModelPredictiveDispatch(self.PARAMS, horizon=24, warm_start=False)
+        mpc._highs = highs = InfeasibleHighs()
+        with self.assertRaises(DispatchNotSolvedError):
+            mpc.plan(*mpc.windows(supply, demand, 0), 0.0)
+        self.assertIs(mpc._highs, highs)
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,271 @@
+"""
+Perfect-foresight dispatch of the battery and electrolyzer as a sparse linear program.
+
+For every hour t of the horizon the LP has six variables (MWh per time step):
+    charge c_t, discharge d_t, electrolyzer e_t, curtailment k_t, unmet demand u_t, stored energy s_t
+and two equality constraints:
+    demand balance   d_t + u_t - c_t - e_t - k_t = demand_t - supply_t
+    battery energy   s_t - s_{t-1} - eta_c c_t + d_t / eta_d = 0          (s_{-1} = initial stored energy)
+The rates, the electrolyzer rating and the battery capacity are variable bounds. The objective
+penalizes unmet demand and curtailment, rewards electrolyzer energy and charges a cycling cost.
+Charging and discharging c and eta_c eta_d c in the same hour leaves the stored energy unchanged
+and burns c (1 - eta_c eta_d) of surplus, so the cycling cost per MWh is raised by
+curtailment_penalty (1 - eta_c eta_d) / (1 + eta_c eta_d): burning surplus in the battery then
+always costs more than curtailing it, and the battery is never charged and discharged in the same hour.
+
+The constraint matrix only depends on the horizon and the battery efficiencies. It is assembled
+with vectorized index arithmetic and cached, so solving another scenario or another window of
+the same length only rebuilds the right-hand side, the bounds and the cost vector. The LP is
+solved with scipy's HiGHS interface.
+"""
+import logging
+import time
+import unittest
+
+import numpy as np
+from scipy.optimize import linprog
+from scipy.sparse import csc_matrix
+
+class DispatchNotSolvedError(RuntimeError):
+    """The dispatch LP has no optimal solution (e.g. it is infeasible)."""
+
+
+VARIABLES = ("charge", "discharge", "electrolyzer", "curtailment", "unmet", "stored")
+CHARGE, DISCHARGE, ELECTROLYZER, CURTAILMENT, UNMET, STORED = range(len(VARIABLES))
+
+
+class DispatchParameters:
+    """
+    Battery, electrolyzer and cost parameters of the dispatch LP.
+
+    Parameters:
+    - capacity_mwh: Usable battery capacity.
+    - max_charge_rate_mw / max_discharge_rate_mw: Grid-side battery power limits.
+    - electrolyzer_rating_mw: Electrolyzer power limit.
+    - charge_efficiency / discharge_efficiency: One-way battery efficiencies.
+    - initial_stored_mwh: Stored energy at the start of the horizon.
+    - unmet_penalty / curtailment_penalty: Cost per MWh of unmet demand and of curtailed supply.
+    - electrolyzer_value: Value per MWh fed to the electrolyzer.
+    - cycling_cost: Cost per MWh charged or discharged, on top of the loss term that keeps simultaneous
+      charging and discharging dearer than curtailment.
+    - terminal_storage: If True, the battery must end the horizon with at least the initial stored energy.
+    """
+
+    def __init__(self, capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw, electrolyzer_rating_mw,
+                 charge_efficiency=1.0, discharge_efficiency=1.0, initial_stored_mwh=0.0, unmet_penalty=1000.0,
+                 curtailment_penalty=1.0, electrolyzer_value=10.0, cycling_cost=0.01, terminal_storage=True):
+        self.capacity_mwh = capacity_mwh
+        self.max_charge_rate_mw = max_charge_rate_mw
+        self.max_discharge_rate_mw = max_discharge_rate_mw
+        self.electrolyzer_rating_mw = electrolyzer_rating_mw
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+        self.initial_stored_mwh = initial_stored_mwh
+        self.unmet_penalty = unmet_penalty
+        self.curtailment_penalty = curtailment_penalty
+        self.electrolyzer_value = electrolyzer_value
+        self.cycling_cost = cycling_cost
+        self.terminal_storage = terminal_storage
+
+    @classmethod
+    def from_battery(cls, battery, electrolyzer_rating_mw, **kwargs):
+        """
+        Take capacity, rates, efficiencies and stored energy from a TeslaMegapack or TeslaMegapackFleet.
+
+        Fleet rates are summed and efficiencies averaged; a TeslaMegapack is lossless.
+        """
+        return cls(capacity_mwh=float(np.sum(battery.capacity_mwh)),
+                   max_charge_rate_mw=float(np.sum(battery.max_charge_rate_mw)),
+                   max_discharge_rate_mw=float(np.sum(battery.max_discharge_rate_mw)),
+                   electrolyzer_rating_mw=electrolyzer_rating_mw,
+                   charge_efficiency=float(np.mean(getattr(battery, "charge_efficiency", 1.0))),
+                   discharge_efficiency=float(np.mean(getattr(battery, "discharge_efficiency", 1.0))),
+                   initial_stored_mwh=battery.get_stored_energy(), **kwargs)
+
+
+class DispatchPlan:
+    """Hourly schedule returned by OptimalDispatch.solve; each schedule is an array in MWh per time step."""
+
+    def __init__(self, x, hours, objective, status, message, solve_time_s):
+        schedules = np.maximum(x.reshape(len(VARIABLES), hours), 0.0)
+        self.charge, self.discharge, self.electrolyzer, self.curtailment, self.unmet, self.stored = schedules
+        self.hours = hours
+        self.objective = objective
+        self.status = status
+        self.message = message
+        self.solve_time_s = solve_time_s
+
+    def kpis(self):
+        return {
+            "hours": self.hours,
+            "unmet_demand_mwh": float(self.unmet.sum()),
+            "unmet_hours": int(np.count_nonzero(self.unmet > 1e-9)),
+            "curtailment_mwh": float(self.curtailment.sum()),
+            "electrolyzer_energy_mwh": float(self.electrolyzer.sum()),
+            "battery_charged_mwh": float(self.charge.sum()),
+            "battery_discharged_mwh": float(self.discharge.sum()),
+            "final_stored_energy_mwh": float(self.stored[-1]) if self.hours else 0.0,
+        }
+
+
+class OptimalDispatch:
+    """
+    Sparse dispatch LP over a fixed number of time steps.
+
+    Parameters:
+    - hours: Number of time steps in the horizon.
+    - time_step_h: Length of a time step in hours (rates are multiplied by it).
+    """
+
+    def __init__(self, hours, time_step_h=1.0):
+        if hours < 1:
+            raise ValueError("The dispatch horizon needs at least one time step.")
+        self.hours = hours
+        self.time_step_h = time_step_h
+        self.n_variables = len(VARIABLES) * hours
+        self._assemble_structure()
+        self._matrix = None
+        self._matrix_efficiencies = None
+
+    def column(self, variable, t):
+        """Index of a variable at time step t in the LP vector."""
+        return variable * self.hours + t
+
+    def _assemble_structure(self):
+        T = self.hours
+        t = np.arange(T)
+        ones = np.ones(T)
+        # Demand balance rows 0..T-1: + discharge + unmet - charge - electrolyzer - curtailment
+        balance_rows = np.tile(t, 5)
+        balance_cols = np.concatenate([self.column(v, t) for v in (DISCHARGE, UNMET, CHARGE, ELECTROLYZER, CURTAILMENT)])
+        balance_data = np.concatenate([ones, ones, -ones, -ones, -ones])
+        # Battery rows T..2T-1: s_t - s_{t-1} - eta_c c_t + d_t / eta_d
+        storage_rows = np.concatenate([T + t, T + t[1:], T + t, T + t])
+        storage_cols = np.concatenate([self.column(STORED, t), self.column(STORED, t[:-1]), self.column(CHARGE, t),
+                                       self.column(DISCHARGE, t)])
+        self._rows = np.concatenate([balance_rows, storage_rows])
+        self._cols = np.concatenate([balance_cols, storage_cols])
+        # The -eta_c and 1 / eta_d entries come last and are filled in by matrix()
+        self._fixed_data = np.concatenate([balance_data, ones, -ones[1:]])
+
+    def matrix(self, charge_efficiency, discharge_efficiency):
+        """Equality constraint matrix; rebuilt only when the efficiencies change."""
+        efficiencies = (charge_efficiency, discharge_efficiency)
+        if self._matrix is None or efficiencies != self._matrix_efficiencies:
+            data = np.concatenate([self._fixed_data, np.full(self.hours, -charge_efficiency),
+                                   np.full(self.hours, 1.0 / discharge_efficiency)])
+            self._matrix = csc_matrix((data, (self._rows, self._cols)), shape=(2 * self.hours, self.n_variables))
+            self._matrix_efficiencies = efficiencies
+        return self._matrix
+
+    def bounds(self, params: DispatchParameters):
+        T = self.hours
+        dt = self.time_step_h
+        upper = np.empty(self.n_variables)
+        upper[self.column(CHARGE, 0):self.column(CHARGE, T)] = params.max_charge_rate_mw * dt
+        upper[self.column(DISCHARGE, 0):self.column(DISCHARGE, T)] = params.max_discharge_rate_mw * dt
+        upper[self.column(ELECTROLYZER, 0):self.column(ELECTROLYZER, T)] = params.electrolyzer_rating_mw * dt
+        upper[self.column(CURTAILMENT, 0):self.column(UNMET, T)] = np.inf
+        upper[self.column(STORED, 0):] = params.capacity_mwh
+        lower = np.zeros(self.n_variables)
+        if params.terminal_storage:
+            lower[self.column(STORED, T - 1)] = min(params.initial_stored_mwh, params.capacity_mwh)
+        return np.column_stack([lower, upper])
+
+    def costs(self, params: DispatchParameters):
+        round_trip = params.charge_efficiency * params.discharge_efficiency
+        cycling = params.cycling_cost + params.curtailment_penalty * (1 - round_trip) / (1 + round_trip)
+        per_variable = np.array([cycling, cycling, -params.electrolyzer_value,
+                                 params.curtailment_penalty, params.unmet_penalty, 0.0])
+        return np.repeat(per_variable, self.hours)
+
+    def rhs(self, supply_mwh, demand_mwh, params: DispatchParameters):
+        b = np.zeros(2 * self.hours)
+        b[:self.hours] = np.asarray(demand_mwh, dtype=np.float64) - np.asarray(supply_mwh, dtype=np.float64)
+        b[self.hours] = params.initial_stored_mwh
+        return b
+
+    def solve(self, supply_mwh, demand_mwh, params: DispatchParameters):
+        """
+        Solve the dispatch for one supply/demand window.
+
+        Parameters:
+        - supply_mwh / demand_mwh: Energy per time step over the horizon (MWh).
+        - params: DispatchParameters.
+
+        Returns:
+        - DispatchPlan.
+
+        Raises:
+        - ValueError: If the profiles do not match the horizon.
+        - DispatchNotSolvedError: If HiGHS does not return an optimal solution.
+        """
+        if len(supply_mwh) != self.hours or len(demand_mwh) != self.hours:
+            raise ValueError(f"Expected profiles of {self.hours} time steps, got {len(supply_mwh)} and "
+                             f"{len(demand_mwh)}.")
+        start = time.perf_counter()
+        result = linprog(self.costs(params), A_eq=self.matrix(params.charge_efficiency, params.discharge_efficiency),
+                         b_eq=self.rhs(supply_mwh, demand_mwh, params), bounds=self.bounds(params), method="highs")
+        elapsed = time.perf_counter() - start
+        if result.status != 0:
+            raise DispatchNotSolvedError(f"Dispatch LP not solved: {result.message}")
+        logging.debug(f"Dispatch LP over {self.hours} steps solved in {elapsed:.3f} s")
+        return DispatchPlan(result.x, self.hours, result.fun, result.status, result.message, elapsed)
+
+
+# Test Suite
+class TestOptimalDispatch(unittest.TestCase):
+    SUPPLY = [5.0, 0.0, 3.0]
+    DEMAND = [1.0, 4.0, 1.0]
+
+    def _check_plan(self, plan, params):
+        supply, demand = np.array(self.SUPPLY), np.array(self.DEMAND)
+        np.testing.assert_allclose(supply + plan.discharge + plan.unmet,
+                                   demand + plan.charge + plan.electrolyzer + plan.curtailment, atol=1e-9)
+        stored = params.initial_stored_mwh + np.cumsum(params.charge_efficiency * plan.charge
+                                                       - plan.discharge / params.discharge_efficiency)
+        np.testing.assert_allclose(plan.stored, stored, atol=1e-9)
+        self.assertTrue(np.all(plan.stored >= -1e-9) and np.all(plan.stored <= params.capacity_mwh + 1e-9))
+        self.assertTrue(np.all(plan.charge <= params.max_charge_rate_mw + 1e-9))
+        self.assertTrue(np.all(plan.discharge <= params.max_discharge_rate_mw + 1e-9))
+        self.assertTrue(np.all(plan.electrolyzer <= params.electrolyzer_rating_mw + 1e-9))
+
+    def test_surplus_deficit_surplus(self):
+        params = DispatchParameters(capacity_mwh=3.0, max_charge_rate_mw=4.0, max_discharge_rate_mw=4.0,
+                                    electrolyzer_rating_mw=1.0)
+        plan = OptimalDispatch(3).solve(self.SUPPLY, self.DEMAND, params)
+        self._check_plan(plan, params)
+        # Fill the battery and the electrolyzer, empty the battery into the deficit, then store what is left
+        np.testing.assert_allclose(plan.charge, [3.0, 0.0, 1.0], atol=1e-9)
+        np.testing.assert_allclose(plan.discharge, [0.0, 3.0, 0.0], atol=1e-9)
+        np.testing.assert_allclose(plan.electrolyzer, [1.0, 0.0, 1.0], atol=1e-9)
+        np.testing.assert_allclose(plan.unmet, [0.0, 1.0, 0.0], atol=1e-9)
+        np.testing.assert_allclose(plan.curtailment, 0.0, atol=1e-9)
+        np.testing.assert_allclose(plan.stored, [3.0, 0.0, 1.0], atol=1e-9)
+        self.assertAlmostEqual(plan.objective, 1000.0 - 20.0 + 0.07)
+        self.assertEqual(plan.kpis()["unmet_hours"], 1)
+
+    def test_losses_shift_energy_from_the_electrolyzer_to_the_battery(self):
+        params = DispatchParameters(capacity_mwh=3.0, max_charge_rate_mw=4.0, max_discharge_rate_mw=4.0,
+                                    electrolyzer_rating_mw=1.0, charge_efficiency=0.9, discharge_efficiency=0.9)
+        plan = OptimalDispatch(3).solve(self.SUPPLY, self.DEMAND, params)
+        self._check_plan(plan, params)
+        # Unmet demand costs more than electrolyzer energy is worth, so the battery is filled first
+        self.assertAlmostEqual(plan.charge[0], 3.0 / 0.9)
+        self.assertAlmostEqual(plan.electrolyzer[0], 4.0 - 3.0 / 0.9)
+        self.assertAlmostEqual(plan.discharge[1], 3.0 * 0.9)
+        self.assertAlmostEqual(plan.unmet[1], 4.0 - 3.0 * 0.9)
+
+    def test_lossy_surplus_is_curtailed_not_cycled(self):
+        params = DispatchParameters(capacity_mwh=3.0, max_charge_rate_mw=4.0, max_discharge_rate_mw=4.0,
+                                    electrolyzer_rating_mw=1.0, charge_efficiency=0.9, discharge_efficiency=0.9,
+                                    initial_stored_mwh=3.0)
+        plan = OptimalDispatch(4).solve([10.0] * 4, [1.0] * 4, params)
+        np.testing.assert_allclose(np.minimum(plan.charge, plan.discharge), 0.0, atol=1e-9)
+        np.testing.assert_allclose(plan.curtailment, 8.0, atol=1e-9)
+        np.testing.assert_allclose(plan.electrolyzer, 1.0, atol=1e-9)
+        np.testing.assert_allclose(plan.stored, 3.0, atol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
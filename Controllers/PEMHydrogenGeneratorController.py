@@ -1,7 +1,14 @@
 import json
+import math
+import os
 import time
 import simpy
+from Monitoring.TickProfiler import TickProfiler, SamplingProfiler
+from State.Checkpoint import CheckpointManager
+from Sensors.Ingestion import SensorIngestor
 from Sensors.MQTTManager import MQTTManager
+from Sensors.PublishingPolicy import DeadbandPolicy
+from Sensors.StreamRecorder import StreamRecorder
 from Sensors.IoTSensors import (
     TemperatureSensor,
     ElectricChargeSensor,
@@ -12,13 +19,17 @@ from Sensors.IoTSensors import (
     ResistanceSensor
 )
 from State.CentralizedState import CentralizedState
+from State.TimeSeriesStore import TimeSeriesStore
 from Units.PEMHydrogenGenerator.Efficiency.Efficiency import H2GeneratorEfficiencyParameters, H2GeneratorEfficiency
 from Units.PEMHydrogenGenerator.Efficiency.Exergy import ExergyParameters, ExergyCalculator
 from Units.PEMHydrogenGenerator.Efficiency.FlowRates import H2GeneratorFlowRatesParameters, H2GeneratorFlowRates
 from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters, ActivationOverpotential
 from Units.PEMHydrogenGenerator.Models.Electrochemical import PEMParametersElectrochemical, PEMElectrochemicalModel
 from Units.PEMHydrogenGenerator.Models.HeatExergy import PEMHeatExergyParameters, PEMHeatExergyCalculator
+from Units.PEMHydrogenGenerator.Models.MembraneWaterTransport import MembraneWaterTransportParameters, \
+    MembraneWaterTransport
 from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import PEMParametersOhmic, PEMOhmicOverpotentialModel
+from Units.PEMHydrogenGenerator.Models.OperatingPoint import PEMOperatingPointParameters, PEMOperatingPointSolver
 from Units.PEMHydrogenGenerator.Thermodynamics.HeatExchangerThermodynamics import HeatExchangerParameters, \
     HeatExchangerThermodynamics
 
@@ -52,37 +63,63 @@ DEVICE_CONNECTION_STRINGS ={
 }
 
 class PEMHydrogenGeneratorController:
-    def __init__(self, env: simpy.Environment, time_step=TIME_STEP):
+    INITIAL_STATE = {
+        'T': 300,
+        'N_H2_out_dot': 5,
+        'Q_electric': 10,
+        'J': 10,
+        'N_H2O_in': 20,
+        'V': 1.5,
+        'lambda_a': 20,
+        'lambda_c': 10,
+        'L': 0.01,
+        'alpha': 0.5,
+        'eta_act': 0.1,
+        'J0': 1e-3,
+        'x': 0.001
+    }
+
+    def __init__(self, env: simpy.Environment, time_step=TIME_STEP, mqtt_manager=None, real_time=True,
+                 profiler=None, n_cells=200, cell_area=1.0, J_max=20000, sensor_history=None,
+                 publishing_policies=None, sensor_recorder=None, state_estimator=None,
+                 membrane_transport=None):
         self.env = env
         self.time_step = time_step  # Initialize the time_step
+        self.real_time = real_time  # Sleep for time_step seconds per tick when driving live hardware
+        self.profiler = profiler if profiler is not None else TickProfiler()  # Disabled unless one is passed in
+
+        central_state = CentralizedState(initial_values=dict(self.INITIAL_STATE))
+
+        # Instantiate MQTTManager, unless one is injected (e.g. an offline stub for benchmarks).
+        # Subscribed sensor messages are applied to the state by a background ingestor.
+        # A TimeSeriesStore passed as sensor_history records the received and published readings;
+        # a StreamRecorder passed as sensor_recorder logs the received messages for offline replay;
+        # an EnsembleKalmanFilter passed as state_estimator assimilates them and its estimates are written
+        # back into the state at every tick.
+        self.sensor_history = sensor_history
+        self.state_estimator = state_estimator
+        self.sensor_ingestor = None
+        if mqtt_manager is None:
+            self.sensor_ingestor = SensorIngestor(central_state, history=sensor_history, estimator=state_estimator)
+            self.sensor_ingestor.start()
+            mqtt_manager = MQTTManager(ingestor=self.sensor_ingestor, history=sensor_history, recorder=sensor_recorder)
+        self.mqtt_manager = mqtt_manager
 
-        central_state = CentralizedState(initial_values={
-            'T': 300,
-            'N_H2_out_dot': 5,
-            'Q_electric': 10,
-            'J': 10,
-            'N_H2O_in': 20,
-            'V': 1.5,
-            'lambda_a': 20,
-            'lambda_c': 10,
-            'L': 0.01,
-            'alpha': 0.5,
-            'eta_act': 0.1,
-            'J0': 1e-3,
-            'x': 0.001
-        })
-
-        # Instantiate MQTTManager
-        self.mqtt_manager = MQTTManager()
-
-        # Instantiate Sensor Objects
-        self.temperature_sensor = TemperatureSensor(central_state, self.mqtt_manager)
-        self.electric_charge_sensor = ElectricChargeSensor(central_state, self.mqtt_manager)
-        self.current_density_sensor = CurrentDensitySensor(central_state, self.mqtt_manager)
-        self.voltage_sensor = VoltageSensor(central_state, self.mqtt_manager)
-        self.hydrogen_output_flow_sensor = HydrogenOutputFlowSensor(central_state, self.mqtt_manager)
-        self.water_input_flow_sensor = WaterInputFlowSensor(central_state, self.mqtt_manager)
-        self.resistance_sensor = ResistanceSensor(central_state, self.mqtt_manager)
+        # Instantiate Sensor Objects; publishing_policies maps a state field (e.g. 'T') to its PublishPolicy
+        policies = publishing_policies or {}
+        self.temperature_sensor = TemperatureSensor(central_state, self.mqtt_manager, policy=policies.get('T'))
+        self.electric_charge_sensor = ElectricChargeSensor(central_state, self.mqtt_manager,
+                                                           policy=policies.get('Q_electric'))
+        self.current_density_sensor = CurrentDensitySensor(central_state, self.mqtt_manager, policy=policies.get('J'))
+        self.voltage_sensor = VoltageSensor(central_state, self.mqtt_manager, policy=policies.get('V'))
+        self.hydrogen_output_flow_sensor = HydrogenOutputFlowSensor(central_state, self.mqtt_manager,
+                                                                    policy=policies.get('N_H2_out_dot'))
+        self.water_input_flow_sensor = WaterInputFlowSensor(central_state, self.mqtt_manager,
+                                                            policy=policies.get('N_H2O_in'))
+        self.resistance_sensor = ResistanceSensor(central_state, self.mqtt_manager, policy=policies.get('R_PEM'))
+        self.sensors = [self.temperature_sensor, self.electric_charge_sensor, self.current_density_sensor,
+                        self.voltage_sensor, self.hydrogen_output_flow_sensor, self.water_input_flow_sensor,
+                        self.resistance_sensor]
 
 
 
@@ -108,63 +145,104 @@ class PEMHydrogenGeneratorController:
                                                E_act_c=80000)
         self.activation_overpotential = ActivationOverpotential()
 
-        electrochemical_params = PEMParametersElectrochemical(V0=1.23, eta_act_a=0.1, eta_act_c=0.1, eta_ohm=0.1,
-                                                              area=1.0)
+        self.electrochemical_params = PEMParametersElectrochemical(V0=1.23, eta_act_a=0.1, eta_act_c=0.1,
+                                                                   eta_ohm=0.1, area=1.0)
         self.electrochemical_model = PEMElectrochemicalModel()
 
         self.heat_exergy_params = PEMHeatExergyParameters(F=SHARED_F, eta_act_a=0.1, eta_act_c=0.1, eta_ohm=0.1,
                                                           Delta_S=10, T0=SHARED_T)
         self.heat_exergy_calculator = PEMHeatExergyCalculator()
 
-        ohmic_params = PEMParametersOhmic(T=SHARED_T, z=2, F=SHARED_F, R=SHARED_R)
+        self.ohmic_params = PEMParametersOhmic(T=SHARED_T, z=2, F=SHARED_F, R=SHARED_R)
         self.ohmic_model = PEMOhmicOverpotentialModel()
+        # A MembraneWaterTransport passed as membrane_transport is stepped every tick; its water content profile
+        # and resistance replace the linear lambda(x) and R_PEM in the state, so it must have the state's thickness
+        if membrane_transport is not None and not math.isclose(membrane_transport.params.L, central_state.L):
+            raise ValueError(f"membrane_transport has L = {membrane_transport.params.L} m, "
+                             f"but the state has L = {central_state.L} m")
+        self.membrane_transport = membrane_transport
+
+        # Stack layout for receive_energy; the solver is built on first use (it needs R_PEM)
+        self.n_cells = n_cells
+        self.cell_area = cell_area  # m^2 per cell
+        self.J_max = J_max  # A/m^2
+        self.operating_point_solver = None
+        self.operating_point = None
 
         heat_exchanger_params = HeatExchangerParameters(Q_max=100, F=SHARED_F, H_H2O_T=3000, H_H2O_T0=2000, T0=SHARED_T,
                                                         T_source=400, epsilon=0.8)
-        self.heat_exchanger = HeatExchangerThermodynamics(self.env, heat_exchanger_params, central_state, time_step)
+        # Updated from step(), so it does not need a process of its own
+        self.heat_exchanger = HeatExchangerThermodynamics(self.env, heat_exchanger_params, central_state, time_step,
+                                                          start_process=False)
 
-        self.received_energy_mj = 0
+        self.received_energy_mwh = 0
 
     def process(self):
         while True:
+            self.step()
+
+            if self.real_time:
+                time.sleep(self.time_step)  # introduce a real-time delay
+            yield self.env.timeout(self.time_step)
+
+    def step(self):
+        """Run a single tick: update each component and publish the sensor readings."""
+        profiler = self.profiler
+        with profiler.tick():
+            if self.state_estimator is not None and self.state_estimator.updates:
+                with profiler.span("state_estimation"):
+                    self.state_estimator.apply_to(self.efficiency_state)
+            if self.membrane_transport is not None:
+                with profiler.span("membrane_transport"):
+                    state = self.efficiency_state
+                    self.membrane_transport.step(self.time_step, state.J, state.T, state.lambda_a, state.lambda_c)
+                    self.membrane_transport.apply_to(state)
+                    self.operating_point_solver = None  # Rebuilt with the new R_PEM by receive_energy
+
             # Update each component at every time step
-            eta_act_a, eta_act_c, J_0_a, J_0_c = self.activation_overpotential.update(self.activation_params,
-                                                                                      self.efficiency_state)
-            entropy_gen, q_heat_pem, e_heat_pem = self.heat_exergy_calculator.update(self.heat_exergy_params,
-                                                                                     self.efficiency_state)
+            with profiler.span("activation_overpotential"):
+                eta_act_a, eta_act_c, J_0_a, J_0_c = self.activation_overpotential.update(self.activation_params,
+                                                                                          self.efficiency_state)
+            with profiler.span("heat_exergy"):
+                entropy_gen, q_heat_pem, e_heat_pem = self.heat_exergy_calculator.update(self.heat_exergy_params,
+                                                                                         self.efficiency_state)
 
-            self.exergy_calculator.update()
-            eta_en, eta_ex = self.efficiency_calculator.update(self.efficiency_params, self.efficiency_state)
-            Q, Q_theoretical, E_heat_H2O = self.heat_exchanger.update()
+            with profiler.span("exergy"):
+                self.exergy_calculator.update()
+            with profiler.span("efficiency"):
+                eta_en, eta_ex = self.efficiency_calculator.update(self.efficiency_params, self.efficiency_state)
+            with profiler.span("heat_exchanger"):
+                self.heat_exchanger.step()
+                Q, Q_theoretical, E_heat_H2O = (self.heat_exchanger.Q, self.heat_exchanger.Q_theoretical,
+                                                self.heat_exchanger.E_heat_H2O)
 
             # Update and publish flow rates
             try:
-                N_H2_out, N_O2_out, N_H2O_out = self.flow_rates_generator.update()
-                flow_data = {
-                    "N_H2_out": N_H2_out,
-                    "N_O2_out": N_O2_out,
-                    "N_H2O_out": N_H2O_out
-                }
-                print(flow_data)
-                # flow_value_json = json.dumps(flow_data)
-                # self.mqtt_client.publish("H2PEMHydrogenGenerator/FlowRates", flow_value_json)
-                self.log_status(eta_act_a, eta_act_c, J_0_a, J_0_c, entropy_gen, q_heat_pem, e_heat_pem, eta_en, eta_ex,
-                                Q, Q_theoretical, E_heat_H2O, N_H2_out, N_O2_out, N_H2O_out)
+                with profiler.span("flow_rates"):
+                    N_H2_out, N_O2_out, N_H2O_out = self.flow_rates_generator.update()
+                with profiler.span("logging"):
+                    flow_data = {
+                        "N_H2_out": N_H2_out,
+                        "N_O2_out": N_O2_out,
+                        "N_H2O_out": N_H2O_out
+                    }
+                    print(flow_data)
+                    # flow_value_json = json.dumps(flow_data)
+                    # self.mqtt_client.publish("H2PEMHydrogenGenerator/FlowRates", flow_value_json)
+                    self.log_status(eta_act_a, eta_act_c, J_0_a, J_0_c, entropy_gen, q_heat_pem, e_heat_pem, eta_en,
+                                    eta_ex, Q, Q_theoretical, E_heat_H2O, N_H2_out, N_O2_out, N_H2O_out)
             except Exception as e:
                 print(f"Error updating and publishing flow rates: {e}")
 
             # Use Sensor Objects
-            self.temperature_sensor.read_and_publish()
-            self.electric_charge_sensor.read_and_publish()
-            self.current_density_sensor.read_and_publish()
-            self.voltage_sensor.read_and_publish()
-            self.hydrogen_output_flow_sensor.read_and_publish()
-            self.water_input_flow_sensor.read_and_publish()
-            self.resistance_sensor.read_and_publish()
-            # self.pressure_sensor.read_and_publish()
-
-            time.sleep(self.time_step)  # introduce a real-time delay
-            yield self.env.timeout(self.time_step)
+            with profiler.span("sensor_publishing"):
+                for sensor in self.sensors:
+                    sensor.read_and_publish()
+                # self.pressure_sensor.read_and_publish()
+
+    def publishing_stats(self):
+        """Published and suppressed readings per sensor topic."""
+        return {sensor.topic: sensor.policy.stats() for sensor in self.sensors}
 
     def log_status(self, eta_act_a, eta_act_c, J_0_a, J_0_c, entropy_gen, q_heat_pem, e_heat_pem, eta_en, eta_ex, Q,
                    Q_theoretical, E_heat_H2O, N_H2_out, N_O2_out, N_H2O_out):
@@ -179,13 +257,97 @@ class PEMHydrogenGeneratorController:
         print(
             f"Time: {self.env.now}, Updated N_H2_out: {N_H2_out}, Updated N_O2_out: {N_O2_out}, Updated N_H2O_out: {N_H2O_out}")
 
-    def receive_energy(self, energy_mj):
-        # TODO: Implement the logic or remove if not needed
-        pass
+    def receive_energy(self, energy_mwh):
+        """
+        Run the stack on the energy delivered during one time step.
+
+        The energy (MWh per time step, in hours) is converted to electric power, the operating
+        point that draws this power is solved, and J, V and Q_electric (W) are written to the
+        shared state. Power above the stack rating is not absorbed.
+
+        Returns:
+        - OperatingPoint of the stack.
+        """
+        self.received_energy_mwh = energy_mwh
+        if self.operating_point_solver is None:
+            self.operating_point_solver = self.create_operating_point_solver()
+        power_w = energy_mwh * 1e6 / self.time_step
+        self.operating_point = self.operating_point_solver.solve(power_w)
+        self.operating_point_solver.apply(self.efficiency_state, self.operating_point)
+        return self.operating_point
+
+    def create_operating_point_solver(self):
+        state = self.efficiency_state
+        if state.R_PEM is None:
+            state.update_R_PEM(self.ohmic_model.calculate_R_PEM(self.ohmic_params, state).magnitude)
+        params = PEMOperatingPointParameters(V0=self.electrochemical_params.V0, R_PEM=state.R_PEM, area=self.cell_area,
+                                             n_cells=self.n_cells, J_max=self.J_max)
+        return PEMOperatingPointSolver(self.activation_params, params)
 
 
 if __name__ == "__main__":
-    env = simpy.Environment()
-    pem_hydrogen_generator_controller = PEMHydrogenGeneratorController(env, time_step=TIME_STEP)
+    # Set TICK_PROFILE_REPORT to a .json or .csv path to collect per-component tick timings
+    profile_report_path = os.getenv('TICK_PROFILE_REPORT')
+    tick_budget_s = os.getenv('TICK_BUDGET_S')
+    profiler = TickProfiler(enabled=profile_report_path is not None,
+                            tick_budget_s=float(tick_budget_s) if tick_budget_s else None,
+                            sampler=SamplingProfiler() if tick_budget_s else None)
+
+    # Set CHECKPOINT_PATH to checkpoint the run periodically and resume from the latest checkpoint on restart
+    checkpoint_path = os.getenv('CHECKPOINT_PATH')
+    checkpoint_manager = None
+    resume_time = None
+    if checkpoint_path:
+        checkpoint_manager = CheckpointManager(checkpoint_path, interval=int(os.getenv('CHECKPOINT_INTERVAL', 24)))
+        resume_time = checkpoint_manager.load()
+
+    # Set SENSOR_HISTORY_PATH to keep the sensor history in a time-series store at that directory
+    sensor_history_path = os.getenv('SENSOR_HISTORY_PATH')
+    sensor_history = TimeSeriesStore(sensor_history_path) if sensor_history_path else None
+
+    # Set SENSOR_DEADBAND to a relative deadband (e.g. 0.01) to publish only changed readings, with a heartbeat
+    # every SENSOR_HEARTBEAT_S seconds
+    sensor_deadband = os.getenv('SENSOR_DEADBAND')
+    publishing_policies = None
+    if sensor_deadband:
+        heartbeat_s = float(os.getenv('SENSOR_HEARTBEAT_S', 60))
+        publishing_policies = {field: DeadbandPolicy(relative=float(sensor_deadband), max_interval=heartbeat_s)
+                               for field in ('T', 'Q_electric', 'J', 'V', 'N_H2_out_dot', 'N_H2O_in', 'R_PEM')}
+
+    # Set SENSOR_RECORD_PATH to log the received sensor messages for replay with Sensors.StreamRecorder
+    sensor_record_path = os.getenv('SENSOR_RECORD_PATH')
+    sensor_recorder = StreamRecorder(sensor_record_path) if sensor_record_path else None
+
+    # Set MEMBRANE_CELLS to solve the membrane water transport on that many finite volumes every tick
+    membrane_cells = os.getenv('MEMBRANE_CELLS')
+    membrane_transport = None
+    if membrane_cells:
+        membrane_params = MembraneWaterTransportParameters(L=PEMHydrogenGeneratorController.INITIAL_STATE['L'],
+                                                           n_cells=int(membrane_cells))
+        membrane_transport = MembraneWaterTransport(membrane_params)
+
+    env = simpy.Environment(initial_time=resume_time or 0)
+    pem_hydrogen_generator_controller = PEMHydrogenGeneratorController(env, time_step=TIME_STEP, profiler=profiler,
+                                                                       sensor_history=sensor_history,
+                                                                       publishing_policies=publishing_policies,
+                                                                       sensor_recorder=sensor_recorder,
+                                                                       membrane_transport=membrane_transport)
+    if checkpoint_manager is not None:
+        checkpoint_manager.register('pem_state', pem_hydrogen_generator_controller.efficiency_state)
+        checkpoint_manager.restore()
+        env.process(checkpoint_manager.process(env))
     env.process(pem_hydrogen_generator_controller.process())
-    env.run(until=10)  # Run for 10 hours as an example
\ No newline at end of file
+    env.run(until=int(os.getenv('SIMULATION_HOURS', 10)))  # Run for 10 hours as an example
+
+    if publishing_policies is not None:
+        print(json.dumps(pem_hydrogen_generator_controller.publishing_stats(), indent=2))
+
+    if sensor_recorder is not None:
+        sensor_recorder.close()
+
+    if sensor_history is not None:
+        sensor_history.apply_retention()
+        sensor_history.close()
+
+    if profile_report_path:
+        profiler.export(profile_report_path)
@@ -0,0 +1,293 @@
+"""
+Parareal (parallel-in-time) driver for long coupled battery / electrolyzer / hydrogen tank runs.
+
+The state at every hour boundary is y = [battery stored energy (MWh), tank hydrogen (mol)].
+The hourly supply and demand profiles drive the usual dispatch: a surplus charges the battery,
+the rest feeds the electrolyzer up to its rating, and a deficit is covered by the battery.
+Electrolyzer hydrogen flows into the tank, and a hydrogen off-take drains it.
+
+Two propagators advance the state over a segment of hours:
+- coarse: an hourly algebraic balance with hard limits (as in ScenarioRunner.simulate_scenario);
+  it costs microseconds per hour.
+- fine: within every hour, the coupled ODE is integrated with solve_ivp. Near a full or empty
+  battery the charge and discharge power taper off over a SoC band, and the off-take tapers off
+  near the minimum tank inventory. The tank follows the mole balance of
+  HydrogenContainerModel, isothermal at the container temperature.
+
+Parareal splits the horizon into segments. Every iteration runs the fine propagator on all
+segments in parallel, then a sequential coarse sweep corrects the boundary states:
+
+    U[i+1] = G(U_new[i]) + F(U_old[i]) - G(U_old[i])
+
+It stops when the boundary states change by less than `tol`. After k iterations, the first k
+segments are exact, so the result never takes more iterations than there are segments. When
+the coarse model is good, a few iterations suffice, and the wall time scales with the number
+of workers.
+"""
+import logging
+import os
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Units.Storage.Container import HydrogenContainerParameters
+from Utils.lazy_import import lazy_import
+
+scipy_integrate = lazy_import("scipy.integrate")
+
+R_GAS = 8.314  # J/(mol K)
+LHV_H2_J_PER_MOL = 241.83e3
+
+# Worker-side system and profiles, set by _init_worker
+_WORKER = None
+
+
+class StorageSystemParameters:
+    """
+    Battery, electrolyzer and hydrogen tank of a coupled storage run.
+
+    Parameters:
+    - capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw: Battery size and power limits.
+    - charge_efficiency / discharge_efficiency: One-way battery efficiencies.
+    - electrolyzer_rating_mw / electrolyzer_efficiency: Electrolyzer power limit and LHV efficiency.
+    - container: HydrogenContainerParameters of the tank (V, T, a, b are used).
+    - h2_offtake_mol_s: Hydrogen drawn from the tank (mol/s).
+    - min_tank_mol: Inventory below which the off-take stops.
+    - soc_band: Fraction of the capacity over which the fine battery model tapers charge/discharge.
+    """
+
+    def __init__(self, capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw, electrolyzer_rating_mw,
+                 container: HydrogenContainerParameters, charge_efficiency=0.95, discharge_efficiency=0.95,
+                 electrolyzer_efficiency=0.65, h2_offtake_mol_s=0.0, min_tank_mol=0.0, soc_band=0.05):
+        self.capacity_mwh = capacity_mwh
+        self.max_charge_rate_mw = max_charge_rate_mw
+        self.max_discharge_rate_mw = max_discharge_rate_mw
+        self.charge_efficiency = charge_efficiency
+        self.discharge_efficiency = discharge_efficiency
+        self.electrolyzer_rating_mw = electrolyzer_rating_mw
+        self.electrolyzer_efficiency = electrolyzer_efficiency
+        self.container = container
+        self.h2_offtake_mol_s = h2_offtake_mol_s
+        self.min_tank_mol = min_tank_mol
+        self.soc_band = soc_band
+
+    def h2_mol_per_mwh(self):
+        return 3.6e9 * self.electrolyzer_efficiency / LHV_H2_J_PER_MOL
+
+    def tank_pressure(self, n):
+        """Van der Waals pressure (Pa) of the tank, as in HydrogenContainerModel.van_der_waals_equation."""
+        c = self.container
+        n = np.asarray(n, dtype=np.float64)
+        return n * R_GAS * c.T / (c.V - n * c.b) - c.a * (n / c.V) ** 2
+
+
+def coarse_propagate(params: StorageSystemParameters, supply_mwh, demand_mwh, start, stop, y0):
+    """
+    Hourly algebraic balance from hour `start` to `stop`.
+
+    Returns:
+    - np.ndarray of shape (stop - start + 1, 2) with the state at every hour boundary.
+    """
+    stored, tank = float(y0[0]), float(y0[1])
+    out = np.empty((stop - start + 1, 2))
+    out[0] = stored, tank
+    h2_per_mwh = params.h2_mol_per_mwh()
+    offtake_per_hour = params.h2_offtake_mol_s * 3600
+    for i, (supplied, demanded) in enumerate(zip(supply_mwh[start:stop].tolist(), demand_mwh[start:stop].tolist())):
+        balance = supplied - demanded
+        if balance > 0:
+            accepted = min(balance, params.max_charge_rate_mw,
+                           (params.capacity_mwh - stored) / params.charge_efficiency)
+            stored += accepted * params.charge_efficiency
+            tank += min(balance - accepted, params.electrolyzer_rating_mw) * h2_per_mwh
+        elif balance < 0:
+            delivered = min(-balance, params.max_discharge_rate_mw, stored * params.discharge_efficiency)
+            stored -= delivered / params.discharge_efficiency
+        tank -= min(offtake_per_hour, max(tank - params.min_tank_mol, 0.0))
+        out[i + 1] = stored, tank
+    return out
+
+
+def _fine_rates(params: StorageSystemParameters, balance_mw, y):
+    stored, tank = y
+    band_mwh = params.soc_band * params.capacity_mwh
+    if balance_mw > 0:
+        headroom = min(max((params.capacity_mwh - stored) / band_mwh, 0.0), 1.0)
+        charge_mw = min(balance_mw, params.max_charge_rate_mw) * headroom
+        electrolyzer_mw = min(balance_mw - charge_mw, params.electrolyzer_rating_mw)
+        d_stored = charge_mw * params.charge_efficiency
+    else:
+        available = min(max(stored / band_mwh, 0.0), 1.0)
+        d_stored = -min(-balance_mw, params.max_discharge_rate_mw) * available / params.discharge_efficiency
+        electrolyzer_mw = 0.0
+    inflow_mol_s = electrolyzer_mw * params.h2_mol_per_mwh() / 3600
+    band_mol = max(params.soc_band * params.min_tank_mol, 1.0)
+    outflow_mol_s = params.h2_offtake_mol_s * min(max((tank - params.min_tank_mol) / band_mol, 0.0), 1.0)
+    # Mole balance of HydrogenContainerModel (dn/dt = inflow - outflow), in mol per hour
+    return [d_stored, (inflow_mol_s - outflow_mol_s) * 3600]
+
+
+def fine_propagate(params: StorageSystemParameters, supply_mwh, demand_mwh, start, stop, y0, rtol=1e-8):
+    """
+    ODE-resolved propagation from hour `start` to `stop`; the inputs are constant within each hour.
+
+    Returns:
+    - np.ndarray of shape (stop - start + 1, 2) with the state at every hour boundary.
+    """
+    out = np.empty((stop - start + 1, 2))
+    out[0] = y0
+    y = np.asarray(y0, dtype=np.float64)
+    for i, hour in enumerate(range(start, stop)):
+        balance_mw = float(supply_mwh[hour] - demand_mwh[hour])
+        solution = scipy_integrate.solve_ivp(lambda t, state: _fine_rates(params, balance_mw, state), (0.0, 1.0), y,
+                                             method='RK45', rtol=rtol, atol=1e-9)
+        y = solution.y[:, -1]
+        out[i + 1] = y
+    return out
+
+
+def _init_worker(params, supply_mwh, demand_mwh):
+    global _WORKER
+    _WORKER = (params, supply_mwh, demand_mwh)
+
+
+def _fine_in_worker(start, stop, y0):
+    params, supply_mwh, demand_mwh = _WORKER
+    return fine_propagate(params, supply_mwh, demand_mwh, start, stop, y0)
+
+
+class PararealResult:
+    """States at every hour boundary of a Parareal run, with its convergence history."""
+
+    def __init__(self, states, boundaries, iterations, converged, residuals, elapsed_s):
+        self.states = states  # (hours + 1, 2): battery stored MWh, tank mol
+        self.boundaries = boundaries  # Segment start hours (plus the final hour)
+        self.iterations = iterations
+        self.converged = converged
+        self.residuals = residuals  # Max boundary change per iteration
+        self.elapsed_s = elapsed_s
+
+    @property
+    def stored_mwh(self):
+        return self.states[:, 0]
+
+    @property
+    def tank_mol(self):
+        return self.states[:, 1]
+
+
+class PararealDriver:
+    """
+    Time-parallel run of the coupled storage system over the profiles.
+
+    Parameters:
+    - params: StorageSystemParameters.
+    - supply_mwh / demand_mwh: Hourly profiles (MWh per hour), e.g. from ScenarioRunner.load_profiles.
+    - segments: Number of time segments (default: the number of workers).
+    - workers: Worker processes for the fine propagators (default: os.cpu_count()).
+    - tol: Convergence tolerance on the boundary states, relative to the battery capacity and tank scale.
+    - max_iterations: Iteration limit (at most `segments` iterations are ever needed).
+    """
+
+    def __init__(self, params: StorageSystemParameters, supply_mwh, demand_mwh, segments=None, workers=None, tol=1e-6,
+                 max_iterations=None):
+        self.params = params
+        self.supply_mwh = np.ascontiguousarray(supply_mwh, dtype=np.float64)
+        self.demand_mwh = np.ascontiguousarray(demand_mwh, dtype=np.float64)
+        self.hours = len(self.supply_mwh)
+        self.workers = workers or os.cpu_count()
+        self.segments = min(segments or self.workers, self.hours)
+        self.tol = tol
+        self.max_iterations = max_iterations or self.segments
+        self.boundaries = np.linspace(0, self.hours, self.segments + 1).round().astype(int)
+
+    def _coarse(self, i, y0):
+        return coarse_propagate(self.params, self.supply_mwh, self.demand_mwh, self.boundaries[i],
+                                self.boundaries[i + 1], y0)
+
+    def run(self, y0):
+        """
+        Run Parareal from the initial state y0 = [stored MWh, tank mol].
+
+        Returns:
+        - PararealResult with the fine trajectory of the last iteration.
+        """
+        start_time = time.perf_counter()
+        n = self.segments
+        # Scale of each state component for the convergence test
+        scale = np.array([max(self.params.capacity_mwh, 1e-9),
+                          max(abs(float(y0[1])), self.params.h2_mol_per_mwh() * self.params.electrolyzer_rating_mw,
+                              1.0)])
+
+        U = np.empty((n + 1, 2))
+        U[0] = y0
+        coarse_end = np.empty((n, 2))
+        for i in range(n):
+            coarse_end[i] = self._coarse(i, U[i])[-1]
+            U[i + 1] = coarse_end[i]
+
+        residuals = []
+        converged = False
+        trajectories = [None] * n
+        iterations = 0
+        with ProcessPoolExecutor(max_workers=min(self.workers, n), initializer=_init_worker,
+                                 initargs=(self.params, self.supply_mwh, self.demand_mwh)) as pool:
+            for iterations in range(1, self.max_iterations + 1):
+                # Segments before the first unconverged boundary are exact after earlier iterations
+                first = iterations - 1
+                futures = {i: pool.submit(_fine_in_worker, int(self.boundaries[i]), int(self.boundaries[i + 1]), U[i])
+                           for i in range(first, n)}
+                for i, future in futures.items():
+                    trajectories[i] = future.result()
+
+                U_new = U.copy()
+                for i in range(first, n):
+                    coarse_new = self._coarse(i, U_new[i])[-1]
+                    U_new[i + 1] = coarse_new + trajectories[i][-1] - coarse_end[i]
+                    coarse_end[i] = coarse_new
+                residual = float(np.max(np.abs(U_new - U) / scale))
+                residuals.append(residual)
+                U = U_new
+                logging.info(f"Parareal iteration {iterations}: max boundary change {residual:.3e}")
+                if residual <= self.tol:
+                    converged = True
+                    break
+
+        # Fine trajectories of the final boundary states; the last correction is below tol
+        states = np.vstack([trajectories[0]] + [trajectory[1:] for trajectory in trajectories[1:]])
+        if not converged:
+            logging.warning(f"Parareal did not converge in {iterations} iterations (last change {residuals[-1]:.3e})")
+        return PararealResult(states, self.boundaries, iterations, converged, residuals,
+                              time.perf_counter() - start_time)
+
+    def run_serial(self, y0):
+        """Fine propagation over the whole horizon on one core, as a reference."""
+        return fine_propagate(self.params, self.supply_mwh, self.demand_mwh, 0, self.hours, y0)
+
+
+# Test Suite
+class TestPararealDriver(unittest.TestCase):
+    def test_parallel_run_matches_serial_fine_run(self):
+        hours = 96
+        t = np.arange(hours)
+        rng = np.random.default_rng(0)
+        supply = 12.0 * np.clip(np.sin((t % 24 - 6) * np.pi / 12), 0.0, None) * rng.uniform(0.7, 1.0, hours)
+        demand = 3.0 + rng.uniform(0.0, 1.0, hours)
+        container = HydrogenContainerParameters(V=50.0, T=300.0, n=0.0, a=0.0245, b=2.66e-5, inflow_rate=0.0,
+                                                outflow_rate=0.0, heat_exchange_rate=0.0)
+        params = StorageSystemParameters(capacity_mwh=20.0, max_charge_rate_mw=5.0, max_discharge_rate_mw=5.0,
+                                         electrolyzer_rating_mw=3.0, container=container, h2_offtake_mol_s=1.0,
+                                         min_tank_mol=100.0)
+        y0 = np.array([5.0, 1000.0])
+        driver = PararealDriver(params, supply, demand, segments=4, workers=2, tol=1e-9)
+        result = driver.run(y0)
+        self.assertTrue(result.converged)
+        self.assertLessEqual(result.iterations, driver.segments)
+        self.assertEqual(result.states.shape, (hours + 1, 2))
+        np.testing.assert_allclose(result.states, driver.run_serial(y0), rtol=1e-8, atol=1e-8)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,236 @@
+"""
+Process-pool scenario runner for battery and electrolyzer sizing studies.
+
+A scenario table (CSV) lists one scenario per row:
+
+    name,capacity_mwh,max_charge_rate_mw,max_discharge_rate_mw,electrolyzer_rating_mw[,electrolyzer_efficiency,
+    n_units,battery_round_trip_efficiency]
+
+Capacity and rates are totals for the site; they are split evenly over n_units Megapack units.
+
+The solar supply and house demand profiles are parsed once in the parent process and placed in
+shared memory; every worker maps them read-only. Each scenario replays an hourly energy balance
+(see simulate_scenario: surplus to the battery first, then the electrolyzer up to its rating, the
+rest is curtailed) and reports KPIs. This is not the greedy dispatch of the simulation Controller,
+which sends the whole supply to the electrolyzer and also charges the battery with the surplus
+over demand; the runner counts every MWh once so that the KPIs add up. Results are appended to the
+results CSV as scenarios finish, and scenarios whose name is already in the results file are
+skipped, so an interrupted study can simply be rerun.
+
+Usage (from the repository root):
+    python -m Controllers.ScenarioRunner scenarios.csv results.csv --workers 8
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import simpy
+
+from Units.Batteries.Model.Degradation import DegradationTracker
+from Units.Batteries.Model.MegapackFleet import TeslaMegapackFleet
+from Units.SolarFarmAndHouses.TimeIndex import TimeIndex
+from Utils.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+MJ_PER_MWH = 3600
+LHV_H2_MJ_PER_KG = 120  # Lower heating value of hydrogen
+DEFAULT_ELECTROLYZER_EFFICIENCY = 0.65
+
+# Optional scenario columns and their defaults
+OPTIONAL_FIELDS = {"electrolyzer_efficiency": DEFAULT_ELECTROLYZER_EFFICIENCY, "n_units": 1,
+                   "battery_round_trip_efficiency": 1.0}
+
+SCENARIO_FIELDS = ["name", "capacity_mwh", "max_charge_rate_mw", "max_discharge_rate_mw", "electrolyzer_rating_mw",
+                   "electrolyzer_efficiency", "n_units", "battery_round_trip_efficiency"]
+KPI_FIELDS = ["hours", "supplied_mwh", "demand_mwh", "unmet_demand_mwh", "unmet_hours", "curtailment_mwh",
+              "electrolyzer_energy_mwh", "h2_produced_kg", "battery_charged_mwh", "battery_discharged_mwh",
+              "battery_cycles", "battery_rainflow_cycles", "battery_state_of_health", "final_stored_energy_mwh"]
+
+# Worker-side view of the shared profiles, set by _attach_profiles
+_PROFILES = None
+_PROFILES_SHM = None
+
+
+def load_profiles(supply_file, demand_file, tz=None):
+    """
+    Read the solar supply and house demand CSVs and align them on a shared TimeIndex.
+
+    Returns:
+    - np.ndarray of shape (2, hours): supplied and demanded energy per hour in MWh.
+    """
+    time_index = TimeIndex.from_frames(pd.read_csv(supply_file), pd.read_csv(demand_file), tz=tz)
+    return np.vstack([time_index.column('Energy Supplied (MJ)'),
+                      time_index.column('Energy Demand (MJ)')]) / MJ_PER_MWH
+
+
+def read_scenarios(scenario_file):
+    """Read the scenario table into a list of dicts with numeric fields converted to float."""
+    scenarios = []
+    with open(scenario_file, newline="") as f:
+        for row in csv.DictReader(f):
+            scenario = {"name": row["name"]}
+            for field in SCENARIO_FIELDS[1:]:
+                value = row.get(field)
+                if value in (None, ""):
+                    if field not in OPTIONAL_FIELDS:
+                        raise ValueError(f"Scenario {row['name']} is missing {field}.")
+                    value = OPTIONAL_FIELDS[field]
+                scenario[field] = float(value)
+            scenarios.append(scenario)
+    return scenarios
+
+
+def completed_scenarios(results_file):
+    """Return the names of the scenarios already present in the results file."""
+    if not os.path.exists(results_file):
+        return set()
+    with open(results_file, newline="") as f:
+        return {row["name"] for row in csv.DictReader(f)}
+
+
+def simulate_scenario(scenario, supply_mwh, demand_mwh, time_step_h=1.0):
+    """
+    Replay the hourly dispatch for one scenario.
+
+    Surplus energy charges the battery fleet up to its charge rate, then feeds the electrolyzer up to its
+    rating; whatever is left is curtailed. A deficit is covered by the battery up to its discharge
+    rate; the rest is unmet demand. Unlike Controller.step (which passes the whole supply to the
+    electrolyzer and charges the battery with the surplus as well), the electrolyzer only gets
+    what is left after demand and the battery.
+
+    Returns:
+    - dict of KPIs (see KPI_FIELDS).
+    """
+    n_units = int(scenario["n_units"])
+    one_way_efficiency = scenario["battery_round_trip_efficiency"] ** 0.5
+    battery = TeslaMegapackFleet(simpy.Environment(), n_units, capacity_mwh=scenario["capacity_mwh"] / n_units,
+                                 max_charge_rate_mw=scenario["max_charge_rate_mw"] / n_units,
+                                 max_discharge_rate_mw=scenario["max_discharge_rate_mw"] / n_units,
+                                 charge_efficiency=one_way_efficiency, discharge_efficiency=one_way_efficiency,
+                                 time_step_h=time_step_h)
+    degradation = DegradationTracker(n_units, time_step_h=time_step_h)
+    electrolyzer_max_mwh = scenario["electrolyzer_rating_mw"] * time_step_h
+
+    unmet = curtailed = electrolyzer = charged = discharged = 0.0
+    unmet_hours = 0
+    for supplied, demanded in zip(supply_mwh.tolist(), demand_mwh.tolist()):
+        balance = supplied - demanded
+        if balance > 0:
+            accepted = battery.charge(balance)
+            charged += accepted
+            to_electrolyzer = min(balance - accepted, electrolyzer_max_mwh)
+            electrolyzer += to_electrolyzer
+            curtailed += balance - accepted - to_electrolyzer
+        elif balance < 0:
+            delivered = battery.discharge(-balance)
+            discharged += delivered
+            shortfall = -balance - delivered
+            if shortfall > 1e-12:
+                unmet += shortfall
+                unmet_hours += 1
+        degradation.observe(battery.get_unit_state_of_charge())
+
+    h2_produced_kg = electrolyzer * MJ_PER_MWH * scenario["electrolyzer_efficiency"] / LHV_H2_MJ_PER_KG
+    return {
+        "hours": len(supply_mwh),
+        "supplied_mwh": float(supply_mwh.sum()),
+        "demand_mwh": float(demand_mwh.sum()),
+        "unmet_demand_mwh": unmet,
+        "unmet_hours": unmet_hours,
+        "curtailment_mwh": curtailed,
+        "electrolyzer_energy_mwh": electrolyzer,
+        "h2_produced_kg": h2_produced_kg,
+        "battery_charged_mwh": charged,
+        "battery_discharged_mwh": discharged,
+        "battery_cycles": discharged / scenario["capacity_mwh"] if scenario["capacity_mwh"] > 0 else 0.0,
+        "battery_rainflow_cycles": float(degradation.equivalent_full_cycles.mean()),
+        "battery_state_of_health": float(degradation.state_of_health().mean()),
+        "final_stored_energy_mwh": battery.get_stored_energy(),
+    }
+
+
+def _attach_profiles(shm_name, hours):
+    global _PROFILES, _PROFILES_SHM
+    _PROFILES_SHM = shared_memory.SharedMemory(name=shm_name)
+    profiles = np.ndarray((2, hours), dtype=np.float64, buffer=_PROFILES_SHM.buf)
+    profiles.flags.writeable = False
+    _PROFILES = profiles
+
+
+def _run_in_worker(scenario):
+    return scenario, simulate_scenario(scenario, _PROFILES[0], _PROFILES[1])
+
+
+class ScenarioRunner:
+    """
+    Runs a scenario table across a process pool against shared, read-only profiles.
+
+    Parameters:
+    - profiles: Array of shape (2, hours) with supply and demand in MWh (see load_profiles).
+    - results_file: CSV the results are appended to; completed scenarios in it are skipped.
+    - workers: Number of worker processes (default: os.cpu_count()).
+    """
+
+    def __init__(self, profiles, results_file, workers=None):
+        self.profiles = np.ascontiguousarray(profiles, dtype=np.float64)
+        self.results_file = results_file
+        self.workers = workers or os.cpu_count()
+
+    def run(self, scenarios):
+        """Run every scenario not yet in the results file; returns the newly computed result rows."""
+        done = completed_scenarios(self.results_file)
+        pending = [scenario for scenario in scenarios if scenario["name"] not in done]
+        if not pending:
+            return []
+
+        shm = shared_memory.SharedMemory(create=True, size=self.profiles.nbytes)
+        rows = []
+        try:
+            np.ndarray(self.profiles.shape, dtype=np.float64, buffer=shm.buf)[:] = self.profiles
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(pending)), initializer=_attach_profiles,
+                                     initargs=(shm.name, self.profiles.shape[1])) as pool:
+                futures = [pool.submit(_run_in_worker, scenario) for scenario in pending]
+                for future in as_completed(futures):
+                    scenario, kpis = future.result()
+                    row = dict(scenario, **kpis)
+                    self._append_result(row)
+                    rows.append(row)
+        finally:
+            shm.close()
+            shm.unlink()
+        return rows
+
+    def _append_result(self, row):
+        # Written as each scenario finishes, so completed work survives an interrupted study
+        write_header = not os.path.exists(self.results_file) or os.path.getsize(self.results_file) == 0
+        with open(self.results_file, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SCENARIO_FIELDS + KPI_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run battery/electrolyzer sizing scenarios in parallel.")
+    parser.add_argument("scenario_file")
+    parser.add_argument("results_file")
+    parser.add_argument("--supply", default=os.getenv('SOLAR_FARM_FILE_PATH',
+                                                      'SimulationData/hourly_solar_energy_production.csv'))
+    parser.add_argument("--demand", default=os.getenv('HOUSES_FILE_PATH',
+                                                      'SimulationData/energy_demand_3200_houses.csv'))
+    parser.add_argument("--timezone", default=os.getenv('PROFILE_TIMEZONE'),
+                        help="Time zone of local wall-clock profile timestamps (DST handling)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    runner = ScenarioRunner(load_profiles(args.supply, args.demand, tz=args.timezone), args.results_file, workers=args.workers)
+    rows = runner.run(read_scenarios(args.scenario_file))
+    print(f"Completed {len(rows)} scenario(s); results in {args.results_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 import simpy
-import pandas as pd
 import logging
 import os
 
 
+from Monitoring.TickProfiler import TickProfiler, SamplingProfiler
+from State.Checkpoint import CheckpointManager
 from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import PEMParametersOhmic, PEMStateOhmic, PEMOhmicOverpotentialModel  # Adjust the import path accordingly
+from Controllers.ModelPredictiveDispatch import ModelPredictiveDispatch
+from Controllers.OptimalDispatch import DispatchParameters, OptimalDispatch
 from Controllers.PEMHydrogenGeneratorController import PEMHydrogenGeneratorController
+from Controllers.TickScheduler import TickScheduler
 # noinspection PyInterpreter
 from Units.Batteries.Model.TeslaMegapack import TeslaMegapack
 from Units.SolarFarmAndHouses.SolarFarmHouses import SolarFarm, Houses
+from Units.SolarFarmAndHouses.TimeIndex import TimeIndex
+
+
+DISPATCH_MODES = ("greedy", "optimal", "mpc")
 
 
 def mj_to_mwh(energy_mj):
@@ -16,63 +24,153 @@ def mj_to_mwh(energy_mj):
 
 
 class Controller:
-    def __init__(self, env, battery, solar_farm, houses, pem_hydrogen_generator_controller, pem_ohmic_model, pem_ohmic_params, pem_ohmic_state):
+    """
+    Hourly dispatch of solar supply and house demand over the battery and the electrolyzer.
+
+    Dispatch modes:
+    - greedy: discharge the battery on a deficit, charge it on a surplus.
+    - optimal: follow a perfect-foresight schedule over the whole time index (OptimalDispatch),
+      solved once at start-up.
+    - mpc: re-solve the dispatch every tick over the next mpc_horizon hours of the profiles and
+      apply the first hour (ModelPredictiveDispatch).
+    dispatch_params overrides the DispatchParameters taken from the battery and the electrolyzer rating.
+    """
+
+    def __init__(self, env, battery, solar_farm, houses, pem_hydrogen_generator_controller, pem_ohmic_model, pem_ohmic_params, pem_ohmic_state, profiler=None, time_index=None, start_process=True, dispatch_mode="greedy", dispatch_params=None, mpc_horizon=48):
         self.env = env
         self.battery = battery
         self.solar_farm = solar_farm
         self.houses = houses
         self.pem_hydrogen_generator_controller = pem_hydrogen_generator_controller
         self.pem_ohmic_model = pem_ohmic_model
-        self.pem_ohmic_par  ams = pem_ohmic_params
+        self.pem_ohmic_params = pem_ohmic_params
         self.pem_ohmic_state = pem_ohmic_state
-        self.process_ref = env.process(self.process())
+        self.profiler = profiler if profiler is not None else TickProfiler()  # Disabled unless one is passed in
+        # Shared time index, so supply and demand are always read from the same timestamp
+        if time_index is None:
+            time_index = TimeIndex.from_frames(solar_farm.energy_data, houses.demand_data)
+        self.time_index = solar_farm.time_index = houses.time_index = time_index
+        self.energy_supplied_mj = time_index.column('Energy Supplied (MJ)')
+        self.energy_demand_mj = time_index.column('Energy Demand (MJ)')
+        self.records = []  # (time, supplied MWh, demand MWh, battery stored MWh) per tick
+        if dispatch_mode not in DISPATCH_MODES:
+            raise ValueError(f"Unknown dispatch mode: {dispatch_mode}")
+        self.dispatch_mode = dispatch_mode
+        self.dispatch_plan = None
+        self.mpc = None
+        if dispatch_mode == "optimal":
+            self.dispatch_plan = self.plan_dispatch(dispatch_params)
+        elif dispatch_mode == "mpc":
+            self.energy_supplied_mwh = mj_to_mwh(self.energy_supplied_mj)
+            self.energy_demand_mwh = mj_to_mwh(self.energy_demand_mj)
+            params = dispatch_params if dispatch_params is not None else self.default_dispatch_params()
+            self.mpc = ModelPredictiveDispatch(params, horizon=mpc_horizon, time_step_h=time_index.step_h)
+        # Without its own process the controller is stepped by a TickScheduler
+        self.process_ref = env.process(self.process()) if start_process else None
 
     def process(self):
         while True:
+            self.step()
+            yield self.env.timeout(1)
+
+    def default_dispatch_params(self, **kwargs):
+        """DispatchParameters of the battery, with the electrolyzer rated at the stack's maximum power."""
+        pem = self.pem_hydrogen_generator_controller
+        if pem.operating_point_solver is None:
+            pem.operating_point_solver = pem.create_operating_point_solver()
+        return DispatchParameters.from_battery(self.battery, pem.operating_point_solver.max_power_w / 1e6, **kwargs)
+
+    def plan_dispatch(self, dispatch_params=None):
+        """Solve the dispatch LP over the whole time index."""
+        params = dispatch_params if dispatch_params is not None else self.default_dispatch_params()
+        plan = OptimalDispatch(self.time_index.n, self.time_index.step_h).solve(
+            mj_to_mwh(self.energy_supplied_mj), mj_to_mwh(self.energy_demand_mj), params)
+        logging.info(f"Optimal dispatch over {plan.hours} steps solved in {plan.solve_time_s:.2f} s: {plan.kpis()}")
+        return plan
+
+    def step(self):
+        """Run a single dispatch tick."""
+        profiler = self.profiler
+        with profiler.tick():
             try:
                 # Get the energy supplied and demanded for the current hour
-                energy_supplied = self.solar_farm.energy_data.iloc[self.solar_farm.current_hour]['Energy Supplied (MJ)']
-                energy_demand = self.houses.demand_data.iloc[self.houses.current_hour]['Energy Demand (MJ)']
+                with profiler.span("profile_lookup"):
+                    row = self.time_index.row(self.env.now)
+                    energy_supplied = self.energy_supplied_mj[row]
+                    energy_demand = self.energy_demand_mj[row]
 
                 # Convert energy to MWh for operations
                 energy_supplied_mwh = mj_to_mwh(energy_supplied)
                 energy_demand_mwh = mj_to_mwh(energy_demand)
 
-                # Here, SolarFarm directly supplies energy to PEMHydrogenGeneratorController
-                self.pem_hydrogen_generator_controller.receive_energy(energy_supplied_mwh)
-
-                # Calculate energy deficit or surplus
-                energy_deficit_mwh = max(0, energy_demand_mwh - energy_supplied_mwh)
-                energy_surplus_mwh = max(0, energy_supplied_mwh - energy_demand_mwh)
-
-                # Charge or discharge the battery as needed
-                if energy_deficit_mwh > 0:
-                    self.battery.discharge(energy_deficit_mwh)
-                elif energy_surplus_mwh > 0:
-                    self.battery.charge(energy_surplus_mwh)
+                if self.dispatch_plan is not None or self.mpc is not None:
+                    if self.mpc is not None:
+                        with profiler.span("mpc_solve"):
+                            decision = self.mpc.decide(self.energy_supplied_mwh, self.energy_demand_mwh, row,
+                                                       self.battery.get_stored_energy())
+                        electrolyzer_mwh, charge_mwh, discharge_mwh = (decision["electrolyzer"], decision["charge"],
+                                                                       decision["discharge"])
+                    else:
+                        plan = self.dispatch_plan
+                        electrolyzer_mwh, charge_mwh, discharge_mwh = (plan.electrolyzer[row], plan.charge[row],
+                                                                       plan.discharge[row])
+                    with profiler.span("pem_receive_energy"):
+                        self.pem_hydrogen_generator_controller.receive_energy(electrolyzer_mwh)
+                    with profiler.span("battery_dispatch"):
+                        if discharge_mwh > 0:
+                            self.battery.discharge(discharge_mwh)
+                        if charge_mwh > 0:
+                            self.battery.charge(charge_mwh)
+                else:
+                    # Here, SolarFarm directly supplies energy to PEMHydrogenGeneratorController
+                    with profiler.span("pem_receive_energy"):
+                        self.pem_hydrogen_generator_controller.receive_energy(energy_supplied_mwh)
+
+                    # Calculate energy deficit or surplus
+                    energy_deficit_mwh = max(0, energy_demand_mwh - energy_supplied_mwh)
+                    energy_surplus_mwh = max(0, energy_supplied_mwh - energy_demand_mwh)
+
+                    # Charge or discharge the battery as needed
+                    with profiler.span("battery_dispatch"):
+                        if energy_deficit_mwh > 0:
+                            self.battery.discharge(energy_deficit_mwh)
+                        elif energy_surplus_mwh > 0:
+                            self.battery.charge(energy_surplus_mwh)
 
                 # Update PEM Ohmic Model State
-                self.pem_ohmic_model.update(self.pem_ohmic_params, self.pem_ohmic_state)
+                with profiler.span("ohmic_update"):
+                    self.pem_ohmic_model.update(self.pem_ohmic_params, self.pem_ohmic_state)
 
                 # Log PEM Ohmic Model State
-                sigma = self.pem_ohmic_model.calculate_sigma(self.pem_ohmic_state.lambda_x, self.pem_ohmic_params)
-                lambda_x = self.pem_ohmic_state.lambda_x
-                eta_ohm = self.pem_ohmic_model.calculate_eta_ohm(self.pem_ohmic_state)
-                J_act = self.pem_ohmic_model.calculate_J_act(self.pem_ohmic_state, self.pem_ohmic_params)
-                logging.info(f"sigma: {sigma}, lambda_x: {lambda_x}, eta_ohm: {eta_ohm}, J_act: {J_act}")
+                with profiler.span("logging"):
+                    sigma = self.pem_ohmic_model.calculate_sigma(self.pem_ohmic_state.lambda_x, self.pem_ohmic_params)
+                    lambda_x = self.pem_ohmic_state.lambda_x
+                    eta_ohm = self.pem_ohmic_model.calculate_eta_ohm(self.pem_ohmic_state)
+                    J_act = self.pem_ohmic_model.calculate_J_act(self.pem_ohmic_state, self.pem_ohmic_params)
+                    logging.info(f"sigma: {sigma}, lambda_x: {lambda_x}, eta_ohm: {eta_ohm}, J_act: {J_act}")
+
+                    logging.info(
+                        f"At {self.env.now}, Energy Supplied: {energy_supplied_mwh} MWh, Energy Demand: {energy_demand_mwh} MWh, Battery Stored Energy: {self.battery.get_stored_energy()} MWh")
 
-                logging.info(
-                    f"At {self.env.now}, Energy Supplied: {energy_supplied_mwh} MWh, Energy Demand: {energy_demand_mwh} MWh, Battery Stored Energy: {self.battery.get_stored_energy()} MWh")
+                self.records.append((self.env.now, energy_supplied_mwh, energy_demand_mwh,
+                                     self.battery.get_stored_energy()))
 
             except Exception as e:
                 logging.error(f"Error in Controller process: {e}")
 
-            yield self.env.timeout(1)
-
 
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
-    env = simpy.Environment()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    simulation_hours = int(os.getenv('SIMULATION_HOURS', 24))
+
+    # Set CHECKPOINT_PATH to checkpoint the run periodically and resume from the latest checkpoint on restart
+    checkpoint_path = os.getenv('CHECKPOINT_PATH')
+    checkpoint_manager = None
+    resume_time = None
+    if checkpoint_path:
+        checkpoint_manager = CheckpointManager(checkpoint_path, interval=int(os.getenv('CHECKPOINT_INTERVAL', 24)))
+        resume_time = checkpoint_manager.load()
+    env = simpy.Environment(initial_time=resume_time or 0)
 
     # Initialize the components
     houses_file_path = os.getenv('HOUSES_FILE_PATH', 'sim/SimulationData/energy_demand_3200_houses.csv')
@@ -80,7 +178,9 @@ if __name__ == "__main__":
 
     houses = Houses(env, houses_file_path)
     solar_farm = SolarFarm(env, solar_farm_file_path)
-    battery = TeslaMegapack(env, capacity_mwh=4.32, max_charge_rate_mw=1, max_discharge_rate_mw=1)
+    # Set PROFILE_TIMEZONE when the profiles use local wall-clock time with DST (e.g. Europe/Amsterdam)
+    time_index = TimeIndex.from_frames(solar_farm.energy_data, houses.demand_data, tz=os.getenv('PROFILE_TIMEZONE'))
+    battery = TeslaMegapack(env, capacity_mwh=4.32, max_charge_rate_mw=1, max_discharge_rate_mw=1, start_process=False)
 
     # Initialize the PEMHydrogenGeneratorController and related components
     pem_hydrogen_generator_controller = PEMHydrogenGeneratorController(env)  # Assuming you have properly initialized it
@@ -88,12 +188,40 @@ if __name__ == "__main__":
     # Initialize the PEM Ohmic Overpotential Model
     pem_ohmic_model = PEMOhmicOverpotentialModel()
     pem_ohmic_params = PEMParametersOhmic(T=300, z=2, F=96500, R=8.314)
-    pem_ohmic_state = PEMStateOhmic(lambda_a=20, lambda_c=10, L=0.01, J=0.1, alpha=0.5, eta_act=0.1, J0=1e-3)
-
-    # Register the processes of the solar farm, the houses
-    env.process(solar_farm.process())
-    env.process(houses.process())
+    pem_ohmic_state = PEMStateOhmic(initial_values={'lambda_a': 20, 'lambda_c': 10, 'L': 0.01, 'J': 0.1, 'alpha': 0.5,
+                                                    'eta_act': 0.1, 'J0': 1e-3})
 
     # Initialize and run the main controller
-    controller = Controller(env, battery, solar_farm, houses, pem_hydrogen_generator_controller, pem_ohmic_model, pem_ohmic_params, pem_ohmic_state)
-    env.run(until=24)
+    # Set TICK_PROFILE_REPORT to a .json or .csv path to collect per-component tick timings
+    profile_report_path = os.getenv('TICK_PROFILE_REPORT')
+    tick_budget_s = os.getenv('TICK_BUDGET_S')
+    profiler = TickProfiler(enabled=profile_report_path is not None,
+                            tick_budget_s=float(tick_budget_s) if tick_budget_s else None,
+                            sampler=SamplingProfiler() if tick_budget_s else None)
+
+    # Set DISPATCH_MODE=optimal (perfect-foresight LP) or mpc (rolling MPC_HORIZON-hour look-ahead) instead of greedy dispatch
+    controller = Controller(env, battery, solar_farm, houses, pem_hydrogen_generator_controller, pem_ohmic_model, pem_ohmic_params, pem_ohmic_state, profiler=profiler, time_index=time_index, start_process=False, dispatch_mode=os.getenv('DISPATCH_MODE', 'greedy'), mpc_horizon=int(os.getenv('MPC_HORIZON', 48)))
+
+    # One process steps all units each hour, in a fixed order
+    scheduler = TickScheduler(env)
+    scheduler.register(solar_farm, order=0)
+    scheduler.register(houses, order=1)
+    scheduler.register(controller, order=2)
+    scheduler.register(battery, order=3)
+
+    if checkpoint_manager is not None:
+        checkpoint_manager.register('battery', battery)
+        checkpoint_manager.register('solar_farm', solar_farm)
+        checkpoint_manager.register('houses', houses)
+        checkpoint_manager.register('pem_ohmic_state', pem_ohmic_state)
+        checkpoint_manager.register('pem_state', pem_hydrogen_generator_controller.efficiency_state)
+        checkpoint_manager.register_buffer('controller_records', controller.records)
+        if checkpoint_manager.restore() is not None:
+            logging.info(f"Resumed from checkpoint at {env.now}")
+        env.process(checkpoint_manager.process(env))
+
+    scheduler.start()
+    env.run(until=simulation_hours)
+
+    if profile_report_path:
+        profiler.export(profile_report_path)
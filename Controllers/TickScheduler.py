@@ -0,0 +1,189 @@
+"""
+Single-process tick scheduler for the simulation units.
+
+Instead of every unit running its own ``while True: ... yield env.timeout(1)`` process, units
+are registered with an explicit update order and rate, and one SimPy process calls their
+``step()`` methods each tick. This keeps one event per tick in the queue, whatever the number
+of units, and makes the update order within a tick deterministic.
+
+Rates are given as ``every`` (run every n ticks) and ``offset`` (phase within those n ticks),
+so slow units can run in multi-rate groups. Registrations are sorted into update order when units
+are registered; a tick selects the due units with ``tick % every == offset``, which costs one
+comparison per unit whatever the rates (a table over all phases would need lcm(every...) entries).
+"""
+import logging
+import unittest
+
+from Monitoring.TickProfiler import TickProfiler
+
+
+class _Registration:
+    __slots__ = ("name", "step", "order", "every", "offset", "index")
+
+    def __init__(self, name, step, order, every, offset, index):
+        self.name = name
+        self.step = step
+        self.order = order
+        self.every = every
+        self.offset = offset
+        self.index = index
+
+
+class TickScheduler:
+    """
+    Calls the step() method of registered units once per tick, in a fixed order.
+
+    Parameters:
+    - env: SimPy environment.
+    - tick: Simulation time between ticks.
+    - profiler: Optional TickProfiler; each unit's step is timed as a span named after the unit.
+    """
+
+    def __init__(self, env, tick=1, profiler=None):
+        self.env = env
+        self.tick = tick
+        self.profiler = profiler if profiler is not None else TickProfiler()  # Disabled unless one is passed in
+        self.registrations = []
+        self.skipped = []  # Names of registered units without a step method
+        self.ticks = 0
+        self._schedule = []  # [(name, step, every, offset), ...] in update order
+        self.process_ref = None
+
+    def register(self, unit, order=0, every=1, offset=0, name=None, method="step"):
+        """
+        Register a unit.
+
+        Parameters:
+        - unit: Object with a step() method (or the method named by `method`).
+        - order: Units with a lower order run first within a tick; ties run in registration order.
+        - every: Run the unit every `every` ticks.
+        - offset: Tick within each `every` ticks on which the unit runs.
+        - name: Name used in logs and profiler spans (default: the class name).
+
+        Returns:
+        - True if the unit was scheduled, False if it has nothing to step and was skipped.
+
+        Raises:
+        - ValueError: If every is not positive or offset is not in [0, every).
+        """
+        if every < 1 or not 0 <= offset < every:
+            raise ValueError(f"Invalid rate for {name or type(unit).__name__}: every={every}, offset={offset}")
+        name = name or type(unit).__name__
+        step = getattr(unit, method, None)
+        if not callable(step):
+            logging.debug(f"TickScheduler: {name} has no {method}() and is skipped")
+            self.skipped.append(name)
+            return False
+        self.registrations.append(_Registration(name, step, order, int(every), int(offset), len(self.registrations)))
+        self._schedule = [(r.name, r.step, r.every, r.offset)
+                          for r in sorted(self.registrations, key=lambda r: (r.order, r.index))]
+        return True
+
+    def _due(self, tick_number):
+        return [(name, step) for name, step, every, offset in self._schedule if tick_number % every == offset]
+
+    def due(self, tick_number):
+        """Names of the units that run on a given tick, in update order."""
+        return [name for name, _ in self._due(tick_number)]
+
+    def step(self):
+        """Run the units due on the current tick."""
+        profiler = self.profiler
+        # The tick number follows the simulation time, so a run resumed from a checkpoint stays in phase
+        tick_number = round(self.env.now / self.tick)
+        with profiler.tick():
+            if profiler.enabled:
+                for name, step in self._due(tick_number):
+                    with profiler.span(name):
+                        step()
+            else:
+                for name, step in self._due(tick_number):
+                    step()
+        self.ticks += 1
+
+    def process(self):
+        while True:
+            self.step()
+            yield self.env.timeout(self.tick)
+
+    def start(self):
+        """Register the scheduler's single process with the environment."""
+        if self.process_ref is None:
+            self.process_ref = self.env.process(self.process())
+        return self.process_ref
+
+
+# Test Suite
+class TestTickScheduler(unittest.TestCase):
+    class Unit:
+        def __init__(self, name, log):
+            self.name = name
+            self.log = log
+
+        def step(self):
+            self.log.append(self.name)
+
+    @staticmethod
+    def environment(initial_time=0):
+        import simpy  # Only the tests need SimPy; the scheduler works with any env exposing now
+        return simpy.Environment(initial_time=initial_time)
+
+    def run_ticks(self, scheduler, ticks):
+        scheduler.start()
+        scheduler.env.run(until=scheduler.env.now + ticks * scheduler.tick)
+
+    def test_units_run_in_order_then_registration_order(self):
+        log = []
+        scheduler = TickScheduler(self.environment())
+        for name, order in (("c", 1), ("a", 0), ("d", 1), ("b", 0)):
+            scheduler.register(self.Unit(name, log), order=order, name=name)
+        self.run_ticks(scheduler, 2)
+        self.assertEqual(log, ["a", "b", "c", "d"] * 2)
+        self.assertEqual(scheduler.ticks, 2)
+
+    def test_every_and_offset(self):
+        log = []
+        scheduler = TickScheduler(self.environment(), tick=0.5)
+        scheduler.register(self.Unit("fast", log), name="fast")
+        scheduler.register(self.Unit("slow", log), every=3, offset=1, name="slow")
+        self.run_ticks(scheduler, 7)
+        self.assertEqual(log, ["fast", "fast", "slow", "fast", "fast", "fast", "slow", "fast", "fast"])
+        with self.assertRaises(ValueError):
+            scheduler.register(self.Unit("bad", log), every=3, offset=3)
+        with self.assertRaises(ValueError):
+            scheduler.register(self.Unit("bad", log), every=0)
+        self.assertFalse(scheduler.register(object(), name="inert"))
+        self.assertEqual(scheduler.skipped, ["inert"])
+
+    def test_coprime_rates_do_not_build_a_period_table(self):
+        scheduler = TickScheduler(self.environment())
+        rates = (7, 11, 13, 60, 3600)
+        for every in rates:
+            scheduler.register(self.Unit(every, []), every=every, offset=every - 1, name=str(every))
+        self.assertEqual(len(scheduler._schedule), len(rates))
+        tick = 7 * 11 * 13 * 60 * 3600 - 1  # Every unit is due
+        self.assertEqual(scheduler.due(tick), [str(every) for every in rates])
+        self.assertEqual(scheduler.due(tick + 1), [])
+
+    def test_phase_continues_when_resumed_at_a_later_time(self):
+        registrations = (("every_tick", 1, 0), ("every_3", 3, 2), ("every_5", 5, 1))
+
+        def scheduler_at(start):
+            log = []
+            scheduler = TickScheduler(self.environment(start), tick=2)
+            for name, every, offset in registrations:
+                scheduler.register(self.Unit(name, log), every=every, offset=offset, name=name)
+            return scheduler, log
+
+        uninterrupted, full_log = scheduler_at(0)
+        self.run_ticks(uninterrupted, 20)
+        # Resume at tick 8, e.g. from a checkpoint taken at env.now == 16
+        resumed, resumed_log = scheduler_at(16)
+        self.run_ticks(resumed, 12)
+        expected = [name for tick in range(8, 20) for name in uninterrupted.due(tick)]
+        self.assertEqual(resumed_log, expected)
+        self.assertEqual(full_log[-len(expected):], expected)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,340 @@
+"""
+Per-component timing instrumentation for the controller tick loops.
+
+A controller wraps each tick in ``profiler.tick()`` and each component update in
+``profiler.span(name)``. While the profiler is disabled both return a shared no-op
+context manager, so the instrumentation can stay in the hot loop permanently.
+
+When enabled, every span feeds a log2-bucketed latency histogram per component, and a
+tick that exceeds the latency budget can arm a ``SamplingProfiler`` that records the
+call stacks of the following ticks.
+"""
+import collections
+import contextlib
+import csv
+import json
+import sys
+import threading
+import time
+import unittest
+
+_NULL_CONTEXT = contextlib.nullcontext()
+NUM_BUCKETS = 64  # Bucket i holds durations in [2**(i-1), 2**i) ns
+
+
+class ComponentHistogram:
+    """Latency histogram of one component, in nanoseconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self.buckets = [0] * NUM_BUCKETS
+
+    def record(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        if self.min_ns is None or duration_ns < self.min_ns:
+            self.min_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.buckets[min(duration_ns.bit_length(), NUM_BUCKETS - 1)] += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper edge of the bucket that contains it."""
+        if self.count == 0:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(1 << index, self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_s": self.total_ns / 1e9,
+            "mean_us": self.total_ns / self.count / 1e3 if self.count else 0.0,
+            "min_us": (self.min_ns or 0) / 1e3,
+            "p50_us": self.quantile(0.50) / 1e3,
+            "p90_us": self.quantile(0.90) / 1e3,
+            "p99_us": self.quantile(0.99) / 1e3,
+            "max_us": self.max_ns / 1e3,
+            "buckets": {str(1 << index): n for index, n in enumerate(self.buckets) if n},
+        }
+
+
+class _Span:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record(time.perf_counter_ns() - self.start)
+        return False
+
+
+class _Tick:
+    __slots__ = ("profiler", "start")
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler._finish_tick(time.perf_counter_ns() - self.start)
+        return False
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that samples the call stack of one thread from a background thread.
+
+    Sampling only happens while armed. ``arm(ticks)`` starts sampling and each call to
+    ``tick_finished()`` counts one tick down; sampling stops when the count reaches zero.
+    Stacks are aggregated in collapsed ``outer;...;inner`` form.
+    """
+
+    def __init__(self, interval_s=0.001, ticks=3, max_depth=64):
+        self.interval_s = interval_s
+        self.ticks = ticks
+        self.max_depth = max_depth
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._target_thread_id = None
+        self._remaining_ticks = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def arm(self, ticks=None, thread_id=None):
+        self._remaining_ticks = max(self._remaining_ticks, ticks or self.ticks)
+        if self._thread is not None:
+            return
+        self._target_thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def tick_finished(self):
+        if self._thread is None:
+            return
+        self._remaining_ticks -= 1
+        if self._remaining_ticks <= 0:
+            self.stop()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_s):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < self.max_depth:
+                code = frame.f_code
+                names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def report(self, top=20):
+        return {
+            "samples": self.samples,
+            "interval_s": self.interval_s,
+            "stacks": dict(self.stacks.most_common(top)),
+        }
+
+
+class TickProfiler:
+    """
+    Collects per-component span timings and whole-tick timings for a controller.
+
+    Parameters:
+    - enabled: When False, tick() and span() are no-ops.
+    - tick_budget_s: Latency budget of one tick in seconds; ticks above it count as overruns.
+    - sampler: Optional SamplingProfiler armed when a tick exceeds the budget.
+    - max_overruns_kept: Number of most recent overrunning ticks kept for the report.
+    """
+
+    def __init__(self, enabled=False, tick_budget_s=None, sampler=None, max_overruns_kept=100):
+        self.enabled = enabled
+        self.tick_budget_ns = int(tick_budget_s * 1e9) if tick_budget_s is not None else None
+        self.sampler = sampler
+        self.histograms = {}
+        self.tick_histogram = ComponentHistogram()
+        self.ticks = 0
+        self.overruns = collections.deque(maxlen=max_overruns_kept)
+        self.overrun_count = 0
+        self._spans = {}
+        self._tick = _Tick(self)
+
+    def span(self, name):
+        """Context manager timing one component update."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        span = self._spans.get(name)
+        if span is None:
+            histogram = self.histograms[name] = ComponentHistogram()
+            span = self._spans[name] = _Span(histogram)
+        return span
+
+    def tick(self):
+        """Context manager timing one whole tick."""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._tick
+
+    def _finish_tick(self, duration_ns):
+        self.ticks += 1
+        self.tick_histogram.record(duration_ns)
+        if self.sampler is not None:
+            self.sampler.tick_finished()
+        if self.tick_budget_ns is not None and duration_ns > self.tick_budget_ns:
+            self.on_budget_exceeded(self.ticks, duration_ns)
+
+    def on_budget_exceeded(self, tick_number, duration_ns):
+        """Record an overrunning tick and arm the sampling profiler for the following ticks."""
+        self.overrun_count += 1
+        self.overruns.append({"tick": tick_number, "duration_ms": duration_ns / 1e6})
+        if self.sampler is not None:
+            self.sampler.arm()
+
+    def report(self):
+        tick_total = self.tick_histogram.total_ns
+        components = {}
+        for name, histogram in self.histograms.items():
+            summary = histogram.summary()
+            summary["share_of_tick"] = histogram.total_ns / tick_total if tick_total else None
+            components[name] = summary
+        report = {
+            "ticks": self.ticks,
+            "tick": self.tick_histogram.summary(),
+            "tick_budget_ms": self.tick_budget_ns / 1e6 if self.tick_budget_ns is not None else None,
+            "overrun_count": self.overrun_count,
+            "overruns": list(self.overruns),
+            "components": components,
+        }
+        if self.sampler is not None:
+            report["sampling_profile"] = self.sampler.report()
+        return report
+
+    def export_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def export_csv(self, path):
+        """Write one row per component (plus the whole tick) with the summary statistics."""
+        fields = ["component", "count", "total_s", "mean_us", "min_us", "p50_us", "p90_us", "p99_us", "max_us",
+                  "share_of_tick"]
+        report = self.report()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerow(dict(report["tick"], component="tick", share_of_tick=1.0))
+            for name, summary in report["components"].items():
+                writer.writerow(dict(summary, component=name))
+
+    def export(self, path):
+        """Export to CSV when the path ends in .csv, JSON otherwise."""
+        if path.endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+
+# Test Suite
+class TestTickProfiler(unittest.TestCase):
+    def test_histogram_buckets_and_percentiles(self):
+        histogram = ComponentHistogram()
+        for duration_ns in [100] * 90 + [10000] * 10:
+            histogram.record(duration_ns)
+        self.assertEqual(histogram.buckets[(100).bit_length()], 90)
+        self.assertEqual(histogram.buckets[(10000).bit_length()], 10)
+        self.assertEqual(sum(histogram.buckets), 100)
+        # Quantiles are the upper bucket edge, capped at the largest duration
+        self.assertEqual(histogram.quantile(0.5), 128)
+        self.assertEqual(histogram.quantile(0.9), 128)
+        self.assertEqual(histogram.quantile(0.99), 10000)
+        summary = histogram.summary()
+        self.assertEqual((summary["count"], summary["min_us"], summary["max_us"]), (100, 0.1, 10.0))
+        self.assertAlmostEqual(summary["mean_us"], 1.09)
+        self.assertEqual(summary["buckets"], {"128": 90, "16384": 10})
+        self.assertEqual(ComponentHistogram().quantile(0.5), 0)
+
+    def test_nested_spans_and_over_budget_ticks(self):
+        sampler = SamplingProfiler(interval_s=0.001, ticks=2)
+        profiler = TickProfiler(enabled=True, tick_budget_s=0.005, sampler=sampler)
+        for sleep_s in (0.0, 0.02, 0.0, 0.0):
+            with profiler.tick():
+                with profiler.span("outer"):
+                    with profiler.span("inner"):
+                        time.sleep(sleep_s)
+        outer, inner = profiler.histograms["outer"], profiler.histograms["inner"]
+        self.assertEqual((outer.count, inner.count, profiler.ticks), (4, 4, 4))
+        self.assertGreaterEqual(outer.total_ns, inner.total_ns)
+        self.assertGreaterEqual(profiler.tick_histogram.total_ns, outer.total_ns)
+        self.assertEqual(profiler.overrun_count, 1)
+        self.assertEqual(profiler.overruns[0]["tick"], 2)
+        self.assertGreater(profiler.overruns[0]["duration_ms"], 5)
+        # The overrun armed the sampler for the two following ticks only
+        self.assertIsNone(sampler._thread)
+        self.assertIn("sampling_profile", profiler.report())
+
+    def test_export_round_trip(self):
+        import os
+        import tempfile
+        profiler = TickProfiler(enabled=True)
+        for _ in range(3):
+            with profiler.tick():
+                with profiler.span("electrolyzer"):
+                    pass
+                with profiler.span("storage"):
+                    pass
+        report = json.loads(json.dumps(profiler.report()))
+        with tempfile.TemporaryDirectory() as directory:
+            json_path, csv_path = os.path.join(directory, "ticks.json"), os.path.join(directory, "ticks.csv")
+            profiler.export(json_path)
+            profiler.export(csv_path)
+            with open(json_path) as f:
+                self.assertEqual(json.load(f), report)
+            with open(csv_path, newline="") as f:
+                rows = {row["component"]: row for row in csv.DictReader(f)}
+        self.assertEqual(list(rows), ["tick", "electrolyzer", "storage"])
+        for name, summary in [("tick", report["tick"])] + list(report["components"].items()):
+            self.assertEqual(int(rows[name]["count"]), summary["count"])
+            self.assertAlmostEqual(float(rows[name]["total_s"]), summary["total_s"])
+            self.assertAlmostEqual(float(rows[name]["p99_us"]), summary["p99_us"])
+        self.assertAlmostEqual(float(rows["electrolyzer"]["share_of_tick"]),
+                               report["components"]["electrolyzer"]["share_of_tick"])
+
+    def test_disabled_profiler_adds_no_spans(self):
+        profiler = TickProfiler()
+        with profiler.tick():
+            with profiler.span("electrolyzer") as span:
+                self.assertIsNone(span)
+        self.assertIs(profiler.span("electrolyzer"), _NULL_CONTEXT)
+        self.assertIs(profiler.tick(), _NULL_CONTEXT)
+        self.assertEqual((profiler.histograms, profiler.ticks, profiler.tick_histogram.count), ({}, 0, 0))
+        self.assertEqual(profiler.report()["components"], {})
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,314 @@
+"""
+Sensor ingestion: MQTT messages -> decoded readings -> batched CentralizedState updates.
+
+The MQTT network thread only does the cheap part of each message:
+- the topic is looked up in a dispatch table. Exact topics are a dict lookup. MQTT wildcard
+  subscriptions (+, #) are compiled to regular expressions once, and their matches are memoized
+  into the same dict.
+- the payload is decoded: a binary frame (see encode_frame), a JSON object with a "value" (and
+  optionally a "timestamp"), or a bare number as published by IoTSensors.
+- the reading is appended to a deque. Appends and pops on a deque are atomic, so the producer and
+  the worker need no lock.
+
+A worker thread drains the deque in batches. It keeps the latest reading per state field and
+applies it through the CentralizedState update_* methods, so a burst of messages costs one state
+update per field. Counters track decode errors, unknown topics, queue drops and the lag between
+receiving and applying a reading. With a TimeSeriesStore attached, every reading of a batch (not
+only the latest) is appended to the history of its state field. With a state estimator attached
+(EnsembleKalmanFilter), the latest readings of each batch are assimilated at the batch time.
+"""
+import json
+import logging
+import re
+import struct
+import threading
+import time
+import unittest
+from collections import deque
+
+from State.CentralizedState import CentralizedState
+
+# Binary sensor frame: magic, channel id, timestamp (s), value
+FRAME = struct.Struct("<2sHdd")
+FRAME_MAGIC = b"SX"
+
+# Subscribed sensor topics (MQTTManager.TOPICS) and the state field each one updates
+SENSOR_TOPICS = {
+    "sensor/electric_charge_sensor_device/electric_charge/#": "Q_electric",
+    "sensor/pressure_sensor_device/pressure/value": "P",
+    "sensor/temp_sensor_device/temperature/value": "T",
+    "sensor/voltage_sensor_device/voltage/value": "V",
+    "sensor/h2o_in_flow_sensor_device/flow_rate/value": "N_H2O_in",
+    "sensor/resistance_sensor_device/resistance/value": "R_PEM",
+    "sensor/current_density_sensor_device/current_density/value": "J",
+    "sensor/h2_out_flow_sensor_device/flow_rate/value": "N_H2_out_dot",
+}
+
+
+def encode_frame(channel, timestamp, value):
+    """Binary sensor frame (20 bytes) for one reading."""
+    return FRAME.pack(FRAME_MAGIC, channel, timestamp, value)
+
+
+def decode_payload(payload):
+    """
+    Decode a sensor payload.
+
+    Returns:
+    - (value, timestamp or None)
+
+    Raises:
+    - ValueError: If the payload is not a binary frame, a JSON reading or a number, or its timestamp
+      is not a number (UNIX s).
+    """
+    if payload[:2] == FRAME_MAGIC and len(payload) == FRAME.size:
+        _, _, timestamp, value = FRAME.unpack(payload)
+        return value, timestamp
+    try:
+        # Bare numbers (IoTSensors payloads) are the common case and parse faster than JSON
+        return float(payload), None
+    except ValueError:
+        pass
+    data = json.loads(payload)
+    if isinstance(data, dict):
+        timestamp = data.get("timestamp")
+        return float(data["value"]), None if timestamp is None else float(timestamp)
+    return float(data), None
+
+
+def _compile_subscription(pattern):
+    # MQTT wildcards: + matches one level, a trailing # matches any remaining levels (including none)
+    parts = [re.escape(part) if part not in ("+", "#") else part for part in pattern.split("/")]
+    regex = "/".join(parts).replace("+", "[^/]+")
+    if regex.endswith("/#"):
+        regex = regex[:-2] + "(?:/.*)?"
+    elif regex == "#":
+        regex = ".*"
+    return re.compile(regex + r"\Z")
+
+
+class SensorIngestor:
+    """
+    Applies sensor messages to a CentralizedState through a lock-free queue and a batching worker.
+
+    Parameters:
+    - state: CentralizedState to update.
+    - topics: Dict of topic (MQTT wildcards allowed) -> state field (default: SENSOR_TOPICS).
+    - batch_size: Maximum readings applied per batch.
+    - max_queue: Readings beyond this queue length are dropped and counted.
+    - poll_interval: Seconds the worker waits for new readings when the queue is empty.
+    - clock: Time source for lag measurements.
+    - history: Optional TimeSeriesStore recording the readings; readings without a timestamp are
+      stamped with the store clock when their batch is applied.
+    - estimator: Optional state estimator with update(t, readings), e.g. EnsembleKalmanFilter.
+    - wall_clock: Time source (UNIX s) of the estimator updates.
+    """
+
+    def __init__(self, state: CentralizedState, topics=None, batch_size=4096, max_queue=1_000_000,
+                 poll_interval=0.01, clock=time.monotonic, history=None, estimator=None, wall_clock=time.time):
+        self.state = state
+        self.history = history
+        self.estimator = estimator
+        self.wall_clock = wall_clock
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+        self.clock = clock
+        topics = SENSOR_TOPICS if topics is None else topics
+        self._exact = {topic: field for topic, field in topics.items() if "+" not in topic and "#" not in topic}
+        self._wildcards = [(_compile_subscription(topic), field) for topic, field in topics.items()
+                           if "+" in topic or "#" in topic]
+        self._apply = {field: getattr(state, f"update_{field}", None) for field in set(topics.values())}
+        self.queue = deque()
+        self.received = 0
+        self.decode_errors = 0
+        self.unknown_topics = 0
+        self.dropped = 0
+        self.applied = 0
+        self.batches = 0
+        self.batch_errors = 0
+        self.last_lag_s = 0.0
+        self.max_lag_s = 0.0
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._worker = None
+
+    def field_for(self, topic):
+        """State field of a topic, or None if no subscription matches it."""
+        field = self._exact.get(topic, False)
+        if field is False:
+            field = next((field for regex, field in self._wildcards if regex.match(topic)), None)
+            self._exact[topic] = field  # Memoize, also misses
+        return field
+
+    def ingest(self, topic, payload, received_at=None):
+        """Decode one message and queue the reading; returns False if it was rejected."""
+        self.received += 1
+        field = self.field_for(topic)
+        if field is None:
+            self.unknown_topics += 1
+            return False
+        try:
+            value, timestamp = decode_payload(payload)
+        except (ValueError, KeyError, TypeError, struct.error) as e:
+            self.decode_errors += 1
+            logging.debug(f"Undecodable payload on {topic}: {e}")
+            return False
+        if len(self.queue) >= self.max_queue:
+            self.dropped += 1
+            return False
+        self.queue.append((field, value, timestamp, self.clock() if received_at is None else received_at))
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+        return True
+
+    def on_message(self, client, userdata, msg):
+        """paho-mqtt on_message callback."""
+        self.ingest(msg.topic, msg.payload)
+
+    def drain(self):
+        """Apply every queued reading now; returns the number of readings taken from the queue."""
+        total = 0
+        while True:
+            count = self._apply_batch()
+            total += count
+            if count < self.batch_size:
+                return total
+
+    def _apply_batch(self):
+        queue = self.queue
+        latest = {}
+        readings = {} if self.history is not None else None
+        count = 0
+        popleft = queue.popleft
+        try:
+            while count < self.batch_size:
+                field, value, timestamp, received_at = popleft()
+                latest[field] = value
+                count += 1
+                if count == 1:
+                    oldest = received_at
+                if readings is not None:
+                    readings.setdefault(field, []).append((timestamp, value))
+        except IndexError:
+            pass
+        if not count:
+            return 0
+        # A failing step is logged and counted, so one bad batch cannot stop the worker or the other steps
+        if readings:
+            try:
+                now = self.history.clock()
+                for field, samples in readings.items():
+                    self.history.extend(field, [now if t is None else t for t, _ in samples],
+                                        [v for _, v in samples])
+            except Exception:
+                self.batch_errors += 1
+                logging.exception("Recording sensor history failed")
+        for field, value in latest.items():
+            try:
+                update = self._apply[field]
+                if update is not None:
+                    update(value)
+                else:
+                    setattr(self.state, field, value)
+            except Exception:
+                self.batch_errors += 1
+                logging.exception(f"Applying {field} = {value!r} failed")
+        if self.estimator is not None:
+            try:
+                self.estimator.update(self.wall_clock(), latest)
+            except Exception:
+                self.batch_errors += 1
+                logging.exception("State estimator update failed")
+        self.applied += count
+        self.batches += 1
+        lag = self.clock() - oldest
+        self.last_lag_s = lag
+        if lag > self.max_lag_s:
+            self.max_lag_s = lag
+        return count
+
+    def _run(self):
+        while not self._stopping:
+            if not self._apply_batch():
+                self._wakeup.clear()
+                # Re-check after clearing so a reading queued in between is not left waiting
+                if not self.queue:
+                    self._wakeup.wait(self.poll_interval)
+        self.drain()
+
+    def start(self):
+        """Start the worker thread that applies readings in the background."""
+        if self._worker is None:
+            self._stopping = False
+            self._worker = threading.Thread(target=self._run, name="SensorIngestor", daemon=True)
+            self._worker.start()
+        return self._worker
+
+    def stop(self, timeout=1.0):
+        """Stop the worker after applying what is queued."""
+        if self._worker is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._worker.join(timeout)
+            self._worker = None
+
+    def stats(self):
+        return {"received": self.received, "applied": self.applied, "batches": self.batches,
+                "queued": len(self.queue), "decode_errors": self.decode_errors, "batch_errors": self.batch_errors,
+                "unknown_topics": self.unknown_topics, "dropped": self.dropped,
+                "last_lag_s": self.last_lag_s, "max_lag_s": self.max_lag_s}
+
+
+# Test Suite
+class TestSensorIngestor(unittest.TestCase):
+    def test_payload_formats_and_wildcards(self):
+        state = CentralizedState()
+        ingestor = SensorIngestor(state)
+        self.assertTrue(ingestor.ingest("sensor/temp_sensor_device/temperature/value", encode_frame(2, 1.0, 333.0)))
+        self.assertTrue(ingestor.ingest("sensor/electric_charge_sensor_device/electric_charge/a/b", b"5"))
+        self.assertTrue(ingestor.ingest("sensor/voltage_sensor_device/voltage/value", b'{"value": 1.8}'))
+        self.assertFalse(ingestor.ingest("sensor/voltage_sensor_device/voltage/value", b"not a number"))
+        self.assertFalse(ingestor.ingest("sensor/unknown", b"1"))
+        self.assertEqual(ingestor.drain(), 3)
+        self.assertEqual((state.T, state.Q_electric, state.V), (333.0, 5.0, 1.8))
+        self.assertEqual((ingestor.decode_errors, ingestor.unknown_topics), (1, 1))
+
+    def test_batch_keeps_latest_reading(self):
+        state = CentralizedState()
+        ingestor = SensorIngestor(state, max_queue=100)
+        for i in range(150):
+            ingestor.ingest("sensor/current_density_sensor_device/current_density/value", str(i).encode())
+        ingestor.drain()
+        self.assertEqual(state.J, 99.0)
+        self.assertEqual((ingestor.applied, ingestor.batches, ingestor.dropped), (100, 1, 50))
+
+    def test_bad_timestamps_and_failing_batches_do_not_stop_the_worker(self):
+        class FailingHistory:
+            clock = staticmethod(time.time)
+
+            def extend(self, field, timestamps, values):
+                raise OSError("disk full")
+
+        state = CentralizedState()
+        ingestor = SensorIngestor(state, history=FailingHistory(), poll_interval=0.001)
+        topic = "sensor/temp_sensor_device/temperature/value"
+        self.assertFalse(ingestor.ingest(topic, b'{"value": 300, "timestamp": "2024-01-01T00:00:00Z"}'))
+        self.assertEqual(ingestor.decode_errors, 1)
+        ingestor.start()
+        try:
+            self.assertTrue(ingestor.ingest(topic, b'{"value": 301, "timestamp": "1700000000"}'))
+            deadline = time.monotonic() + 5
+            while ingestor.applied < 1 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            self.assertTrue(ingestor.ingest(topic, b"302"))
+            while ingestor.applied < 2 and time.monotonic() < deadline:
+                time.sleep(0.001)
+        finally:
+            ingestor.stop()
+        self.assertEqual(state.T, 302.0)
+        self.assertEqual(ingestor.batch_errors, 2)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
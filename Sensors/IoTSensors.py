@@ -1,125 +1,109 @@
+import json
+import time
+
 import paho.mqtt.client as mqtt
 
 from Sensors.MQTTManager import MQTTManager
+from Sensors.PublishingPolicy import PublishAlways
 from State.CentralizedState import CentralizedState
 
 
-class TemperatureSensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_TempSensor"):
-        self.state = state
-        self.mqtt_manager = mqtt_manager
-        self.topic = topic
-
-    def read_and_publish(self):
-        temperature = self.state.T
-        result = self.mqtt_manager.send_sensor_data(device_id="TempSensorDevice", topic=self.topic, payload=temperature)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {temperature}")
-        else:
-            print(f"Failed to Publish Message to {self.topic}")
-
-
-
-
-class ElectricChargeSensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_ElectricChargeSensor"):
-        self.state = state
-        self.mqtt_manager = mqtt_manager
-        self.topic = topic
-
-    def read_and_publish(self):
-        electric_charge = self.state.Q_electric
-        result = self.mqtt_manager.send_sensor_data(device_id="ElectricChargeSensorDevice", topic=self.topic, payload=electric_charge)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {electric_charge}")
-        else:
-            print(f"Failed to Publish Message to {self.topic}")
-
-
-
-class CurrentDensitySensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_CurrentDensitySensor"):
-        self.state = state
-        self.mqtt_manager = mqtt_manager
-        self.topic = topic
-
-    def read_and_publish(self):
-        current_density = self.state.J
-        result = self.mqtt_manager.send_sensor_data(device_id="CurrentDensitySensorDevice", topic=self.topic, payload=current_density)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {current_density}")
-        else:
-            print(f"Failed to Publish Message to {self.topic}")
+class StateSensor:
+    """
+    Publishes one CentralizedState field to the IoT hub, filtered by a publishing policy.
 
+    A reading the policy passes unchanged is published as the bare value, as before. A point the
+    policy publishes for an earlier time or at a corrected value (swinging door) is published as
+    JSON with its timestamp, which SensorIngestor reads.
 
+    Parameters:
+    - state: CentralizedState to read.
+    - mqtt_manager: MQTTManager to publish through.
+    - topic: Topic to publish to (default: the sensor's TOPIC).
+    - policy: PublishPolicy deciding which readings are published (default: every reading).
+    - clock: Time source (s) for the policy intervals and published timestamps.
+    """
 
+    FIELD = None
+    DEVICE_ID = None
+    TOPIC = None
 
-class VoltageSensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_VoltageSensor"):
+    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic=None, policy=None, clock=time.time):
         self.state = state
         self.mqtt_manager = mqtt_manager
-        self.topic = topic
+        self.topic = self.TOPIC if topic is None else topic
+        self.policy = PublishAlways() if policy is None else policy
+        self.clock = clock
 
     def read_and_publish(self):
-        voltage = self.state.V
-        result = self.mqtt_manager.send_sensor_data(device_id="VoltageSensorDevice", topic=self.topic, payload=voltage)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {voltage}")
+        value = getattr(self.state, self.FIELD)
+        if value is None:
+            return None  # Not computed yet
+        reading = float(getattr(value, "magnitude", value))
+        now = self.clock()
+        point = self.policy.offer(now, reading)
+        if point is None:
+            return None
+        if point == (now, reading):
+            return self._send(value)
+        return self._send(json.dumps({"value": point[1], "timestamp": point[0]}))
+
+    def flush(self):
+        """Publish the points the policy still holds back (e.g. at the end of a run); returns the last result."""
+        result = None
+        for point in iter(self.policy.flush, None):
+            result = self._send(json.dumps({"value": point[1], "timestamp": point[0]}))
+        return result
+
+    def _send(self, payload):
+        result = self.mqtt_manager.send_sensor_data(device_id=self.DEVICE_ID, topic=self.topic, payload=payload)
+        if result is not None and result.rc == mqtt.MQTT_ERR_SUCCESS:
+            print(f"Message Published Successfully to {self.topic} with payload {payload}")
         else:
             print(f"Failed to Publish Message to {self.topic}")
+        return result
 
 
+class TemperatureSensor(StateSensor):
+    FIELD = "T"
+    DEVICE_ID = "TempSensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_TempSensor"
 
 
-class HydrogenOutputFlowSensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_HydrogenOutputFlowSensor"):
-        self.state = state
-        self.mqtt_manager = mqtt_manager
-        self.topic = topic
-
-    def read_and_publish(self):
-        hydrogen_flow = self.state.N_H2_out_dot
-        result = self.mqtt_manager.send_sensor_data(device_id="H2OutFlowSensorDevice", topic=self.topic, payload=hydrogen_flow)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {hydrogen_flow}")
-        else:
-            print(f"Failed to Publish Message to {self.topic}")
-
-
+class ElectricChargeSensor(StateSensor):
+    FIELD = "Q_electric"
+    DEVICE_ID = "ElectricChargeSensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_ElectricChargeSensor"
 
 
-class WaterInputFlowSensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_WaterInputFlowSensor"):
-        self.state = state
-        self.mqtt_manager = mqtt_manager
-        self.topic = topic
+class CurrentDensitySensor(StateSensor):
+    FIELD = "J"
+    DEVICE_ID = "CurrentDensitySensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_CurrentDensitySensor"
 
-    def read_and_publish(self):
-        water_flow = self.state.N_H2O_in
-        result = self.mqtt_manager.send_sensor_data(device_id="H2OInFlowSensorDevice", topic=self.topic, payload=water_flow)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {water_flow}")
-        else:
-            print(f"Failed to Publish Message to {self.topic}")
 
+class VoltageSensor(StateSensor):
+    FIELD = "V"
+    DEVICE_ID = "VoltageSensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_VoltageSensor"
 
 
+class HydrogenOutputFlowSensor(StateSensor):
+    FIELD = "N_H2_out_dot"
+    DEVICE_ID = "H2OutFlowSensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_HydrogenOutputFlowSensor"
 
-class ResistanceSensor:
-    def __init__(self, state: CentralizedState, mqtt_manager: MQTTManager, topic="H2PEMHydrogenGenerator_ResistanceSensor"):
-        self.state = state
-        self.mqtt_manager = mqtt_manager
-        self.topic = topic
 
-    def read_and_publish(self):
-        resistance = self.state.R_PEM
-        result = self.mqtt_manager.send_sensor_data(device_id="ResistanceSensorDevice", topic=self.topic, payload=resistance)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"Message Published Successfully to {self.topic} with payload {resistance}")
-        else:
-            print(f"Failed to Publish Message to {self.topic}")
+class WaterInputFlowSensor(StateSensor):
+    FIELD = "N_H2O_in"
+    DEVICE_ID = "H2OInFlowSensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_WaterInputFlowSensor"
 
 
+class ResistanceSensor(StateSensor):
+    FIELD = "R_PEM"
+    DEVICE_ID = "ResistanceSensorDevice"
+    TOPIC = "H2PEMHydrogenGenerator_ResistanceSensor"
 
 
 # class PressureSensor:
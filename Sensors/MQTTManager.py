@@ -1,28 +1,37 @@
 import json
+import logging
+import unittest
 
 import paho.mqtt.client as mqtt
 
 from Sensors.Connection import DEVICE_CONNECTION_STRINGS
+from Sensors.Ingestion import SENSOR_TOPICS, decode_payload
 
 
 class MQTTManager:
-    def __init__(self):
+    TOPICS = list(SENSOR_TOPICS)  # Sensor topics subscribed on connect
+
+    def __init__(self, connect=True, ingestor=None, history=None, recorder=None):
+        """
+        Parameters:
+        - connect: Connect to the broker and the device clients (False gives an offline manager).
+        - ingestor: SensorIngestor that receives the subscribed sensor messages.
+        - history: Optional TimeSeriesStore recording every reading published, per topic; JSON points
+          (e.g. swinging door) are recorded at their own timestamp.
+        - recorder: Optional StreamRecorder logging every received message for offline replay.
+        """
         self.broker_address = "semtex-iot-hub.azure-devices.net"
+        self.ingestor = ingestor
+        self.history = history
+        self.recorder = recorder
+        self.clients = {}
+        self.device_connection_strings = list(self.TOPICS)
         self.client = mqtt.Client("P1")
         self.client.on_connect = self.on_connect
-        self.connect_to_broker()
-        self.clients = {}
-        self.initialize_clients(DEVICE_CONNECTION_STRINGS)
-        self.device_connection_strings = [
-            "sensor/electric_charge_sensor_device/electric_charge/#",
-            "sensor/pressure_sensor_device/pressure/value",
-            "sensor/temp_sensor_device/temperature/value",
-            "sensor/voltage_sensor_device/voltage/value",
-            "sensor/h2o_in_flow_sensor_device/flow_rate/value",
-            "sensor/resistance_sensor_device/resistance/value",
-            "sensor/current_density_sensor_device/current_density/value",
-            "sensor/h2_out_flow_sensor_device/flow_rate/value",
-        ]
+        self.client.on_message = self.on_message
+        if connect:
+            self.connect_to_broker()
+            self.initialize_clients(DEVICE_CONNECTION_STRINGS)
 
     def connect_to_broker(self):
         try:
@@ -53,33 +62,96 @@ class MQTTManager:
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print("Connected to broker")
-            for topic in self.TOPICS:
-                client.subscribe(topic)
+            client.subscribe([(topic, 0) for topic in self.TOPICS])
         else:
             print("Connection failed - Return Code: ", str(rc))
 
     def on_message(self, client, userdata, msg):
-        try:
-            print(msg.topic + " " + str(msg.payload))
-            sensor_data = json.loads(msg.payload.decode())
-            _, device_id, sensor_type, _ = msg.topic.split('/')
-            print(f"Received {sensor_type} data from {device_id}: {sensor_data}")
-
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON: {e}")
-        except Exception as e:
-            print(f"Error processing message: {e}")
+        # Runs on the network thread: hand the message to the ingestor, which decodes and queues it
+        if self.recorder is not None:
+            self.recorder.record(msg.topic, msg.payload)
+        if self.ingestor is not None:
+            self.ingestor.ingest(msg.topic, msg.payload)
+        else:
+            logging.debug(f"No ingestor attached; dropped message on {msg.topic}")
 
     def send_sensor_data(self, device_id, topic, payload):
+        if self.history is not None:
+            self.record(topic, payload)
         if device_id in self.clients:
             return self.clients[device_id].publish(topic,   payload)
         else:
             print(f"Device {device_id} is not initialized.")
             return None
 
+    def record(self, topic, payload):
+        """Append the reading of a published payload (number, pint Quantity or sensor JSON) to the history."""
+        payload = getattr(payload, "magnitude", payload)
+        try:
+            if isinstance(payload, (int, float)):
+                value, timestamp = float(payload), None
+            else:
+                value, timestamp = decode_payload(payload)
+        except (ValueError, TypeError, KeyError):
+            logging.debug(f"Payload on {topic} is not a reading; not recorded")
+            return
+        self.history.append(topic, value, t=timestamp)
+
     def stop_clients(self):
         for client in self.clients.values():
             client.loop_stop()
             client.disconnect()
         self.client.loop_stop()
         self.client.disconnect()
+
+
+# Test Suite
+class TestMQTTManagerHistory(unittest.TestCase):
+    class RecordingHistory:
+        def __init__(self):
+            self.samples = []
+
+        def append(self, channel, value, t=None):
+            self.samples.append((channel, value, t))
+            return True
+
+    def setUp(self):
+        self.history = self.RecordingHistory()
+        self.manager = MQTTManager(connect=False, history=self.history)
+
+    def test_numbers_and_quantities_are_recorded(self):
+        from pint import UnitRegistry
+        ureg = UnitRegistry()
+        self.manager.send_sensor_data("device", "T", 300)
+        self.manager.send_sensor_data("device", "T", 300.5 * ureg.kelvin)
+        self.assertEqual(self.history.samples, [("T", 300.0, None), ("T", 300.5, None)])
+
+    def test_json_points_are_recorded_at_their_timestamp(self):
+        self.manager.send_sensor_data("device", "V", json.dumps({"value": 1.8, "timestamp": 1700000000.0}))
+        self.manager.send_sensor_data("device", "V", "1.9")
+        self.assertEqual(self.history.samples, [("V", 1.8, 1700000000.0), ("V", 1.9, None)])
+
+    def test_payloads_without_a_reading_are_not_recorded(self):
+        for payload in ("not a reading", json.dumps({"timestamp": 1.0}), None):
+            self.manager.send_sensor_data("device", "V", payload)
+        self.assertEqual(self.history.samples, [])
+
+    def test_swinging_door_and_heartbeat_points_are_recorded(self):
+        from Sensors.IoTSensors import VoltageSensor
+        from Sensors.PublishingPolicy import SwingingDoorPolicy
+        from State.CentralizedState import CentralizedState
+
+        state = CentralizedState(initial_values={'V': 1.0})
+        clock = iter(range(100)).__next__
+        sensor = VoltageSensor(state, self.manager, policy=SwingingDoorPolicy(0.01, max_interval=50), clock=clock)
+        for value in (1.0, 1.1, 1.2, 1.0, 1.0):
+            state.update_V(value)
+            sensor.read_and_publish()
+        sensor.flush()
+        published = [(t, value) for _, value, t in self.history.samples]
+        self.assertEqual(published[0], (None, 1.0))
+        self.assertEqual(published[1:], [(2.0, 1.2), (3.0, 1.0), (4.0, 1.0)])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,303 @@
+"""
+Publishing policies: decide per reading whether a sensor publishes, in constant time.
+
+- PublishAlways: every reading (the behaviour of the sensors without a policy).
+- DeadbandPolicy: publish when the value moved more than an absolute and/or relative deadband
+  from the last published value.
+- SwingingDoorPolicy: swinging-door compression. The published points, joined by straight lines,
+  stay within `deviation` of every reading. A reading is held back until a later one shows that
+  no line from the last published point can cover both. Then the held reading is published with
+  its own timestamp, moved onto the door line (by at most `deviation`) so the bound holds.
+
+All policies also take a minimum interval between publishes and a heartbeat (maximum interval),
+after which the current reading is published even if nothing changed. A swinging door publishes
+its held point on a heartbeat instead, and keeps narrowing its doors during the minimum interval:
+points found meanwhile are queued and published once the interval allows, so the minimum
+interval delays its points but does not change them, and the deviation bound still holds.
+
+A policy returns the point to publish from offer(t, value), or None when the reading is
+suppressed, and counts readings, publishes and suppressions for tuning bandwidth against fidelity.
+"""
+import math
+import unittest
+from collections import deque
+
+
+class PublishPolicy:
+    """
+    Base policy with the minimum interval, heartbeat and statistics; publishes every reading.
+
+    Parameters:
+    - min_interval: Readings within this many seconds of the last publish are suppressed.
+    - max_interval: Heartbeat; a reading this many seconds after the last publish is always published (None: never).
+    """
+
+    def __init__(self, min_interval=0.0, max_interval=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.last_t = None
+        self.last_value = None
+        self.readings = 0
+        self.published = 0
+        self.heartbeats = 0
+        self.max_suppressed_deviation = 0.0  # Largest suppressed change from the last published value
+
+    def offer(self, t, value):
+        """Return the (t, value) point to publish for this reading, or None if it is suppressed."""
+        self.readings += 1
+        if self.last_t is None:
+            return self._publish(t, value)
+        elapsed = t - self.last_t
+        if self.max_interval is not None and elapsed >= self.max_interval:
+            self.heartbeats += 1
+            return self._publish(*self._heartbeat(t, value))
+        if elapsed < self.min_interval:
+            self._track(t, value)
+            return self._suppress(value)
+        point = self._decide(t, value)
+        return self._suppress(value) if point is None else self._publish(*point)
+
+    def _decide(self, t, value):
+        return t, value
+
+    def _heartbeat(self, t, value):
+        return t, value
+
+    def _track(self, t, value):
+        # Reading suppressed by the minimum interval
+        pass
+
+    def _publish(self, t, value):
+        self.published += 1
+        self.last_t = t
+        self.last_value = value
+        self._reset(t, value)
+        return t, value
+
+    def _reset(self, t, value):
+        pass
+
+    def _suppress(self, value):
+        deviation = abs(value - self.last_value)
+        if deviation > self.max_suppressed_deviation:
+            self.max_suppressed_deviation = deviation
+        return None
+
+    def flush(self):
+        """Point still held back at the end of a run, or None."""
+        return None
+
+    def stats(self):
+        suppressed = self.readings - self.published
+        return {"readings": self.readings, "published": self.published, "suppressed": suppressed,
+                "suppression_ratio": suppressed / self.readings if self.readings else 0.0,
+                "heartbeats": self.heartbeats, "max_suppressed_deviation": self.max_suppressed_deviation}
+
+
+class PublishAlways(PublishPolicy):
+    """Publish every reading."""
+
+
+class DeadbandPolicy(PublishPolicy):
+    """
+    Publish when |value - last published| exceeds max(absolute, relative * |last published|).
+
+    Parameters:
+    - absolute: Absolute deadband in the unit of the reading.
+    - relative: Deadband as a fraction of the last published value.
+    - min_interval / max_interval: As in PublishPolicy.
+    """
+
+    def __init__(self, absolute=0.0, relative=0.0, min_interval=0.0, max_interval=None):
+        super().__init__(min_interval, max_interval)
+        self.absolute = absolute
+        self.relative = relative
+
+    def _decide(self, t, value):
+        band = max(self.absolute, self.relative * abs(self.last_value))
+        return (t, value) if abs(value - self.last_value) > band else None
+
+
+class SwingingDoorPolicy(PublishPolicy):
+    """
+    Swinging-door compression with a deviation limit.
+
+    The doors are measured from the latest point found, which is the last published point unless
+    the minimum interval holds points back. Those wait in a FIFO queue and are published one per
+    offer once the interval allows. Every reading is examined once, so a reading costs O(1) whatever
+    the interval; the queue grows only while the interval runs, by at most one point per reading.
+
+    Parameters:
+    - deviation: Maximum distance of a reading from the line between the published points.
+    - min_interval / max_interval: As in PublishPolicy.
+    """
+
+    def __init__(self, deviation, min_interval=0.0, max_interval=None):
+        super().__init__(min_interval, max_interval)
+        self.deviation = deviation
+        self.origin = None  # Point the doors open from: the last published or queued point
+        self.held = None  # Latest reading inside the doors, which becomes a point when they close
+        self.slope_low = -math.inf
+        self.slope_high = math.inf
+        self._queued = deque()  # Points found while the minimum interval delayed their publish
+
+    def _open(self, t, value):
+        self.origin = (t, value)
+        self.held = None
+        self.slope_low = -math.inf
+        self.slope_high = math.inf
+
+    def _doors(self, t, value):
+        """Door slopes after a reading, or None if the doors close on it."""
+        origin_t, origin_value = self.origin
+        elapsed = t - origin_t
+        if elapsed <= 0:
+            return (self.slope_low, self.slope_high) if abs(value - origin_value) <= self.deviation else None
+        low = max(self.slope_low, (value - self.deviation - origin_value) / elapsed)
+        high = min(self.slope_high, (value + self.deviation - origin_value) / elapsed)
+        return (low, high) if low <= high else None
+
+    def _hold(self, t, value):
+        """Narrow the doors to a reading and hold it; False if the doors close on it."""
+        doors = self._doors(t, value)
+        if doors is None:
+            return False
+        self.slope_low, self.slope_high = doors
+        self.held = (t, value)
+        return True
+
+    def _close(self):
+        """Queue the held reading, moved onto the door line, and open the doors from it."""
+        point = self._on_doors(*self.held)
+        self._queued.append(point)
+        self._open(*point)
+
+    def _feed(self, t, value):
+        if self._hold(t, value):
+            return
+        if self.held is None:
+            # The doors closed on the first reading after the origin, which becomes a point as it is
+            self._queued.append((t, value))
+            self._open(t, value)
+            return
+        self._close()
+        # A reading after the new origin always fits between freshly opened doors
+        self._hold(t, value)
+
+    def _reset(self, t, value):
+        if not self._queued and self.held is None:
+            # A reading published as it is (first reading or heartbeat) is the new origin
+            self._open(t, value)
+
+    def _decide(self, t, value):
+        self._feed(t, value)
+        return self._queued.popleft() if self._queued else None
+
+    def _heartbeat(self, t, value):
+        # Publish the held point first, so the line to it still covers the readings in between
+        if not self._queued:
+            if self.held is None:
+                return t, value
+            self._close()
+        self._feed(t, value)
+        return self._queued.popleft()
+
+    def _track(self, t, value):
+        self._feed(t, value)
+
+    def _on_doors(self, t, value):
+        # The point at time t on the line between the doors closest to the reading; the line from the
+        # origin to it stays within the deviation of every reading in between
+        origin_t, origin_value = self.origin
+        elapsed = t - origin_t
+        if elapsed <= 0:
+            return t, value
+        slope = min(max((value - origin_value) / elapsed, self.slope_low), self.slope_high)
+        return t, origin_value + slope * elapsed
+
+    def flush(self):
+        """Next point still held back at the end of a run, or None; call until it returns None."""
+        if not self._queued:
+            if self.held is None:
+                return None
+            self._close()
+        return self._publish(*self._queued.popleft())
+
+
+# Test Suite
+class TestPublishingPolicies(unittest.TestCase):
+    def test_deadband_and_heartbeat(self):
+        policy = DeadbandPolicy(absolute=0.5, max_interval=10)
+        published = [policy.offer(t, value) for t, value in enumerate([1.0, 1.2, 1.4, 1.6, 1.6, 1.6])]
+        self.assertEqual([point is not None for point in published], [True, False, False, True, False, False])
+        self.assertEqual(policy.offer(13, 1.6), (13, 1.6))
+        self.assertEqual(policy.stats()["heartbeats"], 1)
+        self.assertEqual(policy.stats()["suppressed"], 4)
+        self.assertAlmostEqual(policy.max_suppressed_deviation, 0.4)
+
+    def test_swinging_door_stays_within_deviation(self):
+        import numpy as np
+        t = np.arange(2000.0)
+        values = np.sin(t / 50.0) + 0.01 * np.cos(t * 7.0)
+        policy = SwingingDoorPolicy(deviation=0.05)
+        points = [point for point in (policy.offer(ti, vi) for ti, vi in zip(t.tolist(), values.tolist()))
+                  if point is not None]
+        points.append(policy.flush())
+        self.assertLess(len(points), len(t) / 10)
+        point_t, point_values = np.array(points).T
+        self.assertTrue(np.all(np.diff(point_t) > 0))
+        reconstructed = np.interp(t, point_t, point_values)
+        self.assertLessEqual(np.max(np.abs(reconstructed - values)), 0.05 + 1e-12)
+
+    @staticmethod
+    def _max_error(policy, values):
+        import numpy as np
+        t = np.arange(float(len(values)))
+        points = [point for point in (policy.offer(ti, vi) for ti, vi in zip(t.tolist(), values.tolist()))
+                  if point is not None]
+        points.extend(iter(policy.flush, None))
+        point_t, point_values = np.array(points).T
+        covered = t <= point_t[-1]
+        return np.max(np.abs(np.interp(t[covered], point_t, point_values) - values[covered]))
+
+    def test_swinging_door_heartbeat_publishes_held_point_first(self):
+        import numpy as np
+        values = np.concatenate([np.linspace(0.0, 0.9, 10), np.full(30, 0.9)])
+        policy = SwingingDoorPolicy(deviation=0.05, max_interval=10)
+        self.assertLessEqual(self._max_error(policy, values), 0.05 + 1e-12)
+        self.assertGreater(policy.heartbeats, 0)
+
+        walk = np.cumsum(np.random.default_rng(0).normal(0.0, 0.1, 2000))
+        self.assertLessEqual(self._max_error(SwingingDoorPolicy(deviation=0.1, max_interval=9), walk), 0.1 + 1e-12)
+
+    def test_swinging_door_narrows_doors_during_min_interval(self):
+        import numpy as np
+        walk = np.cumsum(np.random.default_rng(0).normal(0.0, 0.1, 2000))
+        policy = SwingingDoorPolicy(deviation=0.1, min_interval=4)
+        self.assertLessEqual(self._max_error(policy, walk), 0.1 + 1e-12)
+        self.assertGreater(policy.stats()["suppressed"], 1000)
+
+    def test_swinging_door_long_min_interval_queues_points_not_readings(self):
+        import numpy as np
+        walk = np.cumsum(np.random.default_rng(1).normal(0.0, 0.1, 5000))
+        unlimited = SwingingDoorPolicy(deviation=0.1)
+        expected = [point for point in (unlimited.offer(t, value) for t, value in enumerate(walk.tolist()))
+                    if point is not None]
+        expected.extend(iter(unlimited.flush, None))
+
+        policy = SwingingDoorPolicy(deviation=0.1, min_interval=60)
+        points, longest_queue = [], 0
+        for t, value in enumerate(walk.tolist()):
+            point = policy.offer(t, value)
+            if point is not None:
+                points.append(point)
+            longest_queue = max(longest_queue, len(policy._queued))
+        points.extend(iter(policy.flush, None))
+        # The interval delays the points but finds the same ones, and queues at most one per reading in it
+        self.assertEqual(points, expected)
+        self.assertGreater(longest_queue, 1)
+        self.assertLessEqual(longest_queue, 60)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
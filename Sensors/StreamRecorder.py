@@ -0,0 +1,332 @@
+"""
+Record and replay sensor message streams.
+
+StreamRecorder writes (timestamp, topic, payload) tuples to a compact binary log. The log is a
+file header followed by records:
+- topic record: kind 0, topic id, name length, then the UTF-8 topic name. It is written the first
+  time a topic appears, so messages only carry a 2-byte id.
+- message record: kind 1, timestamp (UNIX s), topic id, payload length, then the raw payload.
+Records are appended through a buffered file. A truncated record at the end of the log (e.g.
+after a crash) is ignored when reading.
+
+StreamReplayer feeds a log back in file order, which is the order the messages were received in,
+so every replay is deterministic. Messages go either to an on_message callback
+(MQTTManager.on_message, SensorIngestor.on_message) or straight into a CentralizedState, at the
+recorded pace (speed 1), N times faster (speed N) or as fast as possible (speed None). No network
+is needed, so sensor/controller pipelines can be benchmarked repeatably offline.
+
+Usage (from the repository root):
+    python -m Sensors.StreamRecorder sensors.sxrl --speed 10
+    python -m Sensors.StreamRecorder sensors.sxrl --max-speed
+"""
+import argparse
+import json
+import os
+import struct
+import time
+import unittest
+
+from Sensors.Ingestion import SensorIngestor
+from State.CentralizedState import CentralizedState
+
+LOG_MAGIC = b"SXRL"
+LOG_VERSION = 1
+_LOG_HEADER = struct.Struct("<4sH")
+_TOPIC_RECORD = struct.Struct("<BHH")  # kind, topic id, name length
+_MESSAGE_RECORD = struct.Struct("<BdHI")  # kind, timestamp, topic id, payload length
+TOPIC_KIND = 0
+MESSAGE_KIND = 1
+
+
+class StreamLogError(Exception):
+    pass
+
+
+def _payload_bytes(payload):
+    # Same conversion as paho-mqtt's publish()
+    if isinstance(payload, (bytes, bytearray)):
+        return bytes(payload)
+    if isinstance(payload, str):
+        return payload.encode()
+    if isinstance(payload, (int, float)):
+        return str(payload).encode()
+    raise TypeError(f"Unsupported payload type {type(payload).__name__}.")
+
+
+class StreamRecorder:
+    """
+    Appends sensor messages to a binary stream log.
+
+    Parameters:
+    - path: Log file path; an existing log is appended to.
+    - clock: Time source (UNIX s) for messages recorded without a timestamp.
+    - buffer_size: Write buffer in bytes.
+    """
+
+    def __init__(self, path, clock=time.time, buffer_size=1 << 20):
+        self.path = path
+        self.clock = clock
+        self.messages = 0
+        self._topics = {}
+        valid_end = 0
+        if os.path.exists(path):
+            topics, _, valid_end = _scan(path)
+            self._topics = {topic: topic_id for topic_id, topic in topics.items()}
+            if os.path.getsize(path) > valid_end:
+                # Drop an incomplete record so new records follow the last good one
+                with open(path, "r+b") as f:
+                    f.truncate(valid_end)
+        self._file = open(path, "ab", buffering=buffer_size)
+        if valid_end == 0:
+            self._file.write(_LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+
+    def record(self, topic, payload, timestamp=None):
+        """Append one message."""
+        topic_id = self._topics.get(topic)
+        if topic_id is None:
+            topic_id = self._topics[topic] = len(self._topics)
+            name = topic.encode()
+            self._file.write(_TOPIC_RECORD.pack(TOPIC_KIND, topic_id, len(name)) + name)
+        payload = _payload_bytes(payload)
+        self._file.write(_MESSAGE_RECORD.pack(MESSAGE_KIND, self.clock() if timestamp is None else timestamp, topic_id,
+                                              len(payload)))
+        self._file.write(payload)
+        self.messages += 1
+
+    def on_message(self, client, userdata, msg):
+        """paho-mqtt on_message callback."""
+        self.record(msg.topic, msg.payload)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _scan(path):
+    """Topics, messages and the end of the last complete record of a stream log."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _LOG_HEADER.size:
+        return {}, [], 0
+    magic, version = _LOG_HEADER.unpack_from(data)
+    if magic != LOG_MAGIC or version != LOG_VERSION:
+        raise StreamLogError(f"{path} is not a version {LOG_VERSION} stream log.")
+    topics = {}
+    messages = []
+    position = _LOG_HEADER.size
+    end = len(data)
+    while position < end:
+        kind = data[position]
+        record = _MESSAGE_RECORD if kind == MESSAGE_KIND else _TOPIC_RECORD if kind == TOPIC_KIND else None
+        if record is None:
+            raise StreamLogError(f"Corrupt record at byte {position} of {path}.")
+        if position + record.size > end:
+            break
+        fields = record.unpack_from(data, position)
+        length = fields[-1]
+        body = position + record.size
+        if body + length > end:
+            break  # Truncated tail from an interrupted write
+        if kind == MESSAGE_KIND:
+            topic = topics.get(fields[2])
+            if topic is None:
+                raise StreamLogError(f"Message at byte {position} of {path} refers to unknown topic id {fields[2]}.")
+            messages.append((fields[1], topic, data[body:body + length]))
+        else:
+            topics[fields[1]] = data[body:body + length].decode()
+        position = body + length
+    return topics, messages, position
+
+
+def read_log(path):
+    """
+    Messages of a stream log as a list of (timestamp, topic, payload), in file order.
+
+    Raises:
+    - StreamLogError: If the file is not a stream log or a record is corrupt.
+    """
+    return _scan(path)[1]
+
+
+class ReplayedMessage:
+    """Minimal stand-in for paho-mqtt's MQTTMessage."""
+
+    __slots__ = ("topic", "payload", "timestamp", "qos", "retain")
+
+    def __init__(self, topic, payload, timestamp):
+        self.topic = topic
+        self.payload = payload
+        self.timestamp = timestamp
+        self.qos = 0
+        self.retain = False
+
+
+class StreamReplayer:
+    """
+    Replays a stream log.
+
+    Parameters:
+    - path: Log file path; the messages are loaded into memory once, so file reads are not timed.
+    - speed: Replay speed relative to the recording (1: real time, N: N times faster, None: as fast as possible).
+    - clock / sleep: Time source and sleep function used for pacing.
+    """
+
+    def __init__(self, path, speed=1.0, clock=time.perf_counter, sleep=time.sleep):
+        self.messages = read_log(path)
+        self.speed = speed
+        self.clock = clock
+        self.sleep = sleep
+        self.last_run = None
+
+    def _paced(self):
+        if not self.messages:
+            return
+        first = self.messages[0][0]
+        start = self.clock()
+        behind = 0.0
+        for timestamp, topic, payload in self.messages:
+            if self.speed is not None:
+                due = start + (timestamp - first) / self.speed
+                wait = due - self.clock()
+                if wait > 0:
+                    self.sleep(wait)
+                elif -wait > behind:
+                    behind = -wait
+            yield timestamp, topic, payload
+        self.last_run["max_behind_s"] = behind
+
+    def replay(self, on_message, client=None, userdata=None):
+        """
+        Deliver every message to an on_message(client, userdata, msg) callback.
+
+        Returns:
+        - Dict with the message count, elapsed time, message rate and how far the replay fell behind schedule.
+        """
+        self.last_run = {"messages": 0}
+        start = self.clock()
+        for timestamp, topic, payload in self._paced():
+            on_message(client, userdata, ReplayedMessage(topic, payload, timestamp))
+            self.last_run["messages"] += 1
+        return self._finish(start)
+
+    def replay_into_state(self, state: CentralizedState, topics=None):
+        """
+        Apply every message directly to a CentralizedState, one update per message.
+
+        Parameters:
+        - topics: Dict of topic -> state field, as for SensorIngestor (default: SENSOR_TOPICS).
+        """
+        ingestor = SensorIngestor(state, topics=topics, batch_size=1)
+        self.last_run = {"messages": 0}
+        start = self.clock()
+        for timestamp, topic, payload in self._paced():
+            if ingestor.ingest(topic, payload):
+                ingestor.drain()
+            self.last_run["messages"] += 1
+        self.last_run["rejected"] = ingestor.decode_errors + ingestor.unknown_topics
+        return self._finish(start)
+
+    def _finish(self, start):
+        elapsed = self.clock() - start
+        run = self.last_run
+        run.setdefault("max_behind_s", 0.0)
+        run["elapsed_s"] = elapsed
+        run["messages_per_s"] = run["messages"] / elapsed if elapsed > 0 else float("inf")
+        if self.messages:
+            run["recorded_span_s"] = self.messages[-1][0] - self.messages[0][0]
+        return run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a sensor stream log through the ingestion path.")
+    parser.add_argument("log", help="Stream log written by StreamRecorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed relative to the recording")
+    parser.add_argument("--max-speed", action="store_true", help="Replay as fast as possible")
+    args = parser.parse_args(argv)
+
+    replayer = StreamReplayer(args.log, speed=None if args.max_speed else args.speed)
+    ingestor = SensorIngestor(CentralizedState())
+    ingestor.start()
+    run = replayer.replay(ingestor.on_message)
+    ingestor.stop()
+    run["ingestor"] = ingestor.stats()
+    print(json.dumps(run, indent=2))
+    return run
+
+
+# Test Suite (python -m unittest Sensors.StreamRecorder)
+class TestStreamRecorder(unittest.TestCase):
+    TEMPERATURE = "sensor/temp_sensor_device/temperature/value"
+    VOLTAGE = "sensor/voltage_sensor_device/voltage/value"
+
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "sensors.sxrl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_reuses_topic_ids_and_recovers_truncated_tail(self):
+        with StreamRecorder(self.path) as recorder:
+            recorder.record(self.TEMPERATURE, b"300", timestamp=1.0)
+            recorder.record(self.VOLTAGE, "1.9", timestamp=2.0)
+            recorder.record(self.TEMPERATURE, 301.5, timestamp=3.0)
+        messages = read_log(self.path)
+        self.assertEqual(messages, [(1.0, self.TEMPERATURE, b"300"), (2.0, self.VOLTAGE, b"1.9"),
+                                    (3.0, self.TEMPERATURE, b"301.5")])
+        topics, _, end = _scan(self.path)
+        self.assertEqual(topics, {0: self.TEMPERATURE, 1: self.VOLTAGE})  # One topic record per topic
+
+        # Cut the last message short, as a crash during a write would
+        with open(self.path, "r+b") as f:
+            f.truncate(end - 2)
+        self.assertEqual(len(read_log(self.path)), 2)
+        with StreamRecorder(self.path) as recorder:
+            recorder.record(self.VOLTAGE, b"1.95", timestamp=4.0)
+            recorder.record("sensor/new/value", b"1", timestamp=5.0)
+        messages = read_log(self.path)
+        self.assertEqual([m[0] for m in messages], [1.0, 2.0, 4.0, 5.0])
+        self.assertEqual(messages[2], (4.0, self.VOLTAGE, b"1.95"))
+        self.assertEqual(_scan(self.path)[0], {0: self.TEMPERATURE, 1: self.VOLTAGE, 2: "sensor/new/value"})
+
+    def test_unknown_topic_id_is_a_log_error(self):
+        with open(self.path, "wb") as f:
+            f.write(_LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+            f.write(_MESSAGE_RECORD.pack(MESSAGE_KIND, 1.0, 7, 3) + b"300")
+        with self.assertRaises(StreamLogError):
+            read_log(self.path)
+
+    def test_replay_into_state_applies_messages_in_recorded_order(self):
+        applied = []
+
+        class RecordingState(CentralizedState):
+            def update_T(self, new_T):
+                applied.append(("T", new_T))
+                super().update_T(new_T)
+
+            def update_V(self, new_V):
+                applied.append(("V", new_V))
+                super().update_V(new_V)
+
+        with StreamRecorder(self.path) as recorder:
+            for i, (topic, value) in enumerate([(self.TEMPERATURE, 300), (self.VOLTAGE, 1.9), (self.TEMPERATURE, 302),
+                                                ("sensor/unknown/value", 1), (self.TEMPERATURE, 301)]):
+                recorder.record(topic, value, timestamp=float(i))
+        state = RecordingState()
+        run = StreamReplayer(self.path, speed=None).replay_into_state(state)
+        self.assertEqual(applied, [("T", 300.0), ("V", 1.9), ("T", 302.0), ("T", 301.0)])
+        self.assertEqual(state.T, 301.0)
+        self.assertEqual((run["messages"], run["rejected"]), (5, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+"""
+Single-pass, mergeable statistics over energy difference time series.
+
+EnergyStats consumes (timestamps, values) chunks in time order and keeps only fixed-size
+accumulators, so a difference file of any length is summarized in one pass with bounded
+memory. Two EnergyStats can be merged:
+- sequentially, when the second covers the period right after the first (chunks or
+  consecutive files of one site), which gives the same result as one pass over both;
+- as independent sites (sequential=False), for fleet summaries computed in parallel.
+
+The required storage is the largest drop of the cumulative energy balance (the maximum
+drawdown), which merges through (sum, max prefix, min prefix, drawdown) per segment.
+Quantiles come from a DDSketch-style log-bucketed sketch with a relative accuracy guarantee.
+"""
+import math
+import os
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Utils.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+MJ_PER_MWH = 3600
+SEASONS = {"winter": (12, 1, 2), "spring": (3, 4, 5), "summer": (6, 7, 8), "autumn": (9, 10, 11)}
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative accuracy `relative_accuracy` (DDSketch buckets).
+
+    Values are mapped to logarithmic buckets separately for positive and negative values;
+    values with a magnitude below `min_magnitude` are counted as zero.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_magnitude=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_magnitude = min_magnitude
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}  # bucket index -> count
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _add_to_store(self, store, magnitudes):
+        indices, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64),
+                                    return_counts=True)
+        for index, n in zip(indices.tolist(), counts.tolist()):
+            store[index] = store.get(index, 0) + n
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += values.size
+        positive = values[values >= self.min_magnitude]
+        negative = -values[values <= -self.min_magnitude]
+        self.zero_count += values.size - positive.size - negative.size
+        if positive.size:
+            self._add_to_store(self.positive, positive)
+        if negative.size:
+            self._add_to_store(self.negative, negative)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracies.")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, n in other_store.items():
+                store[index] = store.get(index, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def _bucket_value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float("nan")
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):  # Most negative first
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._bucket_value(index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._bucket_value(index)
+        return self._bucket_value(max(self.positive)) if self.positive else 0.0
+
+
+class EnergyStats:
+    """
+    Accumulated statistics of an energy difference series in MJ (supplied minus demanded).
+
+    Feed chunks in time order with update(timestamps, values); read the results from the
+    attributes, summary() or str().
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.total = 0.0
+        self.negative_sum = 0.0
+        self.positive_sum = 0.0
+        self.min = math.inf
+        self.min_timestamp = None
+        self.max = -math.inf
+        self.max_timestamp = None
+        self.first_timestamp = None
+        self.last_timestamp = None
+        # Per month of the year (index 0 = January)
+        self.monthly_count = np.zeros(12, dtype=np.int64)
+        self.monthly_total = np.zeros(12)
+        self.monthly_negative = np.zeros(12)
+        self.monthly_positive = np.zeros(12)
+        # Deficit streaks, in samples: longest, at the start, at the end of the series so far
+        self.longest_deficit_streak = 0
+        self.leading_deficit_streak = 0
+        self.trailing_deficit_streak = 0
+        # Cumulative balance of the series so far, relative to its start
+        self.max_prefix = 0.0
+        self.min_prefix = 0.0
+        self.required_storage = 0.0  # Largest drop of the cumulative balance (MJ)
+        self.sites = 1
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, timestamps, values):
+        """Add a chunk that follows everything seen so far in time."""
+        chunk = EnergyStats(self.sketch.relative_accuracy)
+        chunk._summarize(np.asarray(timestamps, dtype='datetime64[ns]'), np.asarray(values, dtype=np.float64))
+        self.merge(chunk)
+
+    def _summarize(self, timestamps, values):
+        n = values.size
+        if n == 0:
+            return
+        self.count = n
+        self.total = float(values.sum())
+        self.negative_sum = float(values[values < 0].sum())
+        self.positive_sum = float(values[values > 0].sum())
+        min_index, max_index = int(values.argmin()), int(values.argmax())
+        self.min, self.min_timestamp = float(values[min_index]), timestamps[min_index]
+        self.max, self.max_timestamp = float(values[max_index]), timestamps[max_index]
+        self.first_timestamp, self.last_timestamp = timestamps[0], timestamps[-1]
+
+        months = timestamps.astype('datetime64[M]').astype(np.int64) % 12
+        self.monthly_count = np.bincount(months, minlength=12)
+        self.monthly_total = np.bincount(months, weights=values, minlength=12)
+        self.monthly_negative = np.bincount(months, weights=np.minimum(values, 0.0), minlength=12)
+        self.monthly_positive = np.bincount(months, weights=np.maximum(values, 0.0), minlength=12)
+
+        deficit = values < 0
+        if deficit.all():
+            self.longest_deficit_streak = self.leading_deficit_streak = self.trailing_deficit_streak = n
+        elif deficit.any():
+            # Run lengths of consecutive deficit samples
+            edges = np.diff(np.concatenate(([0], deficit.view(np.int8), [0])))
+            starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            self.longest_deficit_streak = int((ends - starts).max())
+            self.leading_deficit_streak = int(ends[0]) if starts[0] == 0 else 0
+            self.trailing_deficit_streak = int(n - starts[-1]) if ends[-1] == n else 0
+
+        cumulative = np.concatenate(([0.0], np.cumsum(values)))
+        self.max_prefix = float(cumulative.max())
+        self.min_prefix = float(cumulative.min())
+        self.required_storage = float((np.maximum.accumulate(cumulative) - cumulative).max())
+        self.sketch.update(values)
+
+    def merge(self, other, sequential=True):
+        """
+        Merge another EnergyStats into this one.
+
+        Parameters:
+        - other: EnergyStats to merge.
+        - sequential: True when other covers the period right after this one (same site);
+          False when other is an independent site. Independent sites each need their own
+          storage, so their required storage adds up, and the longest streak is the longest of any site.
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update({k: v.copy() if isinstance(v, np.ndarray) else v for k, v in other.__dict__.items()
+                                  if k != "sketch"})
+            self.sketch.merge(other.sketch)
+            return self
+
+        if sequential:
+            self.longest_deficit_streak = max(self.longest_deficit_streak, other.longest_deficit_streak,
+                                              self.trailing_deficit_streak + other.leading_deficit_streak)
+            if self.leading_deficit_streak == self.count:
+                self.leading_deficit_streak += other.leading_deficit_streak
+            self.trailing_deficit_streak = other.trailing_deficit_streak if other.trailing_deficit_streak < other.count \
+                else self.trailing_deficit_streak + other.count
+            self.required_storage = max(self.required_storage, other.required_storage,
+                                        self.max_prefix - (self.total + other.min_prefix))
+            self.max_prefix, self.min_prefix = (max(self.max_prefix, self.total + other.max_prefix),
+                                                min(self.min_prefix, self.total + other.min_prefix))
+        else:
+            self.longest_deficit_streak = max(self.longest_deficit_streak, other.longest_deficit_streak)
+            self.leading_deficit_streak = self.trailing_deficit_streak = 0
+            self.required_storage += other.required_storage
+            self.max_prefix = self.min_prefix = math.nan  # Undefined across sites
+            self.sites += other.sites
+
+        self.count += other.count
+        self.total += other.total
+        self.negative_sum += other.negative_sum
+        self.positive_sum += other.positive_sum
+        if other.min < self.min:
+            self.min, self.min_timestamp = other.min, other.min_timestamp
+        if other.max > self.max:
+            self.max, self.max_timestamp = other.max, other.max_timestamp
+        self.first_timestamp = min(self.first_timestamp, other.first_timestamp)
+        self.last_timestamp = max(self.last_timestamp, other.last_timestamp)
+        self.monthly_count += other.monthly_count
+        self.monthly_total += other.monthly_total
+        self.monthly_negative += other.monthly_negative
+        self.monthly_positive += other.monthly_positive
+        self.sketch.merge(other.sketch)
+        return self
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    @property
+    def time_step_h(self):
+        """Mean spacing of the samples in hours (per site)."""
+        if self.count <= self.sites:
+            return math.nan
+        span = (self.last_timestamp - self.first_timestamp) / np.timedelta64(1, 'h')
+        return float(span) / (self.count / self.sites - 1)
+
+    def monthly(self):
+        """Per month of the year: count, total, negative and positive sums (MJ)."""
+        return {month: {"count": int(self.monthly_count[month - 1]), "total": float(self.monthly_total[month - 1]),
+                        "negative_sum": float(self.monthly_negative[month - 1]),
+                        "positive_sum": float(self.monthly_positive[month - 1])}
+                for month in range(1, 13)}
+
+    def seasonal(self):
+        """Meteorological (northern hemisphere) seasons: count, total, negative and positive sums (MJ)."""
+        seasons = {}
+        for season, months in SEASONS.items():
+            index = [month - 1 for month in months]
+            seasons[season] = {"count": int(self.monthly_count[index].sum()),
+                               "total": float(self.monthly_total[index].sum()),
+                               "negative_sum": float(self.monthly_negative[index].sum()),
+                               "positive_sum": float(self.monthly_positive[index].sum())}
+        return seasons
+
+    def summary(self, quantiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)):
+        return {
+            "sites": self.sites,
+            "count": self.count,
+            "first_timestamp": str(self.first_timestamp),
+            "last_timestamp": str(self.last_timestamp),
+            "total_mj": self.total,
+            "negative_sum_mj": self.negative_sum,
+            "positive_sum_mj": self.positive_sum,
+            "min_mj": self.min,
+            "min_timestamp": str(self.min_timestamp),
+            "max_mj": self.max,
+            "max_timestamp": str(self.max_timestamp),
+            "longest_deficit_streak": self.longest_deficit_streak,
+            "longest_deficit_streak_h": self.longest_deficit_streak * self.time_step_h,
+            "required_storage_mj": self.required_storage,
+            "quantiles_mj": {q: self.quantile(q) for q in quantiles},
+            "monthly": self.monthly(),
+            "seasonal": self.seasonal(),
+        }
+
+    def __str__(self):
+        return "\n".join([
+            f"Total Energy Difference: \n{round(self.total / 1000, 2)} GJ \n{round(self.total / 3600000, 2)} GWh",
+            f"\nMax energy supplied (hour): \n{round(self.max / 1000, 2)} GJ \n{round(self.max / 3600, 2)} MWh",
+            f"\nMax energy required (hour): \n{round(self.min / 1000, 2)} GJ \n{round(self.min / 3600, 2)} MWh",
+            f"\nSum of Negative Energy Differences (H₂ resupply req): \n{round(self.negative_sum / 1000, 2)} GJ "
+            f"\n{round(self.negative_sum / 3600000, 2)} GWh",
+            f"\nSum of Positive Energy Differences (H₂ resupply req): \n{round(self.positive_sum / 1000, 2)} GJ "
+            f"\n{round(self.positive_sum / 3600000, 2)} GWh",
+            f"\nLongest deficit streak: \n{self.longest_deficit_streak} samples "
+            f"({round(self.longest_deficit_streak * self.time_step_h, 2)} h)",
+            f"\nMedian energy difference: \n{round(self.quantile(0.5) / 1000, 2)} GJ",
+            f"\n\nBattery size req (max cumulative deficit): \n{round(self.required_storage / 1000, 2)} GJ "
+            f"\n{round(self.required_storage / MJ_PER_MWH, 2)} MWh",
+        ])
+
+
+def energy_stats_from_file(difference_file, chunksize=100_000, relative_accuracy=0.01):
+    """Summarize an energy difference CSV (Datetime, 'Energy Difference (MJ)') in one chunked pass."""
+    stats = EnergyStats(relative_accuracy)
+    for chunk in pd.read_csv(difference_file, usecols=["Datetime", "Energy Difference (MJ)"], chunksize=chunksize):
+        stats.update(pd.to_datetime(chunk["Datetime"]).to_numpy(dtype='datetime64[ns]'),
+                     chunk["Energy Difference (MJ)"].to_numpy(dtype=np.float64))
+    return stats
+
+
+def energy_stats_for_sites(difference_files, chunksize=100_000, workers=None):
+    """Summarize one difference file per site in parallel and merge them into a fleet summary."""
+    fleet = EnergyStats()
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(difference_files))) as pool:
+        for site in pool.map(energy_stats_from_file, difference_files, [chunksize] * len(difference_files)):
+            fleet.merge(site, sequential=False)
+    return fleet
+
+
+# Test Suite
+class TestEnergyStats(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.timestamps = np.arange('2023-01-01', '2025-01-01', dtype='datetime64[h]').astype('datetime64[ns]')
+        hours = np.arange(self.timestamps.size)
+        self.values = 3000 * np.sin(2 * np.pi * hours / 24) - 500 + rng.normal(0, 800, hours.size)
+
+    def test_chunked_merge_matches_single_pass(self):
+        single = EnergyStats()
+        single.update(self.timestamps, self.values)
+        chunked = EnergyStats()
+        for ts, values in zip(np.array_split(self.timestamps, 17), np.array_split(self.values, 17)):
+            chunked.update(ts, values)
+        for name in ("count", "longest_deficit_streak", "min", "max"):
+            self.assertEqual(getattr(chunked, name), getattr(single, name))
+        for name in ("total", "negative_sum", "positive_sum", "required_storage", "max_prefix", "min_prefix"):
+            self.assertAlmostEqual(getattr(chunked, name), getattr(single, name), places=3)
+        np.testing.assert_allclose(chunked.monthly_total, single.monthly_total)
+
+    def test_against_direct_computation(self):
+        stats = EnergyStats()
+        stats.update(self.timestamps, self.values)
+        cumulative = np.concatenate(([0.0], np.cumsum(self.values)))
+        self.assertAlmostEqual(stats.required_storage, (np.maximum.accumulate(cumulative) - cumulative).max())
+        streak = longest = 0
+        for value in self.values:
+            streak = streak + 1 if value < 0 else 0
+            longest = max(longest, streak)
+        self.assertEqual(stats.longest_deficit_streak, longest)
+        for q in (0.05, 0.5, 0.95):
+            exact = np.quantile(self.values, q)
+            self.assertLessEqual(abs(stats.quantile(q) - exact), 0.02 * abs(exact) + 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -1,6 +1,29 @@
-import pandas as pd
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from SimulationData.EnergyStats import energy_stats_from_file
+from Utils.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+DEFAULT_CHUNKSIZE = 100_000
+MAX_EXAMPLES = 10  # Timestamps kept per alignment problem for the report
+
+
+def compute_energy_difference(demand_file, supply_file, output_file, chunksize=None, freq=None):
+    """
+    Compute supplied minus demanded energy per timestamp and save it to output_file.
+
+    With chunksize set, both files are streamed with bounded memory (see
+    compute_energy_difference_streaming) and an AlignmentReport is returned.
+    """
+    if chunksize is not None or freq is not None:
+        return compute_energy_difference_streaming(demand_file, supply_file, output_file,
+                                                   chunksize=chunksize or DEFAULT_CHUNKSIZE, freq=freq)
 
-def compute_energy_difference(demand_file, supply_file, output_file):
     # Read the energy demand and supply datasets
     demand_df = pd.read_csv(demand_file, parse_dates=['Datetime'])
     supply_df = pd.read_csv(supply_file, parse_dates=['Datetime'])
@@ -16,29 +39,283 @@ def compute_energy_difference(demand_file, supply_file, output_file):
     print(f"File saved as {output_file}")
 
 
-def calculate_energy_stats(difference_file):
-    # Read energy difference from the provided CSV file
-    df = pd.read_csv(difference_file, parse_dates=["Datetime"])
+def _note_examples(examples, timestamps):
+    if len(examples) < MAX_EXAMPLES:
+        examples.extend(str(t) for t in pd.to_datetime(timestamps[:MAX_EXAMPLES - len(examples)]))
+
+
+class _SideStats:
+    """Row and cleaning counters of one input file."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.misaligned = 0  # Off the freq grid; snapped to the nearest grid point
+        self.duplicates = 0  # Same timestamp as the previous row; later rows dropped
+        self.out_of_order = 0  # Earlier than a previous row; dropped
+        self.examples = {"misaligned": [], "duplicates": [], "out_of_order": []}
+
+    def note(self, kind, timestamps):
+        _note_examples(self.examples[kind], timestamps)
+
+
+class AlignmentReport:
+    """Summary of how the demand and supply timestamps lined up in a streaming join."""
+
+    def __init__(self, freq=None):
+        self.freq = freq
+        self.demand = _SideStats("demand")
+        self.supply = _SideStats("supply")
+        self.rows_written = 0
+        self.missing_in_supply = 0  # Demand timestamps without a supply row
+        self.missing_in_demand = 0  # Supply timestamps without a demand row
+        self.gaps = 0  # Jumps larger than freq in the written timestamps
+        self.missing_slots = 0  # freq steps skipped by those gaps
+        self.examples = {"missing_in_supply": [], "missing_in_demand": [], "gaps": []}
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def note(self, kind, timestamps):
+        _note_examples(self.examples[kind], timestamps)
+
+    @property
+    def is_clean(self):
+        sides = (self.demand, self.supply)
+        return not (self.missing_in_supply or self.missing_in_demand or self.gaps
+                    or any(side.misaligned or side.duplicates or side.out_of_order for side in sides))
+
+    def to_dict(self):
+        return {
+            "rows_written": self.rows_written,
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "missing_in_supply": self.missing_in_supply,
+            "missing_in_demand": self.missing_in_demand,
+            "gaps": self.gaps,
+            "missing_slots": self.missing_slots,
+            "examples": self.examples,
+            **{side.name: {"rows": side.rows, "misaligned": side.misaligned, "duplicates": side.duplicates,
+                           "out_of_order": side.out_of_order, "examples": side.examples}
+               for side in (self.demand, self.supply)},
+        }
+
+    def __str__(self):
+        lines = [f"Rows written: {self.rows_written} ({self.first_timestamp} to {self.last_timestamp})",
+                 f"Demand rows without supply: {self.missing_in_supply}",
+                 f"Supply rows without demand: {self.missing_in_demand}"]
+        if self.freq is not None:
+            lines.append(f"Gaps larger than {self.freq}: {self.gaps} ({self.missing_slots} missing steps)")
+        for side in (self.demand, self.supply):
+            lines.append(f"{side.name.capitalize()} rows: {side.rows}, misaligned: {side.misaligned}, "
+                         f"duplicates: {side.duplicates}, out of order: {side.out_of_order}")
+        return "\n".join(lines)
+
+
+def _read_clean_chunks(path, column, chunksize, freq_ns, stats):
+    """
+    Yield (timestamps as int64 ns, values) chunks of one file, snapped to the freq grid, strictly increasing.
+
+    Rows that repeat or go back in time relative to an earlier row are dropped and counted.
+    """
+    last = np.iinfo(np.int64).min
+    for chunk in pd.read_csv(path, usecols=['Datetime', column], chunksize=chunksize):
+        # UTC keeps tz-aware files whose offset changes across DST comparable; naive times are taken as UTC
+        timestamps = pd.to_datetime(chunk['Datetime'], utc=True).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        values = chunk[column].to_numpy(dtype=np.float64)
+        stats.rows += len(timestamps)
+        if freq_ns:
+            snapped = (timestamps + freq_ns // 2) // freq_ns * freq_ns
+            off_grid = snapped != timestamps
+            if off_grid.any():
+                stats.misaligned += int(off_grid.sum())
+                stats.note("misaligned", timestamps[off_grid])
+            timestamps = snapped
+        previous_max = np.maximum.accumulate(np.concatenate(([last], timestamps)))[:-1]
+        keep = timestamps > previous_max
+        if not keep.all():
+            duplicate = timestamps == previous_max
+            out_of_order = timestamps < previous_max
+            stats.duplicates += int(duplicate.sum())
+            stats.out_of_order += int(out_of_order.sum())
+            stats.note("duplicates", timestamps[duplicate])
+            stats.note("out_of_order", timestamps[out_of_order])
+            timestamps, values = timestamps[keep], values[keep]
+        if len(timestamps):
+            last = timestamps[-1]
+            yield timestamps, values
+
+
+class _SortedChunks:
+    """Buffer over the cleaned chunks of one file for the merge-join."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0)
+
+    def fill(self):
+        """Load the next chunk once the buffer is empty; returns False when the file is exhausted."""
+        if not len(self.timestamps):
+            self.timestamps, self.values = next(self.chunks, (self.timestamps, self.values))
+        return bool(len(self.timestamps))
+
+    def take(self, cut):
+        """Remove and return the buffered rows with timestamps up to cut."""
+        n = np.searchsorted(self.timestamps, cut, side="right")
+        taken = self.timestamps[:n], self.values[:n]
+        self.timestamps, self.values = self.timestamps[n:], self.values[n:]
+        return taken
+
+
+def compute_energy_difference_streaming(demand_file, supply_file, output_file, chunksize=DEFAULT_CHUNKSIZE,
+                                        freq=None):
+    """
+    Streaming version of compute_energy_difference for large or high-resolution profiles.
+
+    Both files must be sorted by Datetime. They are read in chunks and joined with a sorted
+    merge-join: rows up to the smaller of the two buffered horizons are final, are joined and
+    written, and only the rows beyond it are carried over, so memory stays at about two chunks.
+    Timestamps with a UTC offset are converted to UTC (also when the offset changes across DST),
+    so the output Datetime is in UTC.
+
+    Parameters:
+    - demand_file / supply_file: CSVs with Datetime and 'Energy Demand (MJ)' / 'Energy Supplied (MJ)'.
+    - output_file: CSV written with Datetime and 'Energy Difference (MJ)'.
+    - chunksize: Rows read per chunk from each file.
+    - freq: Optional expected step (e.g. '1h', '1min'). Timestamps off this grid are snapped to it
+      and reported as misaligned, and gaps in the joined output are reported.
+
+    Returns:
+    - AlignmentReport describing missing, misaligned, duplicate and out-of-order timestamps.
+    """
+    report = AlignmentReport(freq)
+    freq_ns = pd.Timedelta(freq).value if freq is not None else 0
+    demand = _SortedChunks(_read_clean_chunks(demand_file, 'Energy Demand (MJ)', chunksize, freq_ns, report.demand))
+    supply = _SortedChunks(_read_clean_chunks(supply_file, 'Energy Supplied (MJ)', chunksize, freq_ns, report.supply))
+    previous_written = None
+    header = True
+    with open(output_file, "w", newline="") as f:
+        while demand.fill() | supply.fill():
+            # Rows up to the smaller horizon cannot get a partner from a later chunk
+            cut = min(side.timestamps[-1] for side in (demand, supply) if len(side.timestamps))
+            demand_ts, demand_values = demand.take(cut)
+            supply_ts, supply_values = supply.take(cut)
+
+            joined_ts, demand_index, supply_index = np.intersect1d(demand_ts, supply_ts, assume_unique=True,
+                                                                   return_indices=True)
+            if len(demand_ts) > len(joined_ts):
+                unmatched = np.ones(len(demand_ts), dtype=bool)
+                unmatched[demand_index] = False
+                report.missing_in_supply += int(unmatched.sum())
+                report.note("missing_in_supply", demand_ts[unmatched])
+            if len(supply_ts) > len(joined_ts):
+                unmatched = np.ones(len(supply_ts), dtype=bool)
+                unmatched[supply_index] = False
+                report.missing_in_demand += int(unmatched.sum())
+                report.note("missing_in_demand", supply_ts[unmatched])
+            if not len(joined_ts):
+                continue
+
+            if freq_ns:
+                written = joined_ts if previous_written is None else np.concatenate(([previous_written], joined_ts))
+                steps = np.diff(written)
+                gap = steps > freq_ns
+                if gap.any():
+                    report.gaps += int(gap.sum())
+                    report.missing_slots += int((steps[gap] // freq_ns - 1).sum())
+                    report.note("gaps", written[:-1][gap])
+            previous_written = joined_ts[-1]
+
+            difference = supply_values[supply_index] - demand_values[demand_index]
+            pd.DataFrame({'Datetime': pd.to_datetime(joined_ts), 'Energy Difference (MJ)': difference}) \
+                .to_csv(f, header=header, index=False)
+            header = False
+            report.rows_written += len(joined_ts)
+            if report.first_timestamp is None:
+                report.first_timestamp = str(pd.Timestamp(joined_ts[0]))
+            report.last_timestamp = str(pd.Timestamp(joined_ts[-1]))
+        if header:
+            pd.DataFrame(columns=['Datetime', 'Energy Difference (MJ)']).to_csv(f, index=False)
+
+    print(f"File saved as {output_file}")
+    print(report)
+    return report
+
+
+def calculate_energy_stats(difference_file, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Summarize an energy difference file in a single chunked pass and print the results.
+
+    Returns:
+    - EnergyStats with totals, extremes, monthly/seasonal breakdowns, the longest deficit streak,
+      the required storage (max cumulative deficit) and quantiles.
+    """
+    stats = energy_stats_from_file(difference_file, chunksize=chunksize)
+    print(stats)
+    return stats
+
+# Test Suite (python -m unittest SimulationData.compute_energy_difference)
+class TestComputeEnergyDifference(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def write(self, name, timestamps, column, values):
+        pd.DataFrame({'Datetime': timestamps, column: values}).to_csv(self.path(name), index=False)
+        return self.path(name)
+
+    def test_streaming_matches_in_memory_merge(self):
+        rng = np.random.default_rng(0)
+        hours = pd.date_range('2024-01-01', periods=200, freq='h').strftime('%Y-%m-%d %H:%M:%S')
+        demand_rows = rng.permutation(np.flatnonzero(rng.random(200) < 0.9))  # Gappy and unsorted ...
+        supply_rows = np.sort(np.flatnonzero(rng.random(200) < 0.8))
+        demand_rows = np.concatenate([np.sort(demand_rows[:150]), demand_rows[150:]])  # ... at the end only
+        demand_rows = np.insert(demand_rows, [10, 40, 40], demand_rows[[9, 39, 39]])  # Duplicates
+        demand_values = rng.normal(100, 10, len(demand_rows))
+        supply_values = rng.normal(100, 10, len(supply_rows))
+        demand = self.write('demand.csv', hours[demand_rows], 'Energy Demand (MJ)', demand_values)
+        supply = self.write('supply.csv', hours[supply_rows], 'Energy Supplied (MJ)', supply_values)
+
+        report = compute_energy_difference_streaming(demand, supply, self.path('streamed.csv'), chunksize=16,
+                                                     freq='1h')
+
+        # The streaming join keeps the first row of each timestamp and drops rows that go back in time
+        keep = demand_rows > np.maximum.accumulate(np.concatenate(([-1], demand_rows)))[:-1]
+        self.assertEqual(report.demand.duplicates + report.demand.out_of_order, int((~keep).sum()))
+        self.assertEqual(report.demand.duplicates, 3)
+        self.assertGreater(report.demand.out_of_order, 0)
+        cleaned = self.write('cleaned.csv', hours[demand_rows[keep]], 'Energy Demand (MJ)', demand_values[keep])
+        compute_energy_difference(cleaned, supply, self.path('merged.csv'))
 
-    # Calculate the summed values
-    total_difference = df["Energy Difference (MJ)"].sum()
+        streamed = pd.read_csv(self.path('streamed.csv'), parse_dates=['Datetime'])
+        merged = pd.read_csv(self.path('merged.csv'), parse_dates=['Datetime'])
+        self.assertEqual(report.rows_written, len(merged))
+        self.assertGreater(report.gaps, 0)
+        np.testing.assert_array_equal(streamed['Datetime'].to_numpy(), merged['Datetime'].to_numpy())
+        np.testing.assert_allclose(streamed['Energy Difference (MJ)'], merged['Energy Difference (MJ)'])
 
-    # Calculate the sum of only the negative energy differences
-    negative_difference_sum = df[df["Energy Difference (MJ)"] < 0]["Energy Difference (MJ)"].sum()
-    positive_difference_sum = df[df["Energy Difference (MJ)"] > 0]["Energy Difference (MJ)"].sum()
+    def test_streaming_across_dst(self):
+        local = pd.date_range('2024-03-30', '2024-04-01', freq='h', tz='Europe/Berlin', inclusive='left')
+        timestamps = local.strftime('%Y-%m-%d %H:%M:%S%z').str.replace(r'(\d{2})(\d{2})$', r'\1:\2', regex=True)
+        demand = self.write('demand.csv', timestamps, 'Energy Demand (MJ)', np.arange(len(local), dtype=float))
+        supply = self.write('supply.csv', timestamps, 'Energy Supplied (MJ)', np.full(len(local), 50.0))
 
-    # Find the highest and lowest energy differences
-    highest_difference = df["Energy Difference (MJ)"].max()
-    lowest_difference = df["Energy Difference (MJ)"].min()
+        report = compute_energy_difference_streaming(demand, supply, self.path('streamed.csv'), chunksize=10,
+                                                     freq='1h')
+        compute_energy_difference(demand, supply, self.path('merged.csv'))
 
-    # Print out the results
-    print(f"Total Energy Difference: \n{round(total_difference / 1000, 2)} GJ \n{round(total_difference / 3600000, 2)} GWh")
-    print(f"\nMax energy supplied (hour): \n{round(highest_difference / 1000, 2)} GJ \n{round(highest_difference / 3600, 2)} MWh")
-    print(f"\nMax energy required (hour): \n{round(lowest_difference / 1000, 2)} GJ \n{round(lowest_difference / 3600, 2)} MWh")
-    print(f"\nSum of Negative Energy Differences (H₂ resupply req): \n{round(negative_difference_sum / 1000, 2)} GJ \n{round(negative_difference_sum / 3600000, 2)} GWh")
-    print(f"\nSum of Positive Energy Differences (H₂ resupply req): \n{round(positive_difference_sum / 1000, 2)} GJ \n{round(positive_difference_sum / 3600000, 2)} GWh")
+        self.assertTrue(report.is_clean)
+        self.assertEqual(report.rows_written, len(local))
+        streamed = pd.read_csv(self.path('streamed.csv'))
+        merged = pd.read_csv(self.path('merged.csv'))
+        np.testing.assert_array_equal(pd.to_datetime(streamed['Datetime'], utc=True),
+                                      pd.to_datetime(merged['Datetime'], utc=True))
+        np.testing.assert_array_equal(pd.to_datetime(streamed['Datetime'], utc=True), local.tz_convert('UTC'))
+        np.testing.assert_allclose(streamed['Energy Difference (MJ)'], merged['Energy Difference (MJ)'])
 
-    print(f"\n\nBattery size req: \n{round(lowest_difference / 1000, 2)*3} GJ \n{round(lowest_difference / 3600, 2)*3} MWh")
 
 if __name__ == "__main__":
     DEMAND_FILE = 'SimulationData/energy_demand_3200_houses.csv'
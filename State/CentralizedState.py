@@ -1,3 +1,8 @@
+from Utils.lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
 class CentralizedState:
     def __init__(self, initial_values=None):
         if initial_values is None:
@@ -16,6 +21,7 @@ class CentralizedState:
         self.eta_act = initial_values.get('eta_act', None)
         self.J0 = initial_values.get('J0', None)
         self.x = initial_values.get('x', 0)
+        self.lambda_profile = initial_values.get('lambda_profile', None)  # (x, lambda) nodes, e.g. from a transport solver
         self.lambda_x = self.calculate_lambda_x()
         self.R_PEM = initial_values.get('R_PEM', None)
         self.eta_ohm = initial_values.get('eta_ohm', None)
@@ -41,14 +47,18 @@ class CentralizedState:
 
     def update_lambda_a(self, new_lambda_a):
         self.lambda_a = new_lambda_a
+        self.lambda_profile = None  # New face values (e.g. a state estimate) supersede the profile
         self.lambda_x = self.calculate_lambda_x()  # lambda_x depends on lambda_a, so we recalculate it when lambda_a changes
 
     def update_lambda_c(self, new_lambda_c):
         self.lambda_c = new_lambda_c
+        self.lambda_profile = None  # New face values (e.g. a state estimate) supersede the profile
         self.lambda_x = self.calculate_lambda_x()  # lambda_x depends on lambda_c, so we recalculate it when lambda_c changes
 
     def update_L(self, new_L):
         self.L = new_L
+        if self.lambda_profile is not None and not self._spans_membrane(self.lambda_profile[0]):
+            self.lambda_profile = None  # The profile no longer spans the membrane
         self.lambda_x = self.calculate_lambda_x()  # lambda_x depends on L, so we recalculate it when L changes
 
     def update_alpha(self, new_alpha):
@@ -64,14 +74,37 @@ class CentralizedState:
         self.x = new_x
         self.lambda_x = self.calculate_lambda_x()  # lambda_x depends on x, so we recalculate it when x changes
 
+    def _spans_membrane(self, x_nodes):
+        return self.L is None or (np.isclose(x_nodes[0], 0.0) and np.isclose(x_nodes[-1], self.L))
+
+    def update_lambda_profile(self, x_nodes, lambda_nodes):
+        # The profile must span the membrane [0, L]; np.interp would silently clamp a shorter or longer one
+        if not self._spans_membrane(x_nodes):
+            raise ValueError(f"lambda profile spans [{x_nodes[0]}, {x_nodes[-1]}] m, "
+                             f"but the membrane thickness L is {self.L} m")
+        self.lambda_profile = (x_nodes, lambda_nodes)
+        self.lambda_x = self.calculate_lambda_x()  # lambda_x is read from the profile once there is one
+
     def update_R_PEM(self, new_R_PEM):
         self.R_PEM = new_R_PEM
 
     def update_eta_ohm(self, new_eta_ohm):
         self.eta_ohm = new_eta_ohm
 
-    def calculate_lambda_x(self):
+    def get_checkpoint_state(self):
+        # State variables are plain numbers or replaced (never mutated) arrays, a shallow copy is a complete snapshot
+        return dict(vars(self))
+
+    def restore_checkpoint_state(self, checkpoint_state):
+        vars(self).update(checkpoint_state)
+
+    def calculate_lambda_x(self, x=None):
+        # Water content at x (default: self.x), scalar or array; interpolated in lambda_profile when set,
+        # linear between the cathode (x = 0) and anode (x = L) faces otherwise
+        x = self.x if x is None else x
+        if self.lambda_profile is not None:
+            return np.interp(x, *self.lambda_profile)
         if self.lambda_a is not None and self.lambda_c is not None and self.L is not None:
-            return ((self.lambda_a - self.lambda_c) / self.L) * self.x + self.lambda_c
+            return ((self.lambda_a - self.lambda_c) / self.L) * x + self.lambda_c
         else:
             return None
@@ -0,0 +1,312 @@
+"""
+Ensemble Kalman filter fusing PEM electrolyzer sensor readings with the cell model.
+
+Each ensemble member is one row of an (members x states) array:
+    T (K), J (A/m^2), lambda_a, lambda_c (membrane water content at the anode/cathode face),
+    R_deg (ohm m^2, degradation resistance added to the membrane resistance)
+The membrane water content and the degradation are not measured; they are inferred from how the
+measured cell voltage responds to current density and temperature. The voltage pins down the total
+ohmic resistance; how it splits into hydration and degradation rests on the temperature dependence
+of the membrane conductivity and on the hydration dynamics.
+
+Forecast (all members at once):
+- T: lumped thermal balance of the stack, heated by J (V - V_tn) per cell and cooled towards the
+  coolant temperature.
+- J: wide random walk; the current density is an input that the J sensor pins down.
+- lambda_a / lambda_c: relax towards their equilibrium. The water-fed anode face goes to
+  lambda_sat, scaled down when the water supply N_H2O_in falls short of what the stack consumes
+  and drags across. Electro-osmotic drag dries the cathode face by drag_slope * J.
+- R_deg: slow drift at degradation_rate plus a random walk.
+Process noise scales with sqrt(dt).
+
+Observations (any subset per update): T, J, the cell voltage V and the hydrogen output flow.
+V = V0 + eta_act_a + eta_act_c + J (R_PEM(lambda_a, lambda_c, T) + R_deg), with the activation
+overpotentials of ActivationOverpotential and the closed-form membrane_resistance.
+
+Analysis: stochastic EnKF with perturbed observations. The gain comes from the ensemble
+anomalies as K = P_xy (P_yy + R)^-1, with only a (fields x fields) system to solve, so an update
+costs a few matrix products over the ensemble. Multiplicative inflation keeps the spread from
+collapsing.
+"""
+import logging
+import math
+import time
+import unittest
+
+import numpy as np
+
+from Sensors.Ingestion import SensorIngestor, decode_payload
+from State.CentralizedState import CentralizedState
+from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+from Units.PEMHydrogenGenerator.Models.ButlerVolmer import activation_overpotential
+from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import membrane_resistance
+
+STATES = ("T", "J", "lambda_a", "lambda_c", "R_deg")
+T_, J_, LAMBDA_A, LAMBDA_C, R_DEG = range(len(STATES))
+OBSERVABLES = ("T", "J", "V", "N_H2_out_dot")
+
+# Physical limits applied after every step
+_LOWER = np.array([200.0, 0.0, 1.0, 1.0, 0.0])
+_UPPER = np.array([400.0, np.inf, 25.0, 25.0, np.inf])
+
+
+class ElectrolyzerModelParameters:
+    """
+    Reduced electrolyzer model propagated by every ensemble member.
+
+    Parameters:
+    - activation: PEMParameters of the activation overpotentials (R, F, J_ref_a/c, E_act_a/c).
+    - V0: Reversible cell voltage (V); L: membrane thickness (m).
+    - area / n_cells: Active cell area (m^2) and cells in the stack.
+    - heat_capacity: Stack heat capacity (J/K); UA: heat transfer to the coolant (W/K); T_coolant (K).
+    - V_thermoneutral: Thermoneutral cell voltage (V).
+    - lambda_sat: Water content of a fully hydrated membrane face; tau_lambda: hydration time constant (s).
+    - drag_slope: Cathode-face drying per current density (1 / (A/m^2)).
+    - drag_coefficient: Water molecules dragged per proton.
+    - degradation_rate: Drift of R_deg (ohm m^2 / s).
+    - process_std: Process noise per state per sqrt(second), in STATES order.
+    """
+
+    def __init__(self, activation: PEMParameters, V0=1.23, L=0.01, area=1.0, n_cells=200, heat_capacity=5e5,
+                 UA=2e3, T_coolant=333.15, V_thermoneutral=1.48, lambda_sat=14.0, tau_lambda=60.0,
+                 drag_slope=2e-4, drag_coefficient=2.5, degradation_rate=1e-12,
+                 process_std=(0.02, 1000.0, 0.02, 0.02, 1e-8)):
+        self.activation = activation
+        self.V0 = V0
+        self.L = L
+        self.area = area
+        self.n_cells = n_cells
+        self.heat_capacity = heat_capacity
+        self.UA = UA
+        self.T_coolant = T_coolant
+        self.V_thermoneutral = V_thermoneutral
+        self.lambda_sat = lambda_sat
+        self.tau_lambda = tau_lambda
+        self.drag_slope = drag_slope
+        self.drag_coefficient = drag_coefficient
+        self.degradation_rate = degradation_rate
+        self.process_std = np.asarray(process_std, dtype=np.float64)
+
+    def cell_voltage(self, X):
+        """Cell voltage (V) of every member."""
+        a = self.activation
+        T, J = X[:, T_], X[:, J_]
+        RT = a.R * T
+        eta_act_a = activation_overpotential(J, a.J_ref_a * np.exp(-a.E_act_a / RT), a.alpha_a, a.z, T, a.R, a.F)
+        eta_act_c = activation_overpotential(J, a.J_ref_c * np.exp(-a.E_act_c / RT), a.alpha_c, a.z, T, a.R, a.F)
+        R_PEM = membrane_resistance(X[:, LAMBDA_A], X[:, LAMBDA_C], self.L, T)
+        return self.V0 + eta_act_a + eta_act_c + J * (R_PEM + X[:, R_DEG])
+
+    def hydrogen_flow(self, X):
+        """Stack hydrogen output (mol/s) of every member."""
+        return X[:, J_] * self.area * self.n_cells / (2 * self.activation.F)
+
+    def observe(self, X, fields):
+        """Predicted observations, (members x len(fields))."""
+        columns = []
+        for field in fields:
+            if field == "T":
+                columns.append(X[:, T_])
+            elif field == "J":
+                columns.append(X[:, J_])
+            elif field == "V":
+                columns.append(self.cell_voltage(X))
+            elif field == "N_H2_out_dot":
+                columns.append(self.hydrogen_flow(X))
+            else:
+                raise ValueError(f"Unknown observation {field!r}; expected one of {OBSERVABLES}.")
+        return np.column_stack(columns)
+
+    def forecast(self, X, dt, water_supply_mol_s, rng):
+        """Advance every member by dt seconds; returns the new (members x states) array."""
+        X = X.copy()
+        T, J = X[:, T_], X[:, J_]
+        V = self.cell_voltage(X)
+        heat_w = (V - self.V_thermoneutral) * J * self.area * self.n_cells
+        # Exact step of the linear cooling towards T_coolant + heat / UA, stable for any dt
+        T_steady = self.T_coolant + heat_w / self.UA
+        X[:, T_] = T_steady + (T - T_steady) * math.exp(-dt * self.UA / self.heat_capacity)
+
+        relax = 1.0 - math.exp(-dt / self.tau_lambda)
+        lambda_a_target = np.full(len(X), self.lambda_sat)
+        if water_supply_mol_s is not None:
+            # Water consumed by the reaction plus water dragged to the cathode
+            demand = self.hydrogen_flow(X) * (1 + 2 * self.drag_coefficient)
+            hydration = np.where(demand > 0, np.clip(water_supply_mol_s / np.maximum(demand, 1e-300), 0, 1), 1.0)
+            lambda_a_target = lambda_a_target * hydration
+        lambda_c_target = lambda_a_target - self.drag_slope * J
+        X[:, LAMBDA_A] += (lambda_a_target - X[:, LAMBDA_A]) * relax
+        X[:, LAMBDA_C] += (lambda_c_target - X[:, LAMBDA_C]) * relax
+        X[:, R_DEG] += self.degradation_rate * dt
+
+        X += rng.standard_normal(X.shape) * (self.process_std * math.sqrt(dt))
+        np.clip(X, _LOWER, _UPPER, out=X)
+        return X
+
+
+class EnsembleKalmanFilter:
+    """
+    Vectorized EnKF over the electrolyzer state.
+
+    Parameters:
+    - model: ElectrolyzerModelParameters.
+    - initial_mean / initial_std: Per-state mean and spread of the initial ensemble (STATES order).
+    - members: Ensemble size.
+    - observation_std: Dict of observable -> measurement noise standard deviation.
+    - inflation: Multiplicative inflation of the forecast anomalies.
+    - max_step_s: Longest forecast sub-step (s); longer gaps are split.
+    - seed: Random seed, so a replayed stream gives the same estimates.
+    """
+
+    def __init__(self, model: ElectrolyzerModelParameters, initial_mean, initial_std, members=200,
+                 observation_std=None, inflation=1.01, max_step_s=10.0, seed=0):
+        self.model = model
+        self.members = members
+        self.observation_std = {"T": 0.1, "J": 20.0, "V": 2e-3, "N_H2_out_dot": 1e-3}
+        self.observation_std.update(observation_std or {})
+        self.inflation = inflation
+        self.max_step_s = max_step_s
+        self.rng = np.random.default_rng(seed)
+        mean = np.asarray(initial_mean, dtype=np.float64)
+        std = np.asarray(initial_std, dtype=np.float64)
+        self.X = np.clip(mean + self.rng.standard_normal((members, len(STATES))) * std, _LOWER, _UPPER)
+        self.t = None
+        self.water_supply_mol_s = None
+        self.updates = 0
+        self.update_time_s = 0.0
+
+    def forecast(self, t):
+        """Propagate the ensemble to time t (s)."""
+        if self.t is None:
+            self.t = t
+            return
+        remaining = t - self.t
+        while remaining > 0:
+            dt = min(remaining, self.max_step_s)
+            self.X = self.model.forecast(self.X, dt, self.water_supply_mol_s, self.rng)
+            remaining -= dt
+        self.t = max(self.t, t)
+
+    def analyze(self, observations):
+        """Correct the ensemble with a dict of observable -> measured value."""
+        fields = [field for field in OBSERVABLES if field in observations]
+        if not fields:
+            return
+        y = np.array([observations[field] for field in fields], dtype=np.float64)
+        std = np.array([self.observation_std[field] for field in fields])
+        X = self.X
+        mean = X.mean(axis=0)
+        anomalies = (X - mean) * self.inflation
+        X = mean + anomalies
+        HX = self.model.observe(X, fields)
+        HA = HX - HX.mean(axis=0)
+        scale = 1.0 / (self.members - 1)
+        P_yy = HA.T @ HA * scale + np.diag(std ** 2)
+        P_xy = anomalies.T @ HA * scale
+        # Perturbed observations keep the analysis spread consistent with the measurement noise
+        innovations = y + self.rng.standard_normal(HX.shape) * std - HX
+        self.X = np.clip(X + np.linalg.solve(P_yy, innovations.T).T @ P_xy.T, _LOWER, _UPPER)
+
+    def update(self, t, observations):
+        """
+        Forecast to time t and assimilate the readings taken at t.
+
+        Parameters:
+        - t: Time of the readings (s).
+        - observations: Dict of field -> value; N_H2O_in sets the water supply input, other fields
+          outside OBSERVABLES are ignored.
+        """
+        start = time.perf_counter()
+        if "N_H2O_in" in observations:
+            self.water_supply_mol_s = float(observations["N_H2O_in"])
+        self.forecast(t)
+        self.analyze(observations)
+        self.updates += 1
+        self.update_time_s += time.perf_counter() - start
+
+    def mean(self):
+        return dict(zip(STATES, self.X.mean(axis=0).tolist()))
+
+    def std(self):
+        return dict(zip(STATES, self.X.std(axis=0, ddof=1).tolist()))
+
+    def membrane_resistance(self):
+        """Ensemble mean of the area-specific resistance R_PEM + R_deg (ohm m^2)."""
+        X = self.X
+        return float(np.mean(membrane_resistance(X[:, LAMBDA_A], X[:, LAMBDA_C], self.model.L, X[:, T_])
+                             + X[:, R_DEG]))
+
+    def apply_to(self, state: CentralizedState):
+        """Write the estimated T, J, membrane water content and R_PEM (including degradation) into the state."""
+        mean = self.mean()
+        state.update_T(mean["T"])
+        state.update_J(mean["J"])
+        state.update_lambda_a(mean["lambda_a"])
+        state.update_lambda_c(mean["lambda_c"])
+        state.update_R_PEM(self.membrane_resistance())
+
+    def assimilate_stream(self, messages, topics=None):
+        """
+        Assimilate (timestamp, topic, payload) messages, e.g. from StreamRecorder.read_log.
+
+        Readings that share a timestamp are assimilated together. Frames and JSON readings with
+        their own timestamp use it instead of the message time.
+
+        Returns:
+        - The number of updates.
+        """
+        ingestor = SensorIngestor(CentralizedState(), topics=topics)
+        pending_t = None
+        pending = {}
+        updates = 0
+        for timestamp, topic, payload in messages:
+            field = ingestor.field_for(topic)
+            if field is None:
+                continue
+            try:
+                value, reading_t = decode_payload(payload)
+            except (ValueError, KeyError, TypeError) as e:
+                logging.debug(f"Skipping undecodable payload on {topic}: {e}")
+                continue
+            t = timestamp if reading_t is None else reading_t
+            if pending and t != pending_t:
+                self.update(pending_t, pending)
+                updates += 1
+                pending = {}
+            pending_t = t
+            pending[field] = value
+        if pending:
+            self.update(pending_t, pending)
+            updates += 1
+        return updates
+
+    def stats(self):
+        return {"members": self.members, "updates": self.updates,
+                "mean_update_ms": 1e3 * self.update_time_s / self.updates if self.updates else 0.0}
+
+
+# Test Suite
+class TestEnsembleKalmanFilter(unittest.TestCase):
+    def test_recovers_membrane_resistance(self):
+        activation = PEMParameters(R=8.314, T=333.15, F=96500, J_ref_a=1e5, J_ref_c=1e7, E_act_a=50000,
+                                   E_act_c=30000)
+        truth_model = ElectrolyzerModelParameters(activation, L=1.78e-4)
+        truth = np.array([[333.15, 0.0, 11.0, 7.0, 1e-5]])
+        enkf = EnsembleKalmanFilter(ElectrolyzerModelParameters(activation, L=1.78e-4, tau_lambda=1e9, UA=1e9,
+                                                                process_std=(0.01, 1000.0, 0.01, 0.01, 1e-8)),
+                                    initial_mean=[333.15, 5000.0, 14.0, 12.0, 0.0],
+                                    initial_std=[0.5, 500.0, 2.0, 2.0, 1e-5], members=300)
+        rng = np.random.default_rng(1)
+        for step in range(600):
+            truth[0, J_] = 10000.0 + 8000.0 * math.sin(step / 30.0)
+            truth[0, T_] = 333.15 + 10.0 * math.sin(step / 70.0)
+            V = truth_model.cell_voltage(truth)[0]
+            enkf.update(float(step), {"J": truth[0, J_] + rng.normal(0, 20.0), "V": V + rng.normal(0, 2e-3),
+                                      "T": truth[0, T_] + rng.normal(0, 0.1)})
+        true_R = membrane_resistance(11.0, 7.0, 1.78e-4, truth[0, T_]) + 1e-5
+        self.assertAlmostEqual(enkf.membrane_resistance() / true_R, 1.0, delta=0.05)
+        self.assertAlmostEqual(enkf.mean()["J"], truth[0, J_], delta=100.0)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
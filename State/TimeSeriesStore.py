@@ -0,0 +1,411 @@
+"""
+Embedded append-only time-series store for sensor history.
+
+Every channel (a sensor topic or state field) is stored at several resolutions:
+- raw: every sample as (t, value).
+- rollups 1s, 1min and 1h: one record (t, min, max, mean, count) per bucket, where t is the
+  bucket start. Every rollup aggregates the raw samples of each batch with one vectorized pass,
+  and a bucket is written once a later sample closes it. The bucket still filling up is kept in
+  memory; it is included in queries and rebuilt from the raw samples when a store is reopened.
+
+Each resolution of a channel is a directory of segment files covering a fixed time span and
+named after its start time (UNIX seconds). A segment is a flat array of little-endian records,
+written with appends only and read through numpy memory maps. Every open segment keeps a sparse
+index of every INDEX_STRIDE-th timestamp, so a lookup binary-searches the index and then one
+block of the memory map; a query touches only the pages it returns.
+
+Retention drops whole segments that end before the retention window of their resolution.
+
+Samples must arrive in time order per channel. Samples older than the latest one of their
+channel are dropped and counted in `late_samples`.
+
+Layout:
+    <root>/<channel>/<resolution>/<segment start>.seg
+"""
+import logging
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+RAW_DTYPE = np.dtype([("t", "<f8"), ("value", "<f8")])
+ROLLUP_DTYPE = np.dtype([("t", "<f8"), ("min", "<f8"), ("max", "<f8"), ("mean", "<f8"), ("count", "<u4")])
+
+# (resolution, bucket width in seconds), finest first
+ROLLUPS = (("1s", 1), ("1min", 60), ("1h", 3600))
+
+# Time span of one segment file per resolution (seconds)
+SEGMENT_SPANS = {"raw": 86400, "1s": 86400, "1min": 30 * 86400, "1h": 366 * 86400}
+
+# Default retention per resolution (seconds); None keeps everything
+DEFAULT_RETENTION = {"raw": 7 * 86400, "1s": 30 * 86400, "1min": 366 * 86400, "1h": None}
+
+INDEX_STRIDE = 1024
+SEGMENT_SUFFIX = ".seg"
+
+_CHANNEL_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def channel_name(name):
+    """File-system safe channel name, e.g. for an MQTT topic ("a/b" -> "a.b")."""
+    return _CHANNEL_UNSAFE.sub("_", str(name).replace("/", "."))
+
+
+class _Segment:
+    """One segment file: a memory map over the records on disk and a sparse index of its timestamps."""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = dtype
+        self._map = None
+        self._length = 0
+        self.index = np.empty(0)
+
+    def records(self):
+        length = os.path.getsize(self.path) // self.dtype.itemsize
+        if self._map is None or length != self._length:
+            # The file grew since it was mapped: remap and extend the sparse index
+            self._map = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(length,)) if length else \
+                np.empty(0, dtype=self.dtype)
+            self.index = np.array(self._map["t"][::INDEX_STRIDE])
+            self._length = length
+        return self._map
+
+    def search(self, t, side):
+        """Position of t in the segment, as np.searchsorted over its timestamps."""
+        records = self.records()
+        block = max(int(np.searchsorted(self.index, t, side)) - 1, 0)
+        low = block * INDEX_STRIDE
+        high = min(low + INDEX_STRIDE + 1, len(records))
+        return low + int(np.searchsorted(records["t"][low:high], t, side))
+
+
+class _Series:
+    """All segments of one resolution of a channel."""
+
+    def __init__(self, directory, dtype, span):
+        self.directory = directory
+        self.dtype = dtype
+        self.span = span
+        self.segments = {}  # start -> _Segment
+        self.pending = []  # Record arrays not yet written
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(SEGMENT_SUFFIX):
+                start = int(name[:-len(SEGMENT_SUFFIX)])
+                self.segments[start] = _Segment(os.path.join(directory, name), dtype)
+        self.starts = sorted(self.segments)
+
+    def write(self):
+        if not self.pending:
+            return
+        records = np.concatenate(self.pending) if len(self.pending) > 1 else self.pending[0]
+        self.pending = []
+        starts = (np.floor(records["t"] / self.span) * self.span).astype(np.int64)
+        # Records are time ordered, so each segment receives one contiguous slice
+        cuts = np.flatnonzero(np.diff(starts)) + 1
+        for chunk, start in zip(np.split(records, cuts), starts[np.r_[0, cuts]].tolist()):
+            segment = self.segments.get(start)
+            if segment is None:
+                segment = self.segments[start] = _Segment(os.path.join(self.directory, f"{start}{SEGMENT_SUFFIX}"),
+                                                          self.dtype)
+                self.starts = sorted(self.segments)
+            with open(segment.path, "ab") as f:
+                f.write(chunk.tobytes())
+
+    def last(self):
+        """Last record on disk, or None."""
+        for start in reversed(self.starts):
+            records = self.segments[start].records()
+            if len(records):
+                return records[-1]
+        return None
+
+    def range(self, start, end):
+        """Records with start <= t < end."""
+        first = np.searchsorted(self.starts, np.floor(start / self.span) * self.span, "left")
+        last = np.searchsorted(self.starts, end, "left")
+        parts = []
+        for segment_start in self.starts[first:last]:
+            segment = self.segments[segment_start]
+            records = segment.records()
+            low = segment.search(start, "left") if start > segment_start else 0
+            high = segment.search(end, "left") if end < segment_start + self.span else len(records)
+            if high > low:
+                parts.append(records[low:high])
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        return np.array(parts[0]) if len(parts) == 1 else np.concatenate(parts)
+
+    def as_of(self, t):
+        """Latest record with time <= t, or None."""
+        position = int(np.searchsorted(self.starts, t, "right"))
+        for segment_start in reversed(self.starts[:position]):
+            segment = self.segments[segment_start]
+            i = segment.search(t, "right") - 1
+            if i >= 0:
+                return segment.records()[i]
+        return None
+
+    def drop_before(self, cutoff):
+        """Delete segments ending at or before cutoff; returns the number deleted."""
+        dropped = [start for start in self.starts if start + self.span <= cutoff]
+        for start in dropped:
+            segment = self.segments.pop(start)
+            segment._map = None
+            os.remove(segment.path)
+        self.starts = sorted(self.segments)
+        return len(dropped)
+
+
+class _Channel:
+    def __init__(self, directory, rollups):
+        self.raw = _Series(os.path.join(directory, "raw"), RAW_DTYPE, SEGMENT_SPANS["raw"])
+        self.rollups = [(name, width, _Series(os.path.join(directory, name), ROLLUP_DTYPE, SEGMENT_SPANS[name]))
+                        for name, width in rollups]
+        self.open = [None] * len(rollups)  # Bucket being filled per rollup: [t, min, max, sum, count]
+        last = self.raw.last()
+        self.last_t = -np.inf if last is None else float(last["t"])
+        if last is not None:
+            # Rebuild the buckets that were still filling up from the raw samples on disk
+            for level, (_, width, _) in enumerate(self.rollups):
+                bucket = np.floor(self.last_t / width) * width
+                values = self.raw.range(bucket, np.inf)["value"]
+                if len(values):
+                    self.open[level] = [bucket, float(values.min()), float(values.max()), float(values.sum()),
+                                        len(values)]
+
+    def series(self, resolution):
+        if resolution == "raw":
+            return self.raw
+        for name, _, series in self.rollups:
+            if name == resolution:
+                return series
+        raise ValueError(f"Unknown resolution {resolution!r}.")
+
+    def append(self, t, values):
+        self.raw.pending.append(np.rec.fromarrays([t, values], dtype=RAW_DTYPE).view(np.ndarray))
+        self.last_t = float(t[-1])
+        for level, (_, width, series) in enumerate(self.rollups):
+            # Samples are time ordered, so every bucket is one contiguous run
+            buckets = np.floor(t / width) * width
+            cuts = np.r_[0, np.flatnonzero(np.diff(buckets)) + 1]
+            starts = buckets[cuts]
+            mins = np.minimum.reduceat(values, cuts)
+            maxs = np.maximum.reduceat(values, cuts)
+            sums = np.add.reduceat(values, cuts)
+            counts = np.diff(np.r_[cuts, len(t)])
+            current = self.open[level]
+            if current is not None:
+                if current[0] == starts[0]:
+                    mins[0] = min(mins[0], current[1])
+                    maxs[0] = max(maxs[0], current[2])
+                    sums[0] += current[3]
+                    counts[0] += current[4]
+                else:
+                    # The open bucket is complete; it is written ahead of the new ones
+                    starts, mins, maxs = np.r_[current[0], starts], np.r_[current[1], mins], np.r_[current[2], maxs]
+                    sums, counts = np.r_[current[3], sums], np.r_[current[4], counts]
+            self.open[level] = [float(starts[-1]), float(mins[-1]), float(maxs[-1]), float(sums[-1]), int(counts[-1])]
+            if len(starts) > 1:
+                series.pending.append(np.rec.fromarrays([starts[:-1], mins[:-1], maxs[:-1], sums[:-1] / counts[:-1],
+                                                         counts[:-1]], dtype=ROLLUP_DTYPE).view(np.ndarray))
+
+    def open_record(self, resolution):
+        for level, (name, _, _) in enumerate(self.rollups):
+            if name == resolution and self.open[level] is not None:
+                t, t_min, t_max, total, count = self.open[level]
+                return np.array([(t, t_min, t_max, total / count, count)], dtype=ROLLUP_DTYPE)
+        return np.empty(0, dtype=ROLLUP_DTYPE)
+
+    def write(self):
+        self.raw.write()
+        for _, _, series in self.rollups:
+            series.write()
+
+
+class TimeSeriesStore:
+    """
+    Append-only store of sensor channels with 1s / 1min / 1h rollups and retention.
+
+    Parameters:
+    - root: Directory holding the channels.
+    - rollups: (resolution, bucket width s) pairs; every width must divide its segment span.
+    - retention: Dict of resolution -> seconds of history to keep (None keeps everything).
+    - flush_every: Samples buffered in memory before they are written to the segments.
+    - clock: Wall-clock time source (UNIX seconds) for samples without a timestamp and for retention.
+    """
+
+    def __init__(self, root, rollups=ROLLUPS, retention=None, flush_every=4096, clock=time.time):
+        self.root = root
+        self.rollups = tuple(rollups)
+        self.retention = dict(DEFAULT_RETENTION if retention is None else retention)
+        self.flush_every = flush_every
+        self.clock = clock
+        self.late_samples = 0
+        self._channels = {}
+        self._buffered = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _channel(self, channel):
+        name = channel_name(channel)
+        series = self._channels.get(name)
+        if series is None:
+            series = self._channels[name] = _Channel(os.path.join(self.root, name), self.rollups)
+        return series
+
+    def channels(self):
+        """Names of the channels in the store."""
+        return sorted(set(self._channels) | {name for name in os.listdir(self.root)
+                                             if os.path.isdir(os.path.join(self.root, name))})
+
+    def append(self, channel, value, t=None):
+        """Append one sample (t defaults to the clock); returns False if it is older than the channel's latest sample."""
+        return self.extend(channel, [self.clock() if t is None else t], [value]) == 1
+
+    def extend(self, channel, t, values):
+        """
+        Append samples to a channel.
+
+        Parameters:
+        - channel: Channel name (sanitized with channel_name).
+        - t: Sample times (UNIX seconds).
+        - values: Sample values.
+
+        Returns:
+        - The number of samples stored; samples older than the channel's latest one are dropped.
+        """
+        t = np.asarray(t, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if t.size == 0:
+            return 0
+        series = self._channel(channel)
+        if np.any(np.diff(t) < 0):
+            order = np.argsort(t, kind="stable")
+            t, values = t[order], values[order]
+        keep = t >= series.last_t
+        if not keep.all():
+            self.late_samples += int(t.size - np.count_nonzero(keep))
+            t, values = t[keep], values[keep]
+            if t.size == 0:
+                return 0
+        series.append(t, values)
+        self._buffered += t.size
+        if self._buffered >= self.flush_every:
+            self.flush()
+        return t.size
+
+    def flush(self):
+        """Write the buffered records of every channel to their segments."""
+        for series in self._channels.values():
+            series.write()
+        self._buffered = 0
+
+    def range(self, channel, start, end, resolution="raw", partial=True):
+        """
+        Records of a channel with start <= t < end; rollup buckets overlapping the range are included.
+
+        Parameters:
+        - resolution: "raw" or a rollup ("1s", "1min", "1h").
+        - partial: Include the rollup bucket that is still filling up.
+
+        Returns:
+        - Structured array of RAW_DTYPE (t, value) or ROLLUP_DTYPE (t, min, max, mean, count).
+
+        Raises:
+        - ValueError: If the resolution is unknown.
+        """
+        series = self._channel(channel)
+        levels = series.series(resolution)
+        series.write()
+        if resolution != "raw":
+            # Include the bucket that contains start
+            width = dict(self.rollups)[resolution]
+            start = np.floor(start / width) * width
+        records = levels.range(start, end)
+        if resolution != "raw" and partial:
+            tail = series.open_record(resolution)
+            if len(tail) and start <= tail["t"][0] < end:
+                records = np.concatenate([records, tail])
+        return records
+
+    def as_of(self, channel, t, resolution="raw"):
+        """Latest record of a channel at or before time t, or None."""
+        series = self._channel(channel)
+        levels = series.series(resolution)
+        series.write()
+        if resolution != "raw":
+            tail = series.open_record(resolution)
+            if len(tail) and tail["t"][0] <= t:
+                return tail[0]
+        return levels.as_of(t)
+
+    def apply_retention(self, now=None):
+        """Delete segments that ended before the retention window of their resolution; returns the number deleted."""
+        now = self.clock() if now is None else now
+        self.flush()
+        dropped = 0
+        for name in self.channels():
+            series = self._channel(name)
+            for resolution in ("raw",) + tuple(rollup for rollup, _ in self.rollups):
+                keep_s = self.retention.get(resolution)
+                if keep_s is not None:
+                    dropped += series.series(resolution).drop_before(now - keep_s)
+        if dropped:
+            logging.info(f"Retention removed {dropped} time-series segments")
+        return dropped
+
+    def close(self):
+        """Write everything buffered; rollup buckets still filling up are rebuilt from disk when reopened."""
+        self.flush()
+
+
+# Test Suite
+class TestTimeSeriesStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_rollups_match_raw_samples(self):
+        store = TimeSeriesStore(self.root, flush_every=1000)
+        t = 1.7e9 + np.arange(0, 2 * 86400, 0.5)
+        values = np.sin(t / 977.0)
+        for chunk in range(0, len(t), 10_000):
+            store.extend("T", t[chunk:chunk + 10_000], values[chunk:chunk + 10_000])
+        hourly = store.range("T", t[0], t[-1] + 1, "1h")
+        self.assertEqual(hourly["count"].sum(), len(t))
+        for record in hourly[[0, 17, -1]]:
+            window = values[(t >= record["t"]) & (t < record["t"] + 3600)]
+            self.assertAlmostEqual(record["mean"], window.mean(), places=10)
+            self.assertEqual((record["min"], record["max"]), (window.min(), window.max()))
+        raw = store.range("T", t[1000], t[3000])
+        np.testing.assert_array_equal(raw["t"], t[1000:3000])
+        self.assertEqual(store.as_of("T", t[5000] + 0.25)["t"], t[5000])
+
+        # Reopening continues the buckets that were still open
+        store.close()
+        store = TimeSeriesStore(self.root)
+        store.extend("T", t[-1] + np.arange(1, 3601), np.zeros(3600))
+        minutes = store.range("T", t[0], np.inf, "1min")
+        self.assertEqual(minutes["count"].sum(), len(t) + 3600)
+        self.assertTrue(np.all(np.diff(minutes["t"]) > 0))
+
+    def test_late_samples_and_retention(self):
+        store = TimeSeriesStore(self.root, retention={"raw": 86400}, clock=lambda: 10 * 86400.0)
+        store.extend("V", [86400.0, 86401.0], [1.0, 2.0])
+        self.assertFalse(store.append("V", 3.0, t=86400.5))
+        self.assertEqual(store.late_samples, 1)
+        store.extend("V", [9 * 86400.0], [4.0])
+        self.assertEqual(store.apply_retention(), 1)
+        self.assertEqual(len(store.range("V", 0, np.inf)), 1)
+        self.assertEqual(store.range("V", 0, np.inf, "1h")["count"].sum(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -2,9 +2,6 @@
 import simpy
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
-
 class TeslaMegapack:
     def __init__(self, env, capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw):
         self.env = env  # SimPy environment
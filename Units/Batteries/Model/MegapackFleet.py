@@ -0,0 +1,227 @@
+import logging
+import unittest
+
+import numpy as np
+import simpy
+
+
+class TeslaMegapackFleet:
+    """
+    Fleet of Megapack units whose state is held in NumPy arrays (one element per unit).
+
+    Charge and discharge requests are fleet-level energies over one time step and are allocated
+    across the available units in a single vectorized call, in proportion to each unit's headroom.
+    Headroom is limited by the unit's rate, its remaining capacity (charging) or stored energy
+    (discharging), and its efficiency. The fleet keeps the single-unit TeslaMegapack API
+    (charge, discharge, get_state_of_charge, get_stored_energy), so it can replace a TeslaMegapack.
+
+    Parameters:
+    - env: SimPy environment.
+    - n_units: Number of units; per-unit parameters may be scalars or arrays of this length.
+    - capacity_mwh: Usable capacity per unit in MWh.
+    - max_charge_rate_mw / max_discharge_rate_mw: Rate limits per unit in MW.
+    - charge_efficiency / discharge_efficiency: One-way efficiencies; their product is the round-trip efficiency.
+    - availability: Boolean per unit; unavailable units neither charge nor discharge.
+    - initial_soc: Initial state of charge per unit as a fraction of capacity.
+    - time_step_h: Duration of one charge/discharge request in hours.
+    - log_interval: If set, a single fleet process logs the fleet state every log_interval time units.
+    """
+
+    def __init__(self, env, n_units, capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw, charge_efficiency=0.95,
+                 discharge_efficiency=0.95, availability=True, initial_soc=0.0, time_step_h=1.0, log_interval=None):
+        self.env = env
+        self.n_units = n_units
+        self.nominal_capacity_mwh = self._per_unit(capacity_mwh)
+        self.unit_capacity_mwh = self.nominal_capacity_mwh.copy()  # Reduced by degradation
+        self.max_charge_rate_mw = self._per_unit(max_charge_rate_mw)
+        self.max_discharge_rate_mw = self._per_unit(max_discharge_rate_mw)
+        self.charge_efficiency = self._per_unit(charge_efficiency)
+        self.discharge_efficiency = self._per_unit(discharge_efficiency)
+        self.availability = self._per_unit(availability, dtype=bool)
+        self.unit_stored_mwh = self.unit_capacity_mwh * self._per_unit(initial_soc)
+        self.time_step_h = time_step_h
+        self.state = "IDLE"
+        if np.any(self.charge_efficiency <= 0) or np.any(self.charge_efficiency > 1) \
+                or np.any(self.discharge_efficiency <= 0) or np.any(self.discharge_efficiency > 1):
+            raise ValueError("Efficiencies must be in (0, 1].")
+        self.process_ref = env.process(self.process(log_interval)) if log_interval else None
+
+    def _per_unit(self, value, dtype=np.float64):
+        return np.array(np.broadcast_to(np.asarray(value, dtype=dtype), (self.n_units,)))
+
+    def process(self, log_interval):
+        while True:
+            self.step()
+            yield self.env.timeout(log_interval)
+
+    def step(self):
+        logging.info(f"At {self.env.now}, Fleet State: {self.state}, Stored Energy: {self.stored_energy_mwh} MWh, "
+                     f"Available Units: {int(self.availability.sum())}/{self.n_units}")
+
+    # Fleet totals, compatible with the single-unit attributes
+
+    @property
+    def capacity_mwh(self):
+        return float(self.unit_capacity_mwh.sum())
+
+    @property
+    def stored_energy_mwh(self):
+        return float(self.unit_stored_mwh.sum())
+
+    def charge_headroom_mwh(self):
+        """Grid-side energy each unit can accept during one time step."""
+        room = np.maximum(self.unit_capacity_mwh - self.unit_stored_mwh, 0.0) / self.charge_efficiency
+        return np.where(self.availability, np.minimum(self.max_charge_rate_mw * self.time_step_h, room), 0.0)
+
+    def discharge_headroom_mwh(self):
+        """Grid-side energy each unit can deliver during one time step."""
+        room = self.unit_stored_mwh * self.discharge_efficiency
+        return np.where(self.availability, np.minimum(self.max_discharge_rate_mw * self.time_step_h, room), 0.0)
+
+    @staticmethod
+    def _allocate(energy_mwh, headroom):
+        total = headroom.sum()
+        if energy_mwh <= 0 or total <= 0:
+            return np.zeros_like(headroom)
+        # Proportional to headroom, so no unit exceeds its own limit
+        return headroom * min(1.0, energy_mwh / total)
+
+    def charge(self, energy_mwh):
+        """
+        Charge the fleet with up to energy_mwh of grid-side energy during one time step.
+
+        Returns:
+        - The grid-side energy accepted in MWh; the rest could not be absorbed.
+        """
+        if energy_mwh < 0:
+            logging.error("Energy to charge cannot be negative!")
+            raise ValueError("Energy to charge cannot be negative!")
+        accepted = self._allocate(energy_mwh, self.charge_headroom_mwh())
+        self.unit_stored_mwh = np.minimum(self.unit_stored_mwh + accepted * self.charge_efficiency,
+                                          self.unit_capacity_mwh)
+        total = float(accepted.sum())
+        self.state = "CHARGING" if total > 0 else "IDLE"
+        return total
+
+    def discharge(self, energy_mwh):
+        """
+        Discharge up to energy_mwh of grid-side energy from the fleet during one time step.
+
+        Returns:
+        - The grid-side energy delivered in MWh.
+        """
+        if energy_mwh < 0:
+            logging.error("Energy to discharge cannot be negative!")
+            raise ValueError("Energy to discharge cannot be negative!")
+        delivered = self._allocate(energy_mwh, self.discharge_headroom_mwh())
+        self.unit_stored_mwh = np.maximum(self.unit_stored_mwh - delivered / self.discharge_efficiency, 0.0)
+        total = float(delivered.sum())
+        self.state = "DISCHARGING" if total > 0 else "IDLE"
+        return total
+
+    def set_availability(self, units, available):
+        """Mark units (index, slice or mask) as available or out of service."""
+        self.availability[units] = available
+
+    def set_unit_capacity(self, capacity_mwh):
+        """Set the usable capacity per unit (e.g. after degradation); stored energy above it is clipped."""
+        self.unit_capacity_mwh = self._per_unit(capacity_mwh)
+        np.minimum(self.unit_stored_mwh, self.unit_capacity_mwh, out=self.unit_stored_mwh)
+
+    def get_unit_state_of_charge(self):
+        # State of charge of every unit as a fraction
+        return np.divide(self.unit_stored_mwh, self.unit_capacity_mwh, out=np.zeros(self.n_units),
+                         where=self.unit_capacity_mwh > 0)
+
+    def get_state_of_charge(self):
+        # Return the fleet state of charge as a percentage
+        return (self.stored_energy_mwh / self.capacity_mwh) * 100
+
+    def get_stored_energy(self):
+        # Return the amount of energy currently stored in the fleet
+        return self.stored_energy_mwh
+
+    def get_checkpoint_state(self):
+        return {"unit_stored_mwh": self.unit_stored_mwh.copy(), "unit_capacity_mwh": self.unit_capacity_mwh.copy(),
+                "availability": self.availability.copy(), "state": self.state}
+
+    def restore_checkpoint_state(self, checkpoint_state):
+        self.unit_stored_mwh = checkpoint_state["unit_stored_mwh"].copy()
+        self.unit_capacity_mwh = checkpoint_state["unit_capacity_mwh"].copy()
+        self.availability = checkpoint_state["availability"].copy()
+        self.state = checkpoint_state["state"]
+
+
+# Test Suite
+class TestTeslaMegapackFleet(unittest.TestCase):
+    def _fleet(self, **kwargs):
+        params = dict(n_units=4, capacity_mwh=4.0, max_charge_rate_mw=1.0, max_discharge_rate_mw=2.0,
+                      charge_efficiency=1.0, discharge_efficiency=1.0)
+        params.update(kwargs)
+        return TeslaMegapackFleet(simpy.Environment(), **params)
+
+    def test_rate_limits_clip_charge_and_discharge(self):
+        fleet = self._fleet()
+        self.assertAlmostEqual(fleet.charge(10.0), 4.0)  # 4 units x 1 MW x 1 h
+        np.testing.assert_allclose(fleet.unit_stored_mwh, 1.0)
+        self.assertEqual(fleet.state, "CHARGING")
+        self.assertAlmostEqual(fleet.discharge(10.0), 4.0)  # Limited by the stored energy, not the 2 MW rate
+        fleet.unit_stored_mwh[:] = 4.0
+        self.assertAlmostEqual(fleet.discharge(10.0), 8.0)
+        self.assertAlmostEqual(fleet.charge(0.0), 0.0)
+        self.assertEqual(fleet.state, "IDLE")
+        with self.assertRaises(ValueError):
+            fleet.charge(-1.0)
+
+        full = self._fleet(initial_soc=1.0)
+        self.assertAlmostEqual(full.charge(1.0), 0.0)
+        np.testing.assert_allclose(full.unit_stored_mwh, 4.0)
+
+    def test_efficiency_losses(self):
+        fleet = self._fleet(charge_efficiency=0.9, discharge_efficiency=0.8, max_charge_rate_mw=10.0,
+                            max_discharge_rate_mw=10.0)
+        self.assertAlmostEqual(fleet.charge(2.0), 2.0)
+        self.assertAlmostEqual(fleet.get_stored_energy(), 1.8)
+        self.assertAlmostEqual(fleet.discharge(10.0), 1.8 * 0.8)
+        self.assertAlmostEqual(fleet.get_stored_energy(), 0.0)
+        # Headroom is grid-side: a full fleet needs capacity / charge_efficiency
+        self.assertAlmostEqual(fleet.charge(100.0), 16.0 / 0.9)
+        self.assertAlmostEqual(fleet.get_state_of_charge(), 100.0)
+        with self.assertRaises(ValueError):
+            self._fleet(charge_efficiency=0.0)
+
+    def test_unavailable_units_are_skipped(self):
+        fleet = self._fleet(availability=[True, False, True, True])
+        self.assertAlmostEqual(fleet.charge(10.0), 3.0)
+        np.testing.assert_allclose(fleet.unit_stored_mwh, [1.0, 0.0, 1.0, 1.0])
+        fleet.set_availability(1, True)
+        fleet.set_availability([0, 2], False)
+        self.assertAlmostEqual(fleet.charge(1.5), 1.5)
+        np.testing.assert_allclose(fleet.unit_stored_mwh, [1.0, 0.75, 1.0, 1.75])
+        self.assertAlmostEqual(fleet.discharge(1.0), 1.0)
+        # Allocated in proportion to the headroom of the available units (stored energy here)
+        np.testing.assert_allclose(fleet.unit_stored_mwh, [1.0, 0.75 * 0.6, 1.0, 1.75 * 0.6])
+
+    def test_single_unit_api_matches_tesla_megapack(self):
+        from Units.Batteries.Model.TeslaMegapack import TeslaMegapack
+        env = simpy.Environment()
+        unit = TeslaMegapack(env, capacity_mwh=10, max_charge_rate_mw=100, max_discharge_rate_mw=100,
+                             start_process=False)
+        fleet = TeslaMegapackFleet(env, 1, capacity_mwh=10, max_charge_rate_mw=100, max_discharge_rate_mw=100,
+                                   charge_efficiency=1.0, discharge_efficiency=1.0)
+        for action, energy in [("charge", 4.0), ("charge", 9.0), ("discharge", 3.0), ("discharge", 20.0),
+                               ("charge", 2.5)]:
+            getattr(unit, action)(energy)
+            getattr(fleet, action)(energy)
+            self.assertAlmostEqual(fleet.get_stored_energy(), unit.get_stored_energy())
+            self.assertAlmostEqual(fleet.get_state_of_charge(), unit.get_state_of_charge())
+            self.assertEqual(fleet.state, unit.state)
+        self.assertAlmostEqual(fleet.capacity_mwh, unit.capacity_mwh)
+
+        restored = TeslaMegapackFleet(env, 1, capacity_mwh=10, max_charge_rate_mw=100, max_discharge_rate_mw=100)
+        restored.restore_checkpoint_state(fleet.get_checkpoint_state())
+        self.assertAlmostEqual(restored.get_stored_energy(), fleet.get_stored_energy())
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -2,25 +2,27 @@ import simpy
 
 
 class TeslaMegapack:
-    def __init__(self, env, capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw):
+    def __init__(self, env, capacity_mwh, max_charge_rate_mw, max_discharge_rate_mw, start_process=True):
         self.env = env  # SimPy environment
         self.capacity_mwh = capacity_mwh
         self.max_charge_rate_mw = max_charge_rate_mw
         self.max_discharge_rate_mw = max_discharge_rate_mw
         self.stored_energy_mwh = 0  # Initially, the battery is empty
         self.state = "IDLE"  # Initial state is IDLE
-        self.process_ref = env.process(self.process())  # Registering the process method with the environment
+        # Registering the process method with the environment, unless a TickScheduler steps the battery
+        self.process_ref = env.process(self.process()) if start_process else None
 
     def process(self):
         while True:
-            # Logic to interact with other components and manage the battery state
-            # Logic for charging, discharging, and messaging will be added here
-            # based on the interactions with other components in your system
-
-            print(f"At {self.env.now}, Battery State: {self.state}, Stored Energy: {self.stored_energy_mwh} MWh")
-
+            self.step()
             yield self.env.timeout(1)  # Run the process every hour or as needed
 
+    def step(self):
+        # Logic to interact with other components and manage the battery state
+        # Logic for charging, discharging, and messaging will be added here
+        # based on the interactions with other components in your system
+        print(f"At {self.env.now}, Battery State: {self.state}, Stored Energy: {self.stored_energy_mwh} MWh")
+
     def charge(self, energy_mwh):
         # Logic to charge the battery with the specified amount of energy
         # Ensure that the battery does not overcharge
@@ -43,6 +45,13 @@ class TeslaMegapack:
         # Return the amount of energy currently stored in the battery
         return self.stored_energy_mwh
 
+    def get_checkpoint_state(self):
+        return {"stored_energy_mwh": self.stored_energy_mwh, "state": self.state}
+
+    def restore_checkpoint_state(self, checkpoint_state):
+        self.stored_energy_mwh = checkpoint_state["stored_energy_mwh"]
+        self.state = checkpoint_state["state"]
+
 
 # # Example of how to use this class with SimPy
 # if __name__ == "__main__":
@@ -1,6 +1,7 @@
-import sympy as sp
 from pint import UnitRegistry
-from sympy import lambdify, Q
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 
 class HydrogenCompressionParameters:
@@ -40,7 +41,7 @@ class HydrogenCompressionModel:
         self.ureg = UnitRegistry()
         self.p1, self.p2, self.T, self.R = sp.symbols('p1 p2 T R')
         self.wi_symbolic = self.R * self.T * sp.log(self.p2 / self.p1)
-        self.wi_lambda = lambdify((self.p1, self.p2, self.T, self.R), self.wi_symbolic)
+        self.wi_lambda = sp.lambdify((self.p1, self.p2, self.T, self.R), self.wi_symbolic)
 
     def ideal_compression_work(self, params: HydrogenCompressionParameters):
         """
@@ -57,7 +58,7 @@ class HydrogenCompressionModel:
         p2 = params.p2 * self.ureg.bar
         T = params.T * self.ureg.K
         wi = self.wi_lambda(p1.magnitude, p2.magnitude, T.magnitude, R)
-        return Q(wi, self.ureg.J / self.ureg.mol).to(self.ureg.kJ / self.ureg.mol)
+        return self.ureg.Quantity(wi, self.ureg.J / self.ureg.mol).to(self.ureg.kJ / self.ureg.mol)
 
     def internal_work(self, params: HydrogenCompressionParameters):
         """
@@ -93,26 +94,25 @@ class HydrogenCompressionModel:
             delta_T = 50  # in Kelvin
         else:
             delta_T = 0  # Placeholder
-        return Q(delta_T, self.ureg.K)
-
-
-# Example Usage:
-p1 = 1  # bar
-p2 = 900  # bar
-T = 298.15  # K (25°C)
-qK = 8181  # kJ/kg
-h1 = 3787  # kJ/kg
-h2 = 4383  # kJ/kg
+        return self.ureg.Quantity(delta_T, self.ureg.K)
 
-compressor_params = HydrogenCompressionParameters(p1, p2, T, qK, h1, h2)
-compressor_model = HydrogenCompressionModel()
 
-wi_ideal = compressor_model.ideal_compression_work(compressor_params)
-wi_internal = compressor_model.internal_work(compressor_params)
-temperature_increase = compressor_model.temperature_increase_due_to_expansion(1000, 13)
+if __name__ == "__main__":
+    # Example Usage:
+    p1 = 1  # bar
+    p2 = 900  # bar
+    T = 298.15  # K (25°C)
+    qK = 8181  # kJ/kg
+    h1 = 3787  # kJ/kg
+    h2 = 4383  # kJ/kg
 
-print(f"Ideal Compression Work: {wi_ideal}")
-print(f"Internal Work: {wi_internal}")
-print(f"Temperature Increase due to Expansion: {temperature_increase}")
+    compressor_params = HydrogenCompressionParameters(p1, p2, T, qK, h1, h2)
+    compressor_model = HydrogenCompressionModel()
 
+    wi_ideal = compressor_model.ideal_compression_work(compressor_params)
+    wi_internal = compressor_model.internal_work(compressor_params)
+    temperature_increase = compressor_model.temperature_increase_due_to_expansion(1000, 13)
 
+    print(f"Ideal Compression Work: {wi_ideal}")
+    print(f"Internal Work: {wi_internal}")
+    print(f"Temperature Increase due to Expansion: {temperature_increase}")
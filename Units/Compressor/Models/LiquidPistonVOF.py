@@ -0,0 +1,404 @@
+"""
+1-D axial volume-of-fluid solver for the liquid-piston hydrogen compressor.
+
+An ionic liquid is pumped in and out at the bottom of a vertical cylinder and compresses the hydrogen above it.
+The gas leaves through the discharge valve at the top once it reaches P_out and is admitted through the intake
+valve once it has expanded to P_in. The cylinder is divided into n_cells finite volumes along its axis, holding
+- alpha: the liquid volume fraction (VOF colour function), transported as the volume of the incompressible liquid
+  (continuity_equation of the liquid) with Hirt-Nichols donor-acceptor fluxes that keep the interface sharp;
+- rho_gas: the gas partial density (1 - alpha) * rho_H2, transported with upwind fluxes (continuity_equation of
+  the gas).
+The flow is far below the speed of sound, so the momentum equation reduces to a uniform gas pressure p. With an
+ideal gas, p / (gamma - 1) is the internal energy per volume, so the energy equation gives dp/dt and the velocity
+divergence of every cell from the compression, the heat exchanged and the hydrogen dissolved; the face velocities
+are the divergences summed from the bottom. Gas temperatures follow from p, alpha and rho_gas.
+
+The gas exchanges heat with the wall and, at the interface, with the liquid, whose temperature is lumped over the
+cylinder and reservoir. Hydrogen dissolves at the interface (Henry's law). The liquid density, from the liquid
+temperature, sets the droplet size, gas vortex dimension and hydrogen mass transfer rate of liquid_density_effects;
+smaller droplets enlarge the interfacial area. The liquid column moves as a whole, so the pump pressure is p plus
+the hydrostatic and inertial head of the column.
+
+Time steps adapt to the CFL condition and the updates are conservative: the gas mass in the cylinder always equals
+the initial mass plus the admitted minus the delivered and dissolved mass, to round-off.
+"""
+import math
+import unittest
+
+import numpy as np
+
+from Units.Compressor.Models.liquid_density_effects import (
+    GAS_CONSTANT, H2_PROPERTIES, compute_droplet_size, compute_gas_vortex_dimension, compute_hydrogen_mass_transfer
+)
+
+M_H2 = 2.016e-3  # kg/mol
+G = 9.81  # m/s^2
+GAS_MIN = 1e-6  # Gas volume fraction below which a cell counts as liquid
+
+
+def _flow_direction(u):
+    """1 if no velocity is negative, -1 if none is positive, 0 for mixed directions."""
+    if u.min() >= 0:
+        return 1
+    if u.max() <= 0:
+        return -1
+    return 0
+
+
+class LiquidPistonParameters:
+    """
+    Parameters (SI units):
+    - length / diameter: Cylinder height and bore (m).
+    - n_cells: Number of finite volumes along the axis.
+    - stroke: Travel of the liquid level (m); it moves sinusoidally between length - stroke - clearance and
+      length - clearance.
+    - clearance: Gas height left at the top of the stroke (m).
+    - frequency: Cycles per second.
+    - P_in / P_out: Suction and discharge pressure (Pa).
+    - T_in: Suction gas temperature (K), also the initial liquid temperature.
+    - T_wall: Cylinder wall temperature (K).
+    - liquid_density: Ionic liquid density at T_in (kg/m^3).
+    - liquid_expansion: Volumetric thermal expansion coefficient of the liquid (1/K).
+    - liquid_cp: Liquid specific heat (J/(kg K)).
+    - reservoir_volume: Liquid outside the cylinder sharing its temperature (m^3).
+    - h_wall / h_interface: Gas-wall and gas-liquid heat transfer coefficients (W/(m^2 K)).
+    - k_mass_transfer: Liquid-side mass transfer coefficient of hydrogen (m/s), scaled by
+      compute_hydrogen_mass_transfer.
+    - henry_solubility: Hydrogen solubility in the liquid (mol/(m^3 Pa)).
+    - cfl: Courant number of the adaptive time step.
+    - dt_max: Upper bound of the time step (s).
+    """
+
+    def __init__(self, length=0.5, diameter=0.1, n_cells=1000, stroke=0.4, clearance=0.05, frequency=0.5,
+                 P_in=30e5, P_out=200e5, T_in=343.15, T_wall=343.15, liquid_density=1400.0, liquid_expansion=6e-4,
+                 liquid_cp=1600.0, reservoir_volume=0.01, h_wall=50.0, h_interface=500.0, k_mass_transfer=1e-4,
+                 henry_solubility=1e-5, cfl=0.4, dt_max=1e-3):
+        self.length = length
+        self.diameter = diameter
+        self.n_cells = n_cells
+        self.stroke = stroke
+        self.clearance = clearance
+        self.frequency = frequency
+        self.P_in = P_in
+        self.P_out = P_out
+        self.T_in = T_in
+        self.T_wall = T_wall
+        self.liquid_density = liquid_density
+        self.liquid_expansion = liquid_expansion
+        self.liquid_cp = liquid_cp
+        self.reservoir_volume = reservoir_volume
+        self.h_wall = h_wall
+        self.h_interface = h_interface
+        self.k_mass_transfer = k_mass_transfer
+        self.henry_solubility = henry_solubility
+        self.cfl = cfl
+        self.dt_max = dt_max
+
+
+class LiquidPistonVOF:
+    """
+    Liquid-piston compressor on a 1-D axial grid.
+
+    Parameters:
+    - params: LiquidPistonParameters.
+
+    Raises:
+    - ValueError: If the stroke and clearance do not fit in the cylinder.
+    """
+
+    def __init__(self, params: LiquidPistonParameters):
+        self.params = params
+        n = params.n_cells
+        self.level_min = params.length - params.stroke - params.clearance
+        if self.level_min <= 0 or params.clearance <= 0:
+            raise ValueError("Stroke and clearance must leave liquid at the bottom and gas at the top.")
+        self.dx = params.length / n
+        self.area = math.pi * params.diameter ** 2 / 4
+        self.omega = 2 * math.pi * params.frequency
+        self.x = (np.arange(n) + 0.5) * self.dx
+
+        self.cp = H2_PROPERTIES["specific_heat"].m_as("J/(kg*K)")
+        self.R_gas = GAS_CONSTANT.m_as("J/(mol*K)") / M_H2
+        self.gamma = self.cp / (self.cp - self.R_gas)
+        self.rho_in = params.P_in / (self.R_gas * params.T_in)
+
+        # Fields: liquid at the bottom up to level_min, suction gas above it
+        self.alpha = np.clip((self.level_min - (self.x - self.dx / 2)) / self.dx, 0.0, 1.0)
+        self.rho_gas = (1 - self.alpha) * self.rho_in
+        self.p = params.P_in
+        self.T_liquid = params.T_in
+        self.u_faces = np.zeros(n + 1)
+        self.t = 0.0
+        self.discharging = False
+        self.admitting = False
+
+        # Work arrays: alpha with two ghost cells per end (liquid below, gas above), gas density with one
+        self._alpha_ext = np.empty(n + 4)
+        self._alpha_ext[:2] = 1.0
+        self._alpha_ext[-2:] = 0.0
+        self._rho_ext = np.empty(n + 2)
+        self._rho_ext[-1] = self.rho_in
+
+        self.steps = 0
+        self.cycles = 0
+        self._reset_totals()
+
+    def _reset_totals(self):
+        self.totals = {"delivered_mass": 0.0, "admitted_mass": 0.0, "dissolved_mass": 0.0, "pump_work": 0.0,
+                       "heat_to_liquid": 0.0, "heat_to_wall": 0.0, "p_max": self.p, "T_gas_max": 0.0,
+                       "liquid_density_time": 0.0, "steps": 0}
+
+    def liquid_level(self, t):
+        return self.level_min + self.params.stroke * (1 - math.cos(self.omega * t)) / 2
+
+    def piston_velocity(self, t):
+        return self.params.stroke * self.omega * math.sin(self.omega * t) / 2
+
+    def piston_acceleration(self, t):
+        return self.params.stroke * self.omega ** 2 * math.cos(self.omega * t) / 2
+
+    def liquid_density(self):
+        p = self.params
+        return p.liquid_density * (1 - p.liquid_expansion * (self.T_liquid - p.T_in))
+
+    def gas_temperature(self):
+        """Gas temperature per cell (K); cells without gas report the liquid temperature."""
+        g = 1 - self.alpha
+        gas = (g > GAS_MIN) & (self.rho_gas > 0)
+        T = np.full_like(g, self.T_liquid)
+        np.divide(self.p * g, self.rho_gas * self.R_gas, out=T, where=gas)
+        return T
+
+    def gas_mass(self):
+        """Gas mass in the cylinder (kg)."""
+        return float(self.rho_gas.sum()) * self.dx * self.area
+
+    def _face_velocities(self, u_in, source, g, valve_open):
+        """Set u_faces from the volume sources and gas fractions per cell; returns dp/dt."""
+        gamma = self.gamma
+        p = self.p
+        if valve_open:
+            dp_dt = 0.0
+        else:
+            dp_dt = gamma * p * (float(np.sum(source)) + u_in) / (float(g.sum()) * self.dx)
+        u_faces = self.u_faces
+        u_faces[0] = u_in
+        np.cumsum(source - g * self.dx * dp_dt / (gamma * p), out=u_faces[1:])
+        u_faces[1:] += u_in
+        if not valve_open:
+            u_faces[-1] = 0.0  # Closed top; equal to the sum up to round-off
+        return dp_dt
+
+    def _liquid_flux(self, dt):
+        """
+        Liquid volume crossing each face in a step (per m^2 of bore), donor-acceptor: the interface lies across
+        the axis, so the acceptor's fraction is advected, limited to the liquid the donor holds and to its gas
+        running out. The bottom face passes liquid only, the top face gas only.
+        """
+        ext = self._alpha_ext
+        u_faces = self.u_faces
+        below, above = ext[1:-2], ext[2:-1]
+        direction = _flow_direction(u_faces)
+        if direction > 0:
+            donor, acceptor = below, above
+        elif direction < 0:
+            donor, acceptor = above, below
+        else:
+            forward = u_faces >= 0
+            donor, acceptor = np.where(forward, below, above), np.where(forward, above, below)
+        volume = np.abs(u_faces) * dt
+        liquid_flux = np.minimum(acceptor * volume + np.maximum((1 - acceptor) * volume - (1 - donor) * self.dx, 0.0),
+                                 donor * self.dx)
+        liquid_flux[0] = volume[0]
+        liquid_flux[-1] = 0.0
+        return np.copysign(liquid_flux, u_faces, out=liquid_flux)
+
+    def step(self, until=None):
+        """
+        Advance by one adaptive time step, ending at `until` at the latest.
+
+        Returns:
+        - The time step taken (s).
+        """
+        params = self.params
+        dx = self.dx
+        gamma = self.gamma
+        alpha = self.alpha
+        r = self.rho_gas
+        p = self.p
+        g = 1 - alpha
+        gas = (g > GAS_MIN) & (r > 0)
+        T = self.gas_temperature()
+
+        u_in = self.piston_velocity(self.t)
+        if u_in > 0:
+            self.admitting = False
+        elif u_in < 0:
+            self.discharging = False
+        valve_open = self.discharging or self.admitting
+
+        u_max = max(abs(u_in), float(np.max(np.abs(self.u_faces))))
+        dt = params.dt_max if u_max == 0 else min(params.dt_max, params.cfl * dx / u_max)
+        if until is not None:
+            dt = min(dt, until - self.t)
+
+        # The interface may fill a cell within the step, so the compression, heat and mass exchange act on the gas
+        # left at the end of the step: predict it with the liquid fluxes of source-free velocities
+        self._alpha_ext[2:-2] = alpha
+        self._face_velocities(u_in, 0.0, g, valve_open)
+        liquid_flux = self._liquid_flux(dt)
+        g_end = np.clip(g + (liquid_flux[1:] - liquid_flux[:-1]) / dx, 0.0, 1.0)
+        remaining = np.ones_like(g)
+        np.divide(g_end, g, out=remaining, where=gas)
+        np.minimum(remaining, 1.0, out=remaining)
+
+        # Interfacial area per cross-section, spread over the cells the interface passes through
+        rho_liquid = self.liquid_density()
+        interface = 0.5 * np.abs(self._alpha_ext[3:-1] - self._alpha_ext[1:-3]) / compute_droplet_size(rho_liquid)
+
+        # Heat to the gas (W per m^2 of bore), relaxing each cell exactly towards the wall and liquid temperatures
+        H_wall = params.h_wall * 4 / params.diameter * g * dx
+        H_interface = params.h_interface * interface
+        H = H_wall + H_interface
+        C = r * dx * self.cp
+        exchanging = gas & (H > 0)
+        T_eq = np.divide(H_wall * params.T_wall + H_interface * self.T_liquid, H, out=T.copy(), where=exchanging)
+        relaxed = np.zeros_like(C)
+        np.divide(dt * H, C, out=relaxed, where=exchanging)
+        Q = C * (T_eq - T) * -np.expm1(-relaxed) / dt * remaining
+        Q_interface = np.divide(Q * H_interface, H, out=np.zeros_like(Q), where=exchanging)
+
+        # Hydrogen dissolving at the interface (kg/s per m^2 of bore). The pressure is uniform, so the gas is taken
+        # from every cell in proportion to the mass it keeps, at most half of the gas per step.
+        gas_mass = float(r.sum())
+        dissolving = (params.k_mass_transfer * compute_hydrogen_mass_transfer(rho_liquid) * params.henry_solubility
+                      * p * M_H2 * float(interface.sum()))
+        S = r * remaining
+        S *= min(dissolving, 0.5 * gas_mass * dx / dt) / max(float(S.sum()), 1e-300)
+
+        # Uniform gas pressure: energy conservation gives the volume source of every cell and dp/dt
+        rho_cell = np.full_like(r, self.rho_in)
+        np.divide(r, g, out=rho_cell, where=gas)
+        source = (gamma - 1) * Q / (gamma * p) - S / rho_cell
+        dp_dt = self._face_velocities(u_in, source, g_end, valve_open)
+        liquid_flux = self._liquid_flux(dt)
+        u_faces = self.u_faces
+
+        # Gas mass fluxes, upwind, from the gas volume crossing each face
+        rho_ext = self._rho_ext
+        rho_ext[0] = rho_cell[0]
+        rho_ext[1:-1] = rho_cell
+        direction = _flow_direction(u_faces)
+        if direction:
+            rho_up = rho_ext[:-1] if direction > 0 else rho_ext[1:]
+        else:
+            rho_up = np.where(u_faces >= 0, rho_ext[:-1], rho_ext[1:])
+        gas_flux = rho_up * (u_faces * dt - liquid_flux)
+
+        alpha -= (liquid_flux[1:] - liquid_flux[:-1]) / dx
+        np.clip(alpha, 0.0, 1.0, out=alpha)
+        r -= (gas_flux[1:] - gas_flux[:-1]) / dx + S * (dt / dx)
+        np.maximum(r, 0.0, out=r)
+
+        p_new = p + dp_dt * dt
+        if not valve_open:
+            if u_in > 0 and p_new >= params.P_out:
+                p_new, self.discharging = params.P_out, True
+            elif u_in < 0 and p_new <= params.P_in:
+                p_new, self.admitting = params.P_in, True
+        self.p = p_new
+
+        # Lumped liquid temperature and bookkeeping
+        area = self.area
+        level = self.liquid_level(self.t)
+        heat_to_liquid = -float(Q_interface.sum()) * area * dt
+        liquid_mass = rho_liquid * (level * area + params.reservoir_volume)
+        self.T_liquid += heat_to_liquid / (liquid_mass * params.liquid_cp)
+        pump_pressure = p + rho_liquid * level * (G + self.piston_acceleration(self.t))
+        totals = self.totals
+        totals["delivered_mass"] += max(float(gas_flux[-1]), 0.0) * area
+        totals["admitted_mass"] += max(-float(gas_flux[-1]), 0.0) * area
+        totals["dissolved_mass"] += float(S.sum()) * area * dt
+        totals["pump_work"] += pump_pressure * u_in * area * dt
+        totals["heat_to_liquid"] += heat_to_liquid
+        totals["heat_to_wall"] -= float((Q - Q_interface).sum()) * area * dt
+        totals["p_max"] = max(totals["p_max"], self.p)
+        totals["T_gas_max"] = max(totals["T_gas_max"], float(T[gas].max(initial=0.0)))
+        totals["liquid_density_time"] += rho_liquid * dt
+        totals["steps"] += 1
+
+        self.t += dt
+        self.steps += 1
+        return dt
+
+    def run_cycle(self):
+        """
+        Run one compression cycle (one period of the liquid piston).
+
+        Returns:
+        - Dict with the delivered, admitted and dissolved hydrogen (kg), pump work (J) and specific work (J/kg
+          delivered), heat to the liquid and wall (J), peak pressure (Pa) and gas temperature (K), volumetric
+          efficiency, the cycle-mean liquid density (kg/m^3) with its droplet size, gas vortex dimension and
+          hydrogen mass transfer rate, the liquid temperature at the end (K) and the number of steps.
+        """
+        self._reset_totals()
+        start = self.t
+        end = (self.cycles + 1) / self.params.frequency
+        while self.t < end - 1e-12:
+            self.step(until=end)
+        self.cycles += 1
+        totals = self.totals
+        liquid_density = totals.pop("liquid_density_time") / (self.t - start)
+        swept_mass = self.rho_in * self.params.stroke * self.area
+        results = dict(totals, cycle=self.cycles, liquid_density=liquid_density,
+                       droplet_size=compute_droplet_size(liquid_density),
+                       gas_vortex_dimension=compute_gas_vortex_dimension(liquid_density),
+                       hydrogen_mass_transfer_rate=compute_hydrogen_mass_transfer(liquid_density),
+                       volumetric_efficiency=totals["admitted_mass"] / swept_mass, T_liquid=self.T_liquid)
+        results["specific_work"] = (totals["pump_work"] / totals["delivered_mass"] if totals["delivered_mass"] > 0
+                                    else math.inf)
+        return results
+
+    def run(self, cycles):
+        """Run several cycles; returns the list of run_cycle() results."""
+        return [self.run_cycle() for _ in range(cycles)]
+
+
+# Test Suite
+class TestLiquidPistonVOF(unittest.TestCase):
+    def test_closed_adiabatic_compression(self):
+        # No heat or mass exchange and no discharge: p V^gamma stays constant and the interface stays sharp
+        params = LiquidPistonParameters(n_cells=400, P_out=1e12, h_wall=0.0, h_interface=0.0, k_mass_transfer=0.0)
+        solver = LiquidPistonVOF(params)
+        gas_volume = lambda: float((1 - solver.alpha).sum()) * solver.dx
+        invariant = solver.p * gas_volume() ** solver.gamma
+        mass = solver.gas_mass()
+        half_period = 0.5 / params.frequency
+        while solver.t < half_period - 1e-12:
+            solver.step(until=half_period)
+        self.assertAlmostEqual(gas_volume(), params.clearance, delta=solver.dx)
+        self.assertAlmostEqual(solver.p * gas_volume() ** solver.gamma / invariant, 1.0, delta=0.02)
+        self.assertAlmostEqual(solver.gas_mass() / mass, 1.0, places=12)
+        self.assertLessEqual(int(np.count_nonzero((solver.alpha > 1e-3) & (solver.alpha < 1 - 1e-3))), 3)
+        T = solver.gas_temperature()[solver.alpha < 1e-3]
+        expected_T = params.T_in * (solver.p / params.P_in) ** ((solver.gamma - 1) / solver.gamma)
+        np.testing.assert_allclose(T, expected_T, rtol=0.02)
+
+    def test_cycle_conserves_gas_and_reports_effects(self):
+        solver = LiquidPistonVOF(LiquidPistonParameters(n_cells=200))
+        mass = solver.gas_mass()
+        cycles = solver.run(2)
+        totals = sum(c["admitted_mass"] - c["delivered_mass"] - c["dissolved_mass"] for c in cycles)
+        self.assertAlmostEqual(solver.gas_mass(), mass + totals, delta=1e-12 * mass)
+        last = cycles[-1]
+        self.assertGreater(last["delivered_mass"], 0.0)
+        self.assertGreater(last["dissolved_mass"], 0.0)
+        self.assertAlmostEqual(last["p_max"], solver.params.P_out)
+        self.assertGreater(last["specific_work"], 0.0)
+        self.assertGreater(last["T_liquid"], solver.params.T_in)
+        self.assertAlmostEqual(last["droplet_size"], compute_droplet_size(last["liquid_density"]))
+        self.assertTrue(0.0 < last["volumetric_efficiency"] < 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
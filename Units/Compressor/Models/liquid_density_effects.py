@@ -1,6 +1,5 @@
 import math
 import numpy as np
-from scipy.integrate import odeint
 from pint import UnitRegistry
 
 ureg = UnitRegistry()
@@ -20,7 +19,8 @@ T0 = ...  # Standard temperature
 # Recommended ionic liquid density range for optimal compressor performance
 MIN_RECOMMENDED_DENSITY = 1300  # kg/m³
 MAX_RECOMMENDED_DENSITY = 1450  # kg/m³
-for the gas - liquid interaction model
+
+# Constants for the gas - liquid interaction model
 CLEARANCE_VOLUME_RATIO = ...  # Placeholder, needs a value or computation method
 EXPANSION_COEFFICIENT = ...  # Placeholder, needs a value or computation method
 
@@ -51,16 +51,26 @@ LAMBDA_LIQUID = ...  # Placeholder for liquid thermal conductivity
 
 # Initial conditions
 P_INITIAL = 30 * ureg.bar
-T_INITIAL = 70 * ureg.celsius
+T_INITIAL = Q_(70, ureg.celsius)
 ALPHA_H2_INITIAL = 2
 ALPHA_O2_INITIAL = 1
 
 
-# Placeholder functions for gradient and flow velocity (to be further defined)
-def gradient(T):
-    # Placeholder function to calculate the gradient of a quantity (like temperature)
-    # This would be based on spatial discretization, finite difference methods, etc.
-    return T
+# Stencils on 1-D axial fields of cell-centred values with uniform spacing dx (SI units, plain arrays).
+# LiquidPistonVOF solves the same equations with preallocated arrays and limited fluxes.
+def gradient(T, dx=1.0):
+    """
+    Axial derivative of a cell-centred field: central differences inside, one-sided at both ends.
+    """
+    T = np.asarray(T, dtype=np.float64)
+    dT = np.empty_like(T)
+    dT[1:-1] = (T[2:] - T[:-2]) / (2 * dx)
+    dT[0] = (T[1] - T[0]) / dx
+    dT[-1] = (T[-1] - T[-2]) / dx
+    return dT
+
+
+# Placeholder function for flow velocity (to be further defined)
 
 
 def flow_velocity(P, T, valve_status):
@@ -93,32 +103,32 @@ def compute_volumetric_flow_rate(F0, p_in, T_in):
     return (F0 / 60) * (P0 / p_in) * (T_in / T0)
 
 
-def continuity_equation(alpha_z, rho_z, u, t):
-    """
-    Compute the continuity equation for the VOF method.
+def continuity_equation(alpha_z, rho_z, u, dx):
     """
-    # Implementing the given formula: ∂(αzρz)/∂t + ∇•(αzρzu) = 0
-    # This function would ideally involve differential calculations and may need
-    # more specific details or libraries like numpy or scipy.
-    pass
+    Compute the continuity equation for the VOF method: ∂(αzρz)/∂t = -∇•(αzρzu).
 
+    Parameters:
+    - alpha_z, rho_z: Volume fraction and density of phase z per cell (n values).
+    - u: Axial velocity at the n + 1 cell faces; the ends pass the value of the boundary cell.
+    - dx: Cell width.
 
-def momentum_equation(rho, u, p, mu, g, F):
-    """
-    Compute the momentum equation for the VOF method.
+    Returns:
+    - ∂(αzρz)/∂t per cell, from first-order upwind face fluxes (conservative).
     """
-    # Implementing the given formula
-    # This function would involve vector calculations and differential operations.
-    pass
+    q = np.asarray(alpha_z, dtype=np.float64) * rho_z
+    u = np.asarray(u, dtype=np.float64)
+    q_ext = np.concatenate((q[:1], q, q[-1:]))
+    flux = np.where(u > 0, q_ext[:-1], q_ext[1:]) * u
+    return -(flux[1:] - flux[:-1]) / dx
 
 
-def energy_equation(rho, h, t, v, lambda_, T):
+def momentum_equation(rho, u, p, mu, g, F, dx):
     """
-    Compute the energy equation for the VOF method.
+    Compute the axial momentum equation for the VOF method:
+    ∂(ρu)/∂t = -∂(ρuu)/∂x - ∂p/∂x + ∂/∂x(μ ∂u/∂x) + ρg + F, on cell-centred fields.
     """
-    # Implementing the given formula
-    # This function would involve differential operations.
-    pass
+    return (-gradient(rho * u * u, dx) - gradient(p, dx) + gradient(mu * gradient(u, dx), dx)
+            + rho * g + F)
 
 
 # Boundary Conditions
@@ -181,8 +191,8 @@ def compressibility_factor(T, P, a, b):
     Calculate the compressibility factor Z for given temperature and pressure using Peng-Robinson equation.
     """
     # Coefficients for the cubic equation
-    A = a * P / (GAS_CONSTANT * T) ** 2
-    B = b * P / (GAS_CONSTANT * T)
+    A = (a * P / (GAS_CONSTANT * T) ** 2).m_as(ureg.dimensionless)
+    B = (b * P / (GAS_CONSTANT * T)).m_as(ureg.dimensionless)
     coeffs = [1, (B - 1), (A - 3 * B ** 2 - 2 * B), -(A * B - B ** 2 - B ** 3)]
 
     # Roots of the cubic equation
@@ -349,15 +359,14 @@ def volume_fraction(alpha_gas, rho_gas, rho_liquid):
     return alpha_gas * rho_gas / (alpha_gas * rho_gas + (1 - alpha_gas) * rho_liquid)
 
 
-def energy_equation(alpha_gas, h, rho_gas, rho_liquid, v, lambda_gas, lambda_liquid, T):
+def energy_equation(alpha_gas, h, rho_gas, rho_liquid, v, lambda_gas, lambda_liquid, T, dx=1.0):
     """
-    Implement the energy equation to understand enthalpy changes and thermal effects.
+    Implement the energy equation to understand enthalpy changes and thermal effects:
+    ∂(ρh)/∂t = -∂(ρvh)/∂x + ∂/∂x(λ ∂T/∂x), with volume-averaged mixture density and conductivity.
     """
-    rho = volume_fraction(alpha_gas, rho_gas, rho_liquid)
-    energy_flux = rho * h + rho * v * h
-    energy_conduction = lambda_gas * gradient(T) + lambda_liquid * gradient(T)
-
-    return energy_flux - energy_conduction
+    rho = alpha_gas * rho_gas + (1 - alpha_gas) * rho_liquid
+    lambda_ = alpha_gas * lambda_gas + (1 - alpha_gas) * lambda_liquid
+    return -gradient(rho * v * h, dx) + gradient(lambda_ * gradient(T, dx), dx)
 
 
 # TODO: The rest of the code, including the main simulation runner and additional functionality.
@@ -406,15 +415,6 @@ def compressor_cycle(alpha_h2, alpha_o2, P, T):
     return P, T, alpha_h2, alpha_o2
 
 
-# Simulate the compressor
-P, T, alpha_h2, alpha_o2 = compressor_cycle(ALPHA_H2_INITIAL, ALPHA_O2_INITIAL, P_INITIAL, T_INITIAL)
-
-print(f"Pressure after one cycle: {P}")
-print(f"Temperature after one cycle: {T}")
-print(f"Volume fraction of H2 after one cycle: {alpha_h2}")
-print(f"Volume fraction of O2 after one cycle: {alpha_o2}")
-
-
 def compute_droplet_size(liquid_density):
     """Calculate droplet size based on liquid density.
 
@@ -460,4 +460,14 @@ def compute_hydrogen_mass_transfer(liquid_density):
     else:
         mass_transfer_rate = 0.6  # Arbitrary unit for densities beyond the recommended range
 
-    return mass_transfer_rate
\ No newline at end of file
+    return mass_transfer_rate
+
+
+if __name__ == "__main__":
+    # Simulate the compressor
+    P, T, alpha_h2, alpha_o2 = compressor_cycle(ALPHA_H2_INITIAL, ALPHA_O2_INITIAL, P_INITIAL, T_INITIAL)
+
+    print(f"Pressure after one cycle: {P}")
+    print(f"Temperature after one cycle: {T}")
+    print(f"Volume fraction of H2 after one cycle: {alpha_h2}")
+    print(f"Volume fraction of O2 after one cycle: {alpha_o2}")
@@ -1,10 +1,3 @@
-import numpy as np
-import pandas as pd
-import seaborn as sns
-from scipy.integrate import solve_ivp
-import pendulum
-import matplotlib.pyplot as plt
-
 # Constants & Parameters
 SHEAR_STRESS_CONSTANT = 1.0  # Placeholder
 VISCOSITY_EFFECT_CONSTANT = 1.0  # Placeholder
@@ -139,7 +132,8 @@ MAX_PRESSURE = 80 * 1e5
 MAX_TKE = 200
 MAX_RPM = 1800
 
-# Running the simulation
-simulation = CompressorSimulation(total_time=100, time_step=0.1)
-simulation.run()
-data = simulation.get_data()
+if __name__ == "__main__":
+    # Running the simulation
+    simulation = CompressorSimulation(total_time=100, time_step=0.1)
+    simulation.run()
+    data = simulation.get_data()
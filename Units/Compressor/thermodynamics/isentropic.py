@@ -1,5 +1,7 @@
 from pint import UnitRegistry
-import sympy as sp
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 ureg = UnitRegistry()
 
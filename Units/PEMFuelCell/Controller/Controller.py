@@ -8,12 +8,14 @@ from Units.PEMFuelCell.Models.Performance import *
 from Units.PEMFuelCell.Models.PowerSystem import *
 from Units.PEMFuelCell.Models.ReferenceEnvironment import *
 
-# Setup Logging
-logging.basicConfig(level=logging.INFO)
+MQTT_BROKER_ADDRESS = "mqtt_broker_address"
 
-# Setup MQTT Client
-mqtt_client = mqtt.Client()
-mqtt_client.connect("mqtt_broker_address")  # Connect to your MQTT broker
+
+def create_mqtt_client(broker_address=MQTT_BROKER_ADDRESS):
+    # Setup MQTT Client
+    mqtt_client = mqtt.Client()
+    mqtt_client.connect(broker_address)  # Connect to your MQTT broker
+    return mqtt_client
 
 
 def run_simulation(inputs):
@@ -35,6 +37,7 @@ def get_new_inputs():
 
 
 def main():
+    mqtt_client = create_mqtt_client()
     while True:
         try:
             # Get New Inputs if available
@@ -55,4 +58,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # Setup Logging
+    logging.basicConfig(level=logging.INFO)
     main()
@@ -1,5 +1,7 @@
-import sympy as sp
 from pint import UnitRegistry
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 
 class ExergeticParameters:
@@ -1,4 +1,3 @@
-import sympy as sp
 from pint import UnitRegistry
 
 
@@ -41,10 +40,11 @@ components = {
     'Ar': {'mole_fraction': 0.0007, 'chemical_exergy': 17998.14}
 }
 
-# Create an object of the ReferenceEnvironment class
-ureg = UnitRegistry()
-ref_env = ReferenceEnvironment(T0=298 * ureg.K, P0=1 * ureg.atm, components=components)
+if __name__ == "__main__":
+    # Create an object of the ReferenceEnvironment class
+    ureg = UnitRegistry()
+    ref_env = ReferenceEnvironment(T0=298 * ureg.K, P0=1 * ureg.atm, components=components)
 
-# Use the object to get the restricted and unrestricted states
-restricted_state = ref_env.get_restricted_state()
-unrestricted_state = ref_env.get_unrestricted_state()
+    # Use the object to get the restricted and unrestricted states
+    restricted_state = ref_env.get_restricted_state()
+    unrestricted_state = ref_env.get_unrestricted_state()
@@ -1,7 +1,9 @@
-import sympy as sp
 import simpy
 from pint import UnitRegistry
 from State.CentralizedState import CentralizedState as H2GeneratorEfficiencyState
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 class H2GeneratorEfficiencyParameters:
     """
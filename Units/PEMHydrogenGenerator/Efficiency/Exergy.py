@@ -1,7 +1,9 @@
-import sympy as sp
 import simpy
 from pint import UnitRegistry
 from State.CentralizedState import CentralizedState as ExergyState
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 class ExergyParameters:
     def __init__(self, E_chem, E_phy, H, S, T0, S0):
@@ -1,4 +1,3 @@
-import sympy as sp
 from pint import UnitRegistry
 import simpy
 from State.CentralizedState import CentralizedState as H2GeneratorFlowRatesState
@@ -1,11 +1,11 @@
-import sympy as sp
 import simpy
 from pint import UnitRegistry
 import math
 from State.CentralizedState import CentralizedState as PEMState
+from Units.PEMHydrogenGenerator.Models.ButlerVolmer import solve_overpotential
 
 class PEMParameters:
-    def __init__(self, R, T, F, J_ref_a, J_ref_c, E_act_a, E_act_c):
+    def __init__(self, R, T, F, J_ref_a, J_ref_c, E_act_a, E_act_c, alpha_a=0.5, alpha_c=0.5, z=2):
         self.R = R
         self.T = T
         self.F = F
@@ -13,6 +13,9 @@ class PEMParameters:
         self.J_ref_c = J_ref_c
         self.E_act_a = E_act_a
         self.E_act_c = E_act_c
+        self.alpha_a = alpha_a  # Charge transfer coefficients; 0.5 gives the symmetric asinh form
+        self.alpha_c = alpha_c
+        self.z = z  # Number of electrons transferred
 
 
 
@@ -54,8 +57,15 @@ class ActivationOverpotential:
         T = params.T * self.ureg.kelvin
         F = params.F * self.ureg.coulomb / self.ureg.mol
         J_0 = self.compute_exchange_current_density(electrode, params)
+        alpha = params.alpha_a if electrode == 'a' else params.alpha_c
 
-        eta_act = (R * T / F) * math.log((J / (2 * J_0)) + math.sqrt((J / (2 * J_0)) ** 2 + 1))
+        if alpha == 0.5:
+            eta_act = (2 * R * T / (params.z * F)) * math.log((J / (2 * J_0)) + math.sqrt((J / (2 * J_0)) ** 2 + 1))
+        else:
+            # No closed form for asymmetric kinetics; invert Butler-Volmer numerically
+            solution = solve_overpotential(state.J, J_0.magnitude, alpha=alpha, z=params.z, T=params.T, R=params.R,
+                                           F=params.F)
+            eta_act = float(solution.eta) * self.ureg.V
         return eta_act
 
 
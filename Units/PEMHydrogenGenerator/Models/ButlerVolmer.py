@@ -0,0 +1,155 @@
+"""
+Numeric Butler-Volmer kinetics over NumPy arrays.
+
+    J(eta) = J0 * (exp(alpha * z * F * eta / (R T)) - exp(-(1 - alpha) * z * F * eta / (R T)))
+
+butler_volmer_current evaluates J(eta); solve_overpotential inverts it for arbitrary alpha and z, and
+activation_overpotential picks the closed form or the numeric inverse for an electrode.
+For alpha = 0.5 the inverse is the closed form eta = 2 R T / (z F) * asinh(J / (2 J0)), which is
+the form used by ActivationOverpotential (z = 2); it serves as the initial guess of a vectorized
+Newton iteration for the general case. J(eta) increases monotonically, and the iteration is kept
+inside a bracket that always contains the root, falling back to bisection when a Newton step
+leaves it.
+"""
+import logging
+import unittest
+
+import numpy as np
+
+
+class ButlerVolmerSolution:
+    """Overpotentials solved by solve_overpotential, with a convergence report."""
+
+    __slots__ = ("eta", "iterations", "converged", "max_residual")
+
+    def __init__(self, eta, iterations, converged, max_residual):
+        self.eta = eta  # Activation overpotential (V), same shape as J
+        self.iterations = iterations  # Newton iterations used
+        self.converged = converged  # Boolean mask of converged points
+        self.max_residual = max_residual  # Largest |J(eta) - J| (A/m^2)
+
+    def __repr__(self):
+        return (f"ButlerVolmerSolution(iterations={self.iterations}, converged={int(np.count_nonzero(self.converged))}"
+                f"/{np.size(self.converged)}, max_residual={self.max_residual})")
+
+
+def _exponents(alpha, z, T, R, F):
+    f = z * F / (R * np.asarray(T, dtype=np.float64))
+    return alpha * f, (1 - alpha) * f
+
+
+def butler_volmer_current(eta, J0, alpha=0.5, z=2, T=300, R=8.314, F=96500):
+    """
+    Current density J(eta) (A/m^2) of the Butler-Volmer equation; all arguments broadcast.
+
+    Parameters:
+    - eta: Activation overpotential (V).
+    - J0: Exchange current density (A/m^2).
+    - alpha: Charge transfer coefficient.
+    - z: Number of electrons transferred.
+    - T: Temperature (K).
+    """
+    a, c = _exponents(alpha, z, T, R, F)
+    eta = np.asarray(eta, dtype=np.float64)
+    return J0 * (np.exp(a * eta) - np.exp(-c * eta))
+
+
+def solve_overpotential(J, J0, alpha=0.5, z=2, T=300, R=8.314, F=96500, rtol=1e-12, max_iterations=50):
+    """
+    Solve J(eta) = J for eta over arrays.
+
+    Parameters:
+    - J: Current density (A/m^2); negative values give cathodic overpotentials.
+    - J0, alpha, z, T, R, F: As in butler_volmer_current; all broadcast against J.
+    - rtol: Convergence tolerance on |J(eta) - J| relative to max(|J|, J0).
+    - max_iterations: Newton iteration limit.
+
+    Returns:
+    - ButlerVolmerSolution; points that did not converge are logged and flagged in `converged`.
+
+    Raises:
+    - ValueError: If alpha is not in (0, 1) or J0 is not positive.
+    """
+    J, J0, alpha, T = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (J, J0, alpha, T)))
+    if np.any((alpha <= 0) | (alpha >= 1)):
+        raise ValueError("alpha must be in (0, 1).")
+    if np.any(J0 <= 0):
+        raise ValueError("J0 must be positive.")
+    a, c = _exponents(alpha, z, T, R, F)
+    tolerance = rtol * np.maximum(np.abs(J), J0)
+
+    # J0 * (exp(a eta) - 1) <= J for eta >= 0, so the root lies between 0 and log(1 + J / J0) / a
+    # (and symmetrically for J < 0)
+    bound = np.log1p(np.abs(J) / J0)
+    low = np.where(J < 0, -bound / c, 0.0)
+    high = np.where(J > 0, bound / a, 0.0)
+    # asinh guess with the Tafel slope of the dominant branch; exact for alpha = 0.5
+    eta = np.clip(np.arcsinh(J / (2 * J0)) / np.where(J > 0, a, c), low, high)
+
+    residual = J0 * (np.exp(a * eta) - np.exp(-c * eta)) - J
+    converged = np.abs(residual) <= tolerance
+    iterations = 0
+    while not converged.all() and iterations < max_iterations:
+        iterations += 1
+        high = np.where(residual > 0, eta, high)
+        low = np.where(residual > 0, low, eta)
+        slope = J0 * (a * np.exp(a * eta) + c * np.exp(-c * eta))
+        eta_newton = eta - residual / slope
+        eta_next = np.where((eta_newton > low) & (eta_newton < high), eta_newton, 0.5 * (low + high))
+        eta = np.where(converged, eta, eta_next)
+        residual = J0 * (np.exp(a * eta) - np.exp(-c * eta)) - J
+        converged = np.abs(residual) <= tolerance
+
+    max_residual = float(np.max(np.abs(residual))) if residual.size else 0.0
+    if not converged.all():
+        logging.warning(f"Butler-Volmer inversion: {int(np.count_nonzero(~converged))} of {converged.size} points "
+                        f"did not converge in {max_iterations} iterations (max residual {max_residual} A/m^2)")
+    return ButlerVolmerSolution(eta, iterations, converged, max_residual)
+
+
+def is_symmetric(alpha, z):
+    """True when the (R T / F) asinh(J / (2 J0)) form of ActivationOverpotential is exact (alpha = 0.5, z = 2)."""
+    return alpha == 0.5 and z == 2
+
+
+def activation_overpotential(J, J0, alpha=0.5, z=2, T=300, R=8.314, F=96500):
+    """
+    Activation overpotential eta(J) (V) of one electrode over arrays.
+
+    Symmetric electrodes (see is_symmetric) use the asinh closed form; others are inverted by
+    solve_overpotential. Arguments are as in solve_overpotential.
+    """
+    if is_symmetric(alpha, z):
+        T = np.asarray(T, dtype=np.float64)
+        return R * T / F * np.arcsinh(np.asarray(J, dtype=np.float64) / (2 * np.asarray(J0, dtype=np.float64)))
+    return solve_overpotential(J, J0, alpha=alpha, z=z, T=T, R=R, F=F).eta
+
+
+# Test Suite
+class TestButlerVolmer(unittest.TestCase):
+    def test_round_trip_for_asymmetric_kinetics(self):
+        J = np.concatenate([-np.logspace(-3, 4, 50), [0.0], np.logspace(-3, 4, 50)])
+        for alpha in (0.2, 0.5, 0.8):
+            for z in (1, 2):
+                solution = solve_overpotential(J, 1e-3, alpha=alpha, z=z, T=330)
+                self.assertTrue(solution.converged.all())
+                np.testing.assert_allclose(butler_volmer_current(solution.eta, 1e-3, alpha, z, 330), J,
+                                           rtol=1e-10, atol=1e-12)
+
+    def test_symmetric_case_matches_asinh_form(self):
+        J = np.linspace(0, 2e4, 101)
+        solution = solve_overpotential(J, 1e-3, alpha=0.5, z=2, T=300)
+        np.testing.assert_allclose(solution.eta, 8.314 * 300 / 96500 * np.arcsinh(J / 2e-3), rtol=1e-12)
+        self.assertEqual(solution.iterations, 0)
+
+    def test_activation_overpotential_switches_to_numeric_inverse(self):
+        J = np.linspace(0, 2e4, 11)
+        np.testing.assert_allclose(activation_overpotential(J, 1e-3, T=300),
+                                   solve_overpotential(J, 1e-3, T=300).eta, rtol=1e-12)
+        for alpha, z in ((0.3, 2), (0.5, 1)):
+            eta = activation_overpotential(J, 1e-3, alpha=alpha, z=z, T=300)
+            np.testing.assert_allclose(butler_volmer_current(eta, 1e-3, alpha, z, 300), J, rtol=1e-10, atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
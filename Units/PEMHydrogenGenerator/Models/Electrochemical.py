@@ -1,4 +1,3 @@
-import sympy as sp
 import simpy
 from pint import UnitRegistry
 from State.CentralizedState import CentralizedState as PEMStateElectrochemical
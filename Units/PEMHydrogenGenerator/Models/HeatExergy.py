@@ -1,7 +1,9 @@
-import sympy as sp
 import simpy
 from pint import UnitRegistry
 from State.CentralizedState import CentralizedState as PEMHeatExergyState
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 class PEMHeatExergyParameters:
     def __init__(self, F, eta_act_a, eta_act_c, eta_ohm, Delta_S, T0):
@@ -0,0 +1,276 @@
+"""
+1-D membrane water transport: electro-osmotic drag plus back-diffusion through the membrane.
+
+The water content lambda(x, t) (mol H2O per mol SO3-) across the membrane thickness obeys
+
+    c_f * d(lambda)/dt = -dN/dx,   N = -n_d(lambda) * J / F - c_f * D(lambda, T) * d(lambda)/dx
+
+with x = 0 at the cathode and x = L at the anode (as in CentralizedState.calculate_lambda_x),
+c_f = rho_dry / EW the fixed-charge concentration, n_d = drag_coefficient * lambda / 22 the
+electro-osmotic drag (protons, and the water they drag, move from the anode to the cathode) and
+D(lambda, T) the Springer diffusivity. The faces are held at lambda_c and lambda_a.
+
+The equation is discretized with finite volumes on a uniform grid (upwind drag, central diffusion)
+and stepped implicitly, with the diffusivity lagged by one step, so every step is one tridiagonal
+solve. The systems of many stacks are solved together by a Thomas sweep along the grid that is
+vectorized across stacks. The resulting conductivity profile sigma(x) gives the area-specific
+membrane resistance R_PEM = integral of 1 / sigma(x) dx over the thickness.
+"""
+import unittest
+
+import numpy as np
+
+from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import membrane_conductivity
+
+F = 96485.0
+
+
+class MembraneWaterTransportParameters:
+    """
+    Parameters:
+    - L: Membrane thickness (m).
+    - n_cells: Number of finite volumes across the thickness.
+    - rho_dry: Dry membrane density (kg/m^3).
+    - EW: Equivalent weight (kg/mol SO3-).
+    - drag_coefficient: Electro-osmotic drag coefficient at lambda = 22 (n_d = drag_coefficient * lambda / 22).
+    - D_ref: Diffusivity scale at 303 K (m^2/s).
+    - D_polynomial: Coefficients (constant term first) of the lambda dependence of D (Springer et al.).
+    - E_D: Activation temperature of D (K).
+    - lambda_min / lambda_max: Range in which the diffusivity polynomial is evaluated.
+    """
+
+    def __init__(self, L=1.78e-4, n_cells=40, rho_dry=2000.0, EW=1.1, drag_coefficient=2.5, D_ref=1e-10,
+                 D_polynomial=(2.563, -0.33, 0.0264, -0.000671), E_D=2416.0, lambda_min=4.0, lambda_max=22.0):
+        self.L = L
+        self.n_cells = n_cells
+        self.rho_dry = rho_dry
+        self.EW = EW
+        self.drag_coefficient = drag_coefficient
+        self.D_ref = D_ref
+        self.D_polynomial = D_polynomial
+        self.E_D = E_D
+        self.lambda_min = lambda_min
+        self.lambda_max = lambda_max
+
+
+def solve_tridiagonal(lower, diag, upper, rhs):
+    """
+    Solve tridiagonal systems with the Thomas algorithm, batched over the trailing axis.
+
+    Parameters:
+    - lower, diag, upper, rhs: Arrays of shape (n, ...); row i reads lower[i] * x[i-1] + diag[i] * x[i] +
+      upper[i] * x[i+1] = rhs[i] (lower[0] and upper[n-1] are ignored). The systems must not need pivoting,
+      e.g. be diagonally dominant.
+
+    Returns:
+    - Solution of shape (n, ...).
+    """
+    n = diag.shape[0]
+    c = np.empty_like(diag)
+    d = np.empty_like(rhs)
+    c[0] = upper[0] / diag[0]
+    d[0] = rhs[0] / diag[0]
+    for i in range(1, n):
+        m = diag[i] - lower[i] * c[i - 1]
+        c[i] = upper[i] / m
+        d[i] = (rhs[i] - lower[i] * d[i - 1]) / m
+    for i in range(n - 2, -1, -1):
+        d[i] -= c[i] * d[i + 1]
+    return d
+
+
+class MembraneWaterTransport:
+    """
+    Water content profiles of a batch of membranes.
+
+    Parameters:
+    - params: MembraneWaterTransportParameters, shared by all stacks.
+    - stacks: Number of stacks solved together.
+    - lambda0: Initial water content, scalar or per stack (default: lambda_min).
+
+    The cell-centre water contents are kept in `lambda_cells`, shape (n_cells, stacks).
+    """
+
+    def __init__(self, params: MembraneWaterTransportParameters, stacks=1, lambda0=None):
+        self.params = params
+        self.stacks = stacks
+        n = params.n_cells
+        self.dx = params.L / n
+        self.c_f = params.rho_dry / params.EW
+        self.x_cells = (np.arange(n) + 0.5) * self.dx
+        self.x_nodes = np.concatenate(([0.0], self.x_cells, [params.L]))  # Faces and cell centres
+        initial = params.lambda_min if lambda0 is None else lambda0
+        self.lambda_cells = np.broadcast_to(np.asarray(initial, dtype=np.float64), (n, stacks)).copy()
+        self.lambda_c = self.lambda_a = None
+        self.steps = 0
+
+    def diffusivity(self, lambda_x, T):
+        """Water diffusivity D(lambda, T) in m^2/s, over arrays."""
+        p = self.params
+        lam = np.clip(lambda_x, p.lambda_min, p.lambda_max)
+        polynomial = np.zeros_like(lam)
+        for coefficient in p.D_polynomial[::-1]:
+            polynomial = polynomial * lam + coefficient
+        return p.D_ref * np.exp(p.E_D * (1 / 303 - 1 / T)) * polynomial
+
+    def _system(self, inverse_dt, J, T, lambda_a, lambda_c):
+        # Rows of c_f * dx * (lambda_new - lambda_old) / dt = G[i+1/2] - G[i-1/2], with G = -N the water flux
+        # towards the cathode: G = c_f * D * dlambda/dx + a * lambda_upwind, a = drag_coefficient * J / (22 F).
+        # The drag points to the cathode, so the upwind cell of a face is the one on its anode side.
+        h = self.dx
+        c_f = self.c_f
+        a = self.params.drag_coefficient * J / (22 * F)
+        D_cells = self.diffusivity(self.lambda_cells, T)
+        k = np.empty((D_cells.shape[0] + 1, self.stacks))  # c_f * D / distance at every face
+        k[1:-1] = c_f * 2 * D_cells[:-1] * D_cells[1:] / ((D_cells[:-1] + D_cells[1:]) * h)
+        k[0] = c_f * self.diffusivity(lambda_c, T) * 2 / h
+        k[-1] = c_f * self.diffusivity(lambda_a, T) * 2 / h
+        lower = -k[:-1]
+        upper = -(k[1:] + a)
+        diag = c_f * h * inverse_dt + k[:-1] + k[1:] + a
+        rhs = c_f * h * inverse_dt * self.lambda_cells
+        rhs[0] += k[0] * lambda_c
+        rhs[-1] += (k[-1] + a) * lambda_a
+        return lower, diag, upper, rhs
+
+    def _boundaries(self, J, T, lambda_a, lambda_c):
+        shape = (self.stacks,)
+        J, T, lambda_a, lambda_c = (np.broadcast_to(np.asarray(v, dtype=np.float64), shape)
+                                    for v in (J, T, lambda_a, lambda_c))
+        self.lambda_a, self.lambda_c = lambda_a, lambda_c
+        return J, T, lambda_a, lambda_c
+
+    def step(self, dt, J, T, lambda_a, lambda_c):
+        """
+        Advance all stacks by one implicit step.
+
+        Parameters:
+        - dt: Time step (s).
+        - J: Current density (A/m^2), scalar or per stack.
+        - T: Temperature (K), scalar or per stack.
+        - lambda_a / lambda_c: Water content at the anode / cathode face, scalar or per stack.
+
+        Returns:
+        - lambda_cells after the step.
+        """
+        J, T, lambda_a, lambda_c = self._boundaries(J, T, lambda_a, lambda_c)
+        self.lambda_cells = solve_tridiagonal(*self._system(1 / dt, J, T, lambda_a, lambda_c))
+        self.steps += 1
+        return self.lambda_cells
+
+    def steady_state(self, J, T, lambda_a, lambda_c, tolerance=1e-8, max_iterations=50):
+        """
+        Solve for the steady profiles by fixed-point iteration on the diffusivity.
+
+        Parameters are as for step(). Returns lambda_cells.
+        """
+        J, T, lambda_a, lambda_c = self._boundaries(J, T, lambda_a, lambda_c)
+        for _ in range(max_iterations):
+            previous = self.lambda_cells
+            self.lambda_cells = solve_tridiagonal(*self._system(0.0, J, T, lambda_a, lambda_c))
+            if np.max(np.abs(self.lambda_cells - previous)) <= tolerance * np.max(np.abs(self.lambda_cells)):
+                break
+        return self.lambda_cells
+
+    def lambda_profile(self):
+        """Water content at x_nodes (faces and cell centres), shape (n_cells + 2, stacks)."""
+        return np.concatenate((self.lambda_c[None], self.lambda_cells, self.lambda_a[None]))
+
+    def sigma_profile(self, T):
+        """Proton conductivity (S/m) at x_nodes, shape (n_cells + 2, stacks)."""
+        return membrane_conductivity(self.lambda_profile(), np.asarray(T, dtype=np.float64))
+
+    def resistance(self, T):
+        """Area-specific membrane resistance (ohm m^2) per stack: trapezoids of 1 / sigma(x) over x_nodes."""
+        inverse_sigma = 1 / self.sigma_profile(T)
+        widths = np.diff(self.x_nodes)[:, None]
+        return np.sum(0.5 * (inverse_sigma[:-1] + inverse_sigma[1:]) * widths, axis=0)
+
+    def apply_to(self, state, T=None, stack=0):
+        """
+        Write one stack's profile and resistance into a CentralizedState.
+
+        Raises:
+        - ValueError: If the membrane thickness params.L differs from state.L.
+        """
+        T = state.T if T is None else T
+        state.update_lambda_profile(self.x_nodes, self.lambda_profile()[:, stack])
+        state.update_R_PEM(float(self.resistance(T)[stack]))
+
+
+# Test Suite
+class TestMembraneWaterTransport(unittest.TestCase):
+    def test_steady_profile_matches_drag_diffusion_solution(self):
+        # With a constant diffusivity the steady profile is lambda_inf + K * exp(-u x / D), u = a / c_f
+        params = MembraneWaterTransportParameters(n_cells=400, D_polynomial=(1.0,))
+        J, T = np.array([0.0, 5000.0, 10000.0]), 343.15
+        transport = MembraneWaterTransport(params, stacks=3, lambda0=14.0)
+        transport.steady_state(J, T, lambda_a=20.0, lambda_c=10.0)
+        D = transport.diffusivity(14.0, T)
+        s = params.drag_coefficient * J[1:] / (22 * F * transport.c_f) / D
+        x = transport.x_cells[:, None]
+        expected = 10.0 + (20.0 - 10.0) * np.expm1(-s * x) / np.expm1(-s * params.L)
+        np.testing.assert_allclose(transport.lambda_cells[:, 1:], expected, atol=0.05)
+        np.testing.assert_allclose(transport.lambda_cells[:, 0], 10.0 + 10.0 * x[:, 0] / params.L, atol=1e-9)
+
+        # Without current the resistance is that of the linear profile; drag wets the membrane and lowers it
+        from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import membrane_resistance
+        R = transport.resistance(T)
+        self.assertAlmostEqual(R[0] / membrane_resistance(20.0, 10.0, params.L, T), 1.0, places=4)
+        self.assertTrue(R[2] < R[1] < R[0])
+
+    def test_implicit_steps_relax_to_steady_state(self):
+        params = MembraneWaterTransportParameters()
+        transient = MembraneWaterTransport(params, stacks=2, lambda0=[6.0, 18.0])
+        for _ in range(200):
+            transient.step(60.0, J=10000.0, T=353.15, lambda_a=[18.0, 21.0], lambda_c=[8.0, 12.0])
+        steady = MembraneWaterTransport(params, stacks=2, lambda0=14.0)
+        steady.steady_state(10000.0, 353.15, lambda_a=[18.0, 21.0], lambda_c=[8.0, 12.0])
+        np.testing.assert_allclose(transient.lambda_cells, steady.lambda_cells, rtol=1e-6)
+
+    def test_apply_to_requires_the_state_thickness(self):
+        from State.CentralizedState import CentralizedState
+        from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import PEMOhmicOverpotentialModel, \
+            PEMParametersOhmic
+        state = CentralizedState(initial_values={'T': 353.15, 'lambda_a': 14.0, 'lambda_c': 10.0, 'L': 0.01})
+        transport = MembraneWaterTransport(MembraneWaterTransportParameters(L=state.L), lambda0=12.0)
+        transport.steady_state(10000.0, state.T, state.lambda_a, state.lambda_c)
+        transport.apply_to(state)
+        R_PEM = PEMOhmicOverpotentialModel().calculate_R_PEM(PEMParametersOhmic(state.T, 2, F, 8.314), state,
+                                                              num_points=2000)
+        self.assertAlmostEqual(R_PEM.magnitude / state.R_PEM, 1.0, places=3)
+
+        thin = MembraneWaterTransport(MembraneWaterTransportParameters(), lambda0=12.0)
+        thin.steady_state(10000.0, state.T, state.lambda_a, state.lambda_c)
+        with self.assertRaises(ValueError):
+            thin.apply_to(state)
+
+    def test_state_drops_a_stale_profile(self):
+        from State.CentralizedState import CentralizedState
+        state = CentralizedState(initial_values={'T': 353.15, 'lambda_a': 14.0, 'lambda_c': 10.0, 'L': 0.01,
+                                                 'x': 0.005})
+        transport = MembraneWaterTransport(MembraneWaterTransportParameters(L=state.L), lambda0=12.0)
+        transport.steady_state(10000.0, state.T, state.lambda_a, state.lambda_c)
+
+        # Face values written after the profile (e.g. by EnsembleKalmanFilter.apply_to) are used again
+        for update in (state.update_lambda_a, state.update_lambda_c):
+            transport.apply_to(state)
+            update(20.0)
+            self.assertIsNone(state.lambda_profile)
+            self.assertAlmostEqual(state.lambda_x, 0.5 * (state.lambda_a + state.lambda_c))
+
+        # A thickness change keeps a profile that still spans the membrane and drops one that does not
+        state.update_lambda_a(14.0)
+        state.update_lambda_c(10.0)
+        transport.apply_to(state)
+        profile_lambda_x = state.lambda_x
+        state.update_L(0.01)
+        self.assertIsNotNone(state.lambda_profile)
+        self.assertEqual(state.lambda_x, profile_lambda_x)
+        state.update_L(0.02)
+        self.assertIsNone(state.lambda_profile)
+        self.assertAlmostEqual(state.lambda_x, 10.0 + 4.0 * 0.005 / 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -1,8 +1,11 @@
-import sympy as sp
 from pint import UnitRegistry
 import simpy
 import numpy as np  # Importing numpy for numerical calculations
 from State.CentralizedState import CentralizedState as PEMStateOhmic
+from Units.PEMHydrogenGenerator.Models.ButlerVolmer import butler_volmer_current
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 
 class PEMParametersOhmic:
@@ -13,33 +16,47 @@ class PEMParametersOhmic:
         self.R = R  # Gas constant
 
 
+def membrane_conductivity(lambda_x, T):
+    """Proton conductivity (S/m) of the membrane at water content lambda_x and temperature T (K), over arrays."""
+    return (0.5139 * lambda_x - 0.326) * np.exp(1268 * (1 / 303 - 1 / T))
+
+
+def membrane_resistance(lambda_a, lambda_c, L, T):
+    """
+    Area-specific membrane resistance (ohm m^2) of a linear water-content profile, over arrays.
+
+    The integral of 1 / sigma(lambda(x), T) that calculate_R_PEM evaluates with trapezoids has a
+    closed form for a linear lambda(x): L / (g(T) * logmean(sigma_a, sigma_c)), where sigma_a/c are the
+    conductivities at 303 K of both faces and g(T) the Arrhenius factor of calculate_sigma.
+    """
+    lambda_a, lambda_c, L, T = (np.asarray(v, dtype=np.float64) for v in (lambda_a, lambda_c, L, T))
+    s_a = 0.5139 * lambda_a - 0.326
+    s_c = 0.5139 * lambda_c - 0.326
+    g = np.exp(1268 * (1 / 303 - 1 / T))
+    difference = s_a - s_c
+    close = np.abs(difference) <= 1e-12 * np.abs(s_c)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_mean = np.where(close, 0.5 * (s_a + s_c), difference / np.log1p(difference / s_c))
+    return L / (g * log_mean)
+
+
 class PEMOhmicOverpotentialModel:
     def __init__(self):
         self.ureg = UnitRegistry()
 
     def calculate_sigma(self, lambda_x, params: PEMParametersOhmic):
         T = params.T * self.ureg.kelvin
-        sigma_eq = (0.5139 * lambda_x - 0.326) * sp.exp(1268 * (1 / 303 - 1 / T.magnitude))
+        sigma_eq = float((0.5139 * lambda_x - 0.326) * sp.exp(1268 * (1 / 303 - 1 / T.magnitude)))
         return sigma_eq * (self.ureg.S / self.ureg.m)
 
     def calculate_R_PEM(self, params: PEMParametersOhmic, state: PEMStateOhmic, num_points=1000):
+        # Trapezoids of 1 / sigma(lambda(x)) over the thickness; lambda(x) is the state's water content
+        # profile (see MembraneWaterTransport) or, without one, linear between the faces
+        x = np.linspace(0, state.L, num_points + 1)
+        inverse_sigma = 1 / membrane_conductivity(state.calculate_lambda_x(x), params.T)
         delta_x = state.L / num_points  # Width of each trapezoid
-        total_resistance = 0  # Initialize total resistance to 0
-
-        for i in range(num_points):
-            x1 = i * delta_x  # x-coordinate of the left point of the trapezoid
-            x2 = (i + 1) * delta_x  # x-coordinate of the right point of the trapezoid
-
-            # Calculate λ(x) and σ[λ(x)] for x1 and x2
-            lambda_x1 = ((state.lambda_a - state.lambda_c) / state.L) * x1 + state.lambda_c
-            lambda_x2 = ((state.lambda_a - state.lambda_c) / state.L) * x2 + state.lambda_c
-            sigma1 = self.calculate_sigma(lambda_x1, params)
-            sigma2 = self.calculate_sigma(lambda_x2, params)
-
-            # Calculate the area of the trapezoid and add it to the total resistance
-            total_resistance += (1 / sigma1 + 1 / sigma2) * delta_x / 2
-
-        return total_resistance
+        total_resistance = float(np.sum(inverse_sigma[:-1] + inverse_sigma[1:]) * delta_x / 2)
+        return total_resistance / (self.ureg.S / self.ureg.m)
 
     def calculate_eta_ohm(self, state: PEMStateOhmic):
         J = state.J * self.ureg.ampere / (self.ureg.meter ** 2)
@@ -48,17 +65,10 @@ class PEMOhmicOverpotentialModel:
         return eta_ohm_eq.to(self.ureg.V)
 
     def calculate_J_act(self, state: PEMStateOhmic, params: PEMParametersOhmic):
-        J0 = state.J0 * self.ureg.ampere / (self.ureg.meter ** 2)
-        eta_act = state.eta_act * self.ureg.V
-        T = params.T * self.ureg.kelvin
-        alpha = state.alpha
-        z = params.z
-        F = params.F * self.ureg.coulomb / self.ureg.mole
-        R = params.R * self.ureg.joule / (self.ureg.mole * self.ureg.kelvin)
-
-        J_act_eq = J0 * (
-                sp.exp((alpha * z * F * eta_act) / (R * T)) - sp.exp(((1 - alpha) * z * F * eta_act) / (R * T)))
-        return J_act_eq.to(self.ureg.A / (self.ureg.meter ** 2))
+        # Butler-Volmer on plain floats (or arrays); J0 in A/m^2, eta_act in V
+        J_act = butler_volmer_current(state.eta_act, state.J0, alpha=state.alpha, z=params.z, T=params.T, R=params.R,
+                                      F=params.F)
+        return J_act * self.ureg.A / (self.ureg.meter ** 2)
 
     def update(self, params: PEMParametersOhmic, state: PEMStateOhmic):
         # Update lambda_x in state
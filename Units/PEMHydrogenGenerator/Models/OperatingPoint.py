@@ -0,0 +1,275 @@
+import bisect
+import functools
+import math
+import unittest
+
+import numpy as np
+
+from State.CentralizedState import CentralizedState as PEMState
+from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+from Units.PEMHydrogenGenerator.Models.ButlerVolmer import activation_overpotential, is_symmetric, \
+    solve_overpotential
+
+
+class PEMOperatingPointParameters:
+    """
+    Stack layout and limits for the operating-point solver.
+
+    Parameters:
+    - V0: Reversible cell voltage (V).
+    - R_PEM: Area-specific membrane resistance (ohm m^2), e.g. from PEMOhmicOverpotentialModel.calculate_R_PEM.
+    - area: Active area per cell (m^2).
+    - n_cells: Number of cells in the stack.
+    - J_max: Maximum current density (A/m^2); surplus power above the stack rating is not absorbed.
+    """
+
+    def __init__(self, V0, R_PEM, area, n_cells=1, J_max=20000):
+        self.V0 = V0
+        self.R_PEM = R_PEM
+        self.area = area
+        self.n_cells = n_cells
+        self.J_max = J_max
+
+
+class OperatingPoint:
+    """Solved operating point of the stack for one power set-point."""
+
+    __slots__ = ("J", "V", "power_w", "requested_power_w", "iterations", "clipped")
+
+    def __init__(self, J, V, power_w, requested_power_w, iterations, clipped):
+        self.J = J  # Current density (A/m^2)
+        self.V = V  # Cell voltage (V)
+        self.power_w = power_w  # Electric power drawn by the stack (W)
+        self.requested_power_w = requested_power_w
+        self.iterations = iterations  # Newton/bisection iterations; 0 when served from the table
+        self.clipped = clipped  # True when the requested power exceeds the stack rating
+
+    def __repr__(self):
+        return (f"OperatingPoint(J={self.J}, V={self.V}, power_w={self.power_w}, iterations={self.iterations}, "
+                f"clipped={self.clipped})")
+
+
+@functools.lru_cache(maxsize=16)
+def _polarization_table(key, points):
+    """Power and current density on a grid over [0, J_max], shared by solvers with the same parameters."""
+    V0, electrodes, z, R, T, F, R_PEM, scale, J_max = key
+    J = np.linspace(0.0, J_max, points)
+    V = V0 + sum(activation_overpotential(J, 0.5 * two_J0, alpha, z, T, R, F) for two_J0, alpha in electrodes) \
+        + J * R_PEM
+    return J.tolist(), (scale * J * V).tolist()
+
+
+class PEMOperatingPointSolver:
+    """
+    Finds the current density at which the stack draws a given electric power.
+
+    The cell voltage is V(J) = V0 + eta_act_a(J) + eta_act_c(J) + J * R_PEM, with the activation
+    overpotentials of ActivationOverpotential: the asinh form evaluated on plain floats when both
+    electrodes are symmetric (alpha = 0.5, z = 2), otherwise Butler-Volmer inverted numerically. The stack
+    power P(J) = n_cells * area * J * V(J) increases monotonically, so every set-point has a
+    unique solution in [0, J_max].
+
+    A polarization table over [0, J_max] gives a bracket and an interpolated estimate. When the
+    estimate is within `table_rtol` of the requested power it is used as is; otherwise a
+    safeguarded Newton iteration (bisection whenever a Newton step leaves the bracket) polishes
+    it. Without a table the iteration is warm-started from the previous solution.
+
+    Parameters:
+    - activation_params: PEMParameters of the activation overpotential model.
+    - params: PEMOperatingPointParameters.
+    - table_points: Number of polarization table points (0 disables the table).
+    - table_rtol: Relative power error accepted from table interpolation.
+    - rtol: Relative power tolerance of the iteration.
+    - max_iterations: Iteration limit of the safeguarded Newton solve.
+    """
+
+    def __init__(self, activation_params: PEMParameters, params: PEMOperatingPointParameters, table_points=2048,
+                 table_rtol=1e-4, rtol=1e-10, max_iterations=50):
+        self.params = params
+        self.table_rtol = table_rtol
+        self.rtol = rtol
+        self.max_iterations = max_iterations
+
+        # Plain-float constants of V(J)
+        self.activation_params = activation_params
+        RT = activation_params.R * activation_params.T
+        self.b = RT / activation_params.F
+        self.two_J0_a = 2 * activation_params.J_ref_a * math.exp(-activation_params.E_act_a / RT)
+        self.two_J0_c = 2 * activation_params.J_ref_c * math.exp(-activation_params.E_act_c / RT)
+        self.electrodes = ((self.two_J0_a, activation_params.alpha_a), (self.two_J0_c, activation_params.alpha_c))
+        self.symmetric = all(is_symmetric(alpha, activation_params.z) for _, alpha in self.electrodes)
+        self.scale = params.n_cells * params.area
+        self.max_power_w = self.power(params.J_max)
+
+        self.table_J = self.table_P = None
+        if table_points:
+            a = activation_params
+            key = (params.V0, self.electrodes, a.z, a.R, a.T, a.F, params.R_PEM, self.scale, float(params.J_max))
+            self.table_J, self.table_P = _polarization_table(key, table_points)
+        self.last = None  # Previous OperatingPoint, for warm starts
+
+    def voltage(self, J):
+        if not self.symmetric:
+            return self.params.V0 + self._activation(J)[0] + J * self.params.R_PEM
+        return (self.params.V0 + self.b * (math.asinh(J / self.two_J0_a) + math.asinh(J / self.two_J0_c))
+                + J * self.params.R_PEM)
+
+    def _activation(self, J):
+        # eta_act_a + eta_act_c and its derivative with respect to J, by Butler-Volmer for asymmetric electrodes
+        a = self.activation_params
+        f = a.z * a.F / (a.R * a.T)
+        eta = slope = 0.0
+        for two_J0, alpha in self.electrodes:
+            J0 = 0.5 * two_J0
+            eta_electrode = float(solve_overpotential(J, J0, alpha=alpha, z=a.z, T=a.T, R=a.R, F=a.F).eta)
+            eta += eta_electrode
+            slope += 1 / (J0 * f * (alpha * math.exp(alpha * f * eta_electrode)
+                                    + (1 - alpha) * math.exp(-(1 - alpha) * f * eta_electrode)))
+        return eta, slope
+
+    def power(self, J):
+        return self.scale * J * self.voltage(J)
+
+    def _power_and_slope(self, J):
+        if not self.symmetric:
+            eta, slope = self._activation(J)
+            V = self.params.V0 + eta + J * self.params.R_PEM
+            return self.scale * J * V, self.scale * (V + J * (slope + self.params.R_PEM))
+        V = self.voltage(J)
+        dV = (self.b * (1 / math.sqrt(self.two_J0_a ** 2 + J * J) + 1 / math.sqrt(self.two_J0_c ** 2 + J * J))
+              + self.params.R_PEM)
+        return self.scale * J * V, self.scale * (V + J * dV)
+
+    def solve(self, power_w):
+        """
+        Solve for the operating point that draws power_w (W).
+
+        Returns:
+        - OperatingPoint; J is clipped to J_max when power_w exceeds the stack rating.
+        """
+        last = self.last
+        if last is not None and power_w == last.requested_power_w:
+            return last
+        if power_w <= 0:
+            self.last = OperatingPoint(0.0, self.params.V0, 0.0, power_w, 0, False)
+            return self.last
+        if power_w >= self.max_power_w:
+            J_max = self.params.J_max
+            self.last = OperatingPoint(J_max, self.voltage(J_max), self.max_power_w, power_w, 0, True)
+            return self.last
+
+        low, high = 0.0, self.params.J_max
+        if self.table_P is not None:
+            i = min(bisect.bisect_right(self.table_P, power_w), len(self.table_P) - 1)
+            low, high = self.table_J[i - 1], self.table_J[i]
+            P_low, P_high = self.table_P[i - 1], self.table_P[i]
+            J = low + (power_w - P_low) * (high - low) / (P_high - P_low)
+            P = self.power(J)
+            if abs(P - power_w) <= self.table_rtol * power_w:
+                self.last = OperatingPoint(J, P / (self.scale * J), P, power_w, 0, False)
+                return self.last
+        else:
+            J = last.J if last is not None and 0 < last.J < high else 0.5 * high
+
+        iterations = 0
+        for iterations in range(1, self.max_iterations + 1):
+            P, slope = self._power_and_slope(J)
+            residual = P - power_w
+            if abs(residual) <= self.rtol * power_w:
+                break
+            # Keep the bracket around the root
+            if residual > 0:
+                high = J
+            else:
+                low = J
+            J_newton = J - residual / slope if slope > 0 else -1.0
+            J = J_newton if low < J_newton < high else 0.5 * (low + high)
+        V = self.voltage(J)
+        self.last = OperatingPoint(J, V, self.scale * J * V, power_w, iterations, False)
+        return self.last
+
+    def apply(self, state: PEMState, operating_point: OperatingPoint):
+        """Write J, V and Q_electric (W) of an operating point to the state."""
+        state.update_J(operating_point.J)
+        state.update_V(operating_point.V)
+        state.update_Q_electric(operating_point.power_w)
+
+
+# Test Suite
+class TestPEMOperatingPointSolver(unittest.TestCase):
+    def setUp(self):
+        self.activation = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000,
+                                        E_act_c=80000)
+        self.params = PEMOperatingPointParameters(V0=1.23, R_PEM=1.5e-3, area=1.0, n_cells=200, J_max=20000)
+
+    def assertRoundTrip(self, solver, point, power_w, rtol):
+        # The operating point draws the requested power: n_cells * area * J * V(J) = P
+        self.assertAlmostEqual(point.V, solver.voltage(point.J), delta=1e-12)
+        drawn = self.params.n_cells * self.params.area * point.J * point.V
+        self.assertLessEqual(abs(drawn - power_w), rtol * power_w)
+        self.assertAlmostEqual(point.power_w, drawn, delta=1e-9 * power_w)
+
+    def test_table_path_round_trip(self):
+        solver = PEMOperatingPointSolver(self.activation, self.params)
+        for power_w in (1e5, 2.5e5, 0.5 * solver.max_power_w, 0.99 * solver.max_power_w):
+            point = solver.solve(power_w)
+            self.assertEqual(point.iterations, 0)
+            self.assertFalse(point.clipped)
+            self.assertRoundTrip(solver, point, power_w, solver.table_rtol)
+        # The first table interval is too curved to interpolate; the estimate is polished instead
+        point = solver.solve(1e4)
+        self.assertGreater(point.iterations, 0)
+        self.assertRoundTrip(solver, point, 1e4, solver.rtol)
+
+    def test_newton_path_round_trip(self):
+        solver = PEMOperatingPointSolver(self.activation, self.params, table_points=0)
+        for power_w in (1e4, 2.5e5, 0.5 * solver.max_power_w, 0.99 * solver.max_power_w):
+            point = solver.solve(power_w)
+            self.assertGreater(point.iterations, 0)
+            self.assertRoundTrip(solver, point, power_w, solver.rtol)
+
+    def test_power_above_rating_is_clipped_to_J_max(self):
+        solver = PEMOperatingPointSolver(self.activation, self.params)
+        point = solver.solve(2 * solver.max_power_w)
+        self.assertTrue(point.clipped)
+        self.assertEqual(point.J, self.params.J_max)
+        self.assertEqual(point.power_w, solver.max_power_w)
+        self.assertEqual(point.requested_power_w, 2 * solver.max_power_w)
+
+    def test_zero_power(self):
+        solver = PEMOperatingPointSolver(self.activation, self.params)
+        for power_w in (0.0, -1.0):
+            point = solver.solve(power_w)
+            self.assertEqual((point.J, point.V, point.power_w), (0.0, self.params.V0, 0.0))
+            self.assertFalse(point.clipped)
+
+    def test_asymmetric_alpha(self):
+        activation = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000,
+                                   E_act_c=80000, alpha_a=0.3, alpha_c=0.7)
+        table_solver = PEMOperatingPointSolver(activation, self.params)
+        newton_solver = PEMOperatingPointSolver(activation, self.params, table_points=0)
+        self.assertFalse(table_solver.symmetric)
+
+        J = 5000.0
+        eta = sum(activation_overpotential(J, 0.5 * two_J0, alpha, activation.z, activation.T, activation.R,
+                                           activation.F) for two_J0, alpha in table_solver.electrodes)
+        self.assertAlmostEqual(table_solver.voltage(J), self.params.V0 + eta + J * self.params.R_PEM, delta=1e-9)
+        self.assertNotAlmostEqual(table_solver.voltage(J), PEMOperatingPointSolver(
+            self.activation, self.params, table_points=0).voltage(J), delta=1e-6)
+
+        for power_w in (1e4, 0.5 * table_solver.max_power_w):
+            self.assertRoundTrip(table_solver, table_solver.solve(power_w), power_w, table_solver.table_rtol)
+            point = newton_solver.solve(power_w)
+            self.assertGreater(point.iterations, 0)
+            self.assertRoundTrip(newton_solver, point, power_w, newton_solver.rtol)
+
+    def test_apply_writes_the_operating_point_to_the_state(self):
+        solver = PEMOperatingPointSolver(self.activation, self.params)
+        state = PEMState(initial_values={'J': 0, 'V': 0, 'Q_electric': 0})
+        point = solver.solve(2.5e5)
+        solver.apply(state, point)
+        self.assertEqual((state.J, state.V, state.Q_electric), (point.J, point.V, point.power_w))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
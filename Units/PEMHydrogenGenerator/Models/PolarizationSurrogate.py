@@ -0,0 +1,269 @@
+"""
+Precomputed polarization surrogate of the PEM electrolyzer cell.
+
+The cell voltage and its breakdown are tabulated once on a (J, T) grid:
+- reversible voltage V_rev(T) = V0 + dV0_dT * (T - 298.15),
+- activation overpotential per electrode, (R T / F) * asinh(J / (2 J0(T))) with
+  J0(T) = J_ref * exp(-E_act / (R T)) for symmetric electrodes and the numeric Butler-Volmer inverse
+  otherwise (alpha != 0.5 or z != 2), as in ActivationOverpotential,
+- ohmic overpotential J * R_PEM(T), with R_PEM the trapezoid integral of 1 / sigma(lambda(x), T)
+  over the membrane, as in PEMOhmicOverpotentialModel.
+
+Lookups are batched interpolations. The activation terms are bilinear on a current-density axis
+uniform in u = asinh(J / J_scale), with J_scale twice the smallest exchange current density in the
+temperature range; the overpotential is nearly linear in u, so a modest grid is accurate from J = 0
+to J_max. The ohmic and reversible terms are exactly linear in J and only R_PEM(T) and V_rev(T) are
+interpolated along T, except for the Arrhenius factor of the membrane conductivity, which is
+separable and evaluated exactly. The worst interpolation error over the cell midpoints is measured against
+the exact equations when the table is built and reported as `error_bound_v`.
+
+Tables are cached in an .npz file named after a hash of every parameter that affects them.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import unittest
+
+import numpy as np
+
+from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+from Units.PEMHydrogenGenerator.Models.ButlerVolmer import activation_overpotential
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = os.getenv('POLARIZATION_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'semtex-sim'))
+BREAKDOWN = ("V", "V_rev", "eta_act_a", "eta_act_c", "eta_ohm")
+TABLES = ("eta_act_a", "eta_act_c", "R_PEM_303", "V_rev")  # (J, T), (J, T), (), (T,)
+
+
+class PolarizationSurrogate:
+    """
+    Interpolated V(J, T) of one cell with its breakdown.
+
+    Parameters:
+    - activation_params: PEMParameters (R, F, J_ref_a/c, E_act_a/c, alpha_a/c, z; its T is not used).
+    - V0: Reversible voltage at 298.15 K (V).
+    - lambda_a / lambda_c / L: Membrane water content at the anode/cathode side and thickness (m).
+    - J_max: Upper end of the current-density axis (A/m^2).
+    - T_range: (T_min, T_max) of the temperature axis (K).
+    - n_J / n_T: Grid points along each axis.
+    - dV0_dT: Temperature coefficient of the reversible voltage (V/K); 0 keeps V0 constant like the cell model.
+    - ohmic_points: Trapezoids in the R_PEM integral (same default as calculate_R_PEM).
+    - cache_dir: Directory of the .npz cache; None disables caching.
+    """
+
+    def __init__(self, activation_params: PEMParameters, V0, lambda_a, lambda_c, L, J_max=20000,
+                 T_range=(293.15, 353.15), n_J=257, n_T=25, dV0_dT=0.0, ohmic_points=1000,
+                 cache_dir=DEFAULT_CACHE_DIR):
+        self.parameters = {
+            "version": CACHE_VERSION, "R": activation_params.R, "F": activation_params.F,
+            "J_ref_a": activation_params.J_ref_a, "J_ref_c": activation_params.J_ref_c,
+            "E_act_a": activation_params.E_act_a, "E_act_c": activation_params.E_act_c,
+            "alpha_a": activation_params.alpha_a, "alpha_c": activation_params.alpha_c, "z": activation_params.z,
+            "V0": V0,
+            "lambda_a": lambda_a, "lambda_c": lambda_c, "L": L, "J_max": J_max, "T_min": T_range[0],
+            "T_max": T_range[1], "n_J": n_J, "n_T": n_T, "dV0_dT": dV0_dT, "ohmic_points": ohmic_points,
+        }
+        self.parameter_hash = hashlib.sha256(json.dumps(self.parameters, sort_keys=True).encode()).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, f"polarization-{self.parameter_hash}.npz") if cache_dir else None
+
+        RT_min = activation_params.R * T_range[0]
+        self.J_scale = 2 * min(activation_params.J_ref_a * math.exp(-activation_params.E_act_a / RT_min),
+                               activation_params.J_ref_c * math.exp(-activation_params.E_act_c / RT_min))
+        self.u = np.linspace(0.0, math.asinh(J_max / self.J_scale), n_J)
+        self.T = np.linspace(T_range[0], T_range[1], n_T)
+        self._du = self.u[1] - self.u[0]
+        self._dT = self.T[1] - self.T[0]
+        self.loaded_from_cache = False
+        if not self._load():
+            J, T = np.meshgrid(self.J_scale * np.sinh(self.u), self.T, indexing="ij")
+            exact = self.exact(J, T)
+            self.tables = {"eta_act_a": exact["eta_act_a"], "eta_act_c": exact["eta_act_c"],
+                           "R_PEM_303": np.asarray(self.ohmic_resistance(303.0)), "V_rev": exact["V_rev"][0]}
+            self.error_bound_v = self._measure_error_bound()
+            self._save()
+
+    # Exact model
+
+    def ohmic_resistance(self, T):
+        """Area-specific membrane resistance R_PEM(T) (ohm m^2) by the trapezoid rule of calculate_R_PEM."""
+        p = self.parameters
+        x = np.linspace(0.0, p["L"], p["ohmic_points"] + 1)
+        lambda_x = (p["lambda_a"] - p["lambda_c"]) / p["L"] * x + p["lambda_c"]
+        # sigma(lambda, T) = (0.5139 lambda - 0.326) exp(1268 (1/303 - 1/T)) separates in lambda and T
+        f = 1.0 / (0.5139 * lambda_x - 0.326)
+        resistance_303 = float(np.sum(0.5 * (f[1:] + f[:-1]) * np.diff(x)))
+        return resistance_303 * self._arrhenius(T)
+
+    @staticmethod
+    def _arrhenius(T):
+        return np.exp(-1268 * (1 / 303 - 1 / np.asarray(T, dtype=np.float64)))
+
+    def exact(self, J, T):
+        """Evaluate the breakdown with the full equations; returns a dict of arrays (see BREAKDOWN)."""
+        p = self.parameters
+        J = np.asarray(J, dtype=np.float64)
+        T = np.asarray(T, dtype=np.float64)
+        RT = p["R"] * T
+        eta_act_a = activation_overpotential(J, p["J_ref_a"] * np.exp(-p["E_act_a"] / RT), p["alpha_a"], p["z"], T,
+                                             p["R"], p["F"])
+        eta_act_c = activation_overpotential(J, p["J_ref_c"] * np.exp(-p["E_act_c"] / RT), p["alpha_c"], p["z"], T,
+                                             p["R"], p["F"])
+        eta_ohm = J * self.ohmic_resistance(T)
+        V_rev = p["V0"] + p["dV0_dT"] * (T - 298.15) + np.zeros_like(J)
+        return {"V": V_rev + eta_act_a + eta_act_c + eta_ohm, "V_rev": V_rev, "eta_act_a": eta_act_a,
+                "eta_act_c": eta_act_c, "eta_ohm": eta_ohm}
+
+    # Interpolation
+
+    def evaluate(self, J, T, fields=BREAKDOWN):
+        """
+        Batched bilinear lookup.
+
+        Parameters:
+        - J: Current densities (A/m^2), clipped to [0, J_max].
+        - T: Temperatures (K), broadcast against J and clipped to the table range.
+        - fields: Names from BREAKDOWN to return.
+
+        Returns:
+        - Dict of arrays with the broadcast shape of J and T.
+        """
+        J, T = np.broadcast_arrays(np.asarray(J, dtype=np.float64), np.asarray(T, dtype=np.float64))
+        J = np.clip(J, 0.0, None)
+        fu = np.clip((np.arcsinh(J / self.J_scale) - self.u[0]) / self._du, 0.0, len(self.u) - 1)
+        fT = np.clip((T - self.T[0]) / self._dT, 0.0, len(self.T) - 1)
+        i = np.minimum(fu.astype(np.intp), len(self.u) - 2)
+        k = np.minimum(fT.astype(np.intp), len(self.T) - 2)
+        wu = fu - i
+        wT = fT - k
+
+        def along_T(table):
+            return table[k] * (1 - wT) + table[k + 1] * wT
+
+        def bilinear(table):
+            low = table[i, k] * (1 - wT) + table[i, k + 1] * wT
+            high = table[i + 1, k] * (1 - wT) + table[i + 1, k + 1] * wT
+            return low * (1 - wu) + high * wu
+
+        terms = {"V_rev": along_T(self.tables["V_rev"]),
+                 "eta_act_a": bilinear(self.tables["eta_act_a"]),
+                 "eta_act_c": bilinear(self.tables["eta_act_c"]),
+                 "eta_ohm": J * self.tables["R_PEM_303"] * self._arrhenius(T)}
+        terms["V"] = terms["V_rev"] + terms["eta_act_a"] + terms["eta_act_c"] + terms["eta_ohm"]
+        return {name: terms[name] for name in fields}
+
+    def voltage(self, J, T):
+        return self.evaluate(J, T, fields=("V",))["V"]
+
+    def _measure_error_bound(self):
+        # Bilinear interpolation errors peak between grid points; check every cell midpoint
+        u_mid = 0.5 * (self.u[1:] + self.u[:-1])
+        T_mid = 0.5 * (self.T[1:] + self.T[:-1])
+        J, T = np.meshgrid(self.J_scale * np.sinh(u_mid), T_mid, indexing="ij")
+        return float(np.max(np.abs(self.voltage(J, T) - self.exact(J, T)["V"])))
+
+    def validate_against_models(self, samples=3, seed=0):
+        """
+        Compare against the pint-based ActivationOverpotential and PEMOhmicOverpotentialModel at random points.
+
+        This runs the slow reference models (about 0.5 s per sample).
+
+        Returns:
+        - Largest absolute voltage difference (V).
+        """
+        from State.CentralizedState import CentralizedState
+        from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import ActivationOverpotential
+        from Units.PEMHydrogenGenerator.Models.OhmicOverpotential import (PEMOhmicOverpotentialModel,
+                                                                          PEMParametersOhmic)
+
+        p = self.parameters
+        rng = np.random.default_rng(seed)
+        activation = ActivationOverpotential()
+        ohmic = PEMOhmicOverpotentialModel()
+        worst = 0.0
+        for J, T in zip(rng.uniform(0, p["J_max"], samples), rng.uniform(p["T_min"], p["T_max"], samples)):
+            params = PEMParameters(R=p["R"], T=T, F=p["F"], J_ref_a=p["J_ref_a"], J_ref_c=p["J_ref_c"],
+                                   E_act_a=p["E_act_a"], E_act_c=p["E_act_c"], alpha_a=p["alpha_a"],
+                                   alpha_c=p["alpha_c"], z=p["z"])
+            state = CentralizedState(initial_values={'J': J, 'lambda_a': p["lambda_a"], 'lambda_c': p["lambda_c"],
+                                                     'L': p["L"]})
+            eta_act = (activation.compute_activation_overpotential(state, 'a', params)
+                       + activation.compute_activation_overpotential(state, 'c', params)).m_as("V")
+            R_PEM = ohmic.calculate_R_PEM(PEMParametersOhmic(T=T, z=2, F=p["F"], R=p["R"]), state,
+                                          num_points=p["ohmic_points"]).magnitude
+            V = p["V0"] + p["dV0_dT"] * (T - 298.15) + eta_act + J * R_PEM
+            worst = max(worst, abs(float(self.voltage(J, T)) - V))
+        return worst
+
+    # Cache
+
+    def _load(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return False
+        try:
+            with np.load(self.cache_path) as cached:
+                if str(cached["parameter_hash"]) != self.parameter_hash:
+                    return False
+                self.tables = {name: cached[name] for name in TABLES}
+                self.error_bound_v = float(cached["error_bound_v"])
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable polarization cache {self.cache_path}: {e}")
+            return False
+        self.loaded_from_cache = True
+        return True
+
+    def _save(self):
+        if self.cache_path is None:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp.npz"
+        np.savez_compressed(tmp_path, parameter_hash=self.parameter_hash, error_bound_v=self.error_bound_v,
+                            parameters=json.dumps(self.parameters), **self.tables)
+        os.replace(tmp_path, self.cache_path)
+
+
+# Test Suite
+class TestPolarizationSurrogate(unittest.TestCase):
+    PARAMS = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000, E_act_c=80000)
+
+    def test_interpolation_within_error_bound(self):
+        surrogate = PolarizationSurrogate(self.PARAMS, V0=1.23, lambda_a=20, lambda_c=10, L=0.01, cache_dir=None)
+        rng = np.random.default_rng(0)
+        J = rng.uniform(0, 20000, 5000)
+        T = rng.uniform(293.15, 353.15, 5000)
+        error = np.abs(surrogate.voltage(J, T) - surrogate.exact(J, T)["V"])
+        self.assertLessEqual(error.max(), surrogate.error_bound_v * 1.01)
+        self.assertLess(surrogate.error_bound_v, 1e-3)
+
+    def test_cache_round_trip(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            built = PolarizationSurrogate(self.PARAMS, V0=1.23, lambda_a=20, lambda_c=10, L=0.01, cache_dir=directory)
+            loaded = PolarizationSurrogate(self.PARAMS, V0=1.23, lambda_a=20, lambda_c=10, L=0.01, cache_dir=directory)
+            other = PolarizationSurrogate(self.PARAMS, V0=1.25, lambda_a=20, lambda_c=10, L=0.01, cache_dir=directory)
+        self.assertFalse(built.loaded_from_cache)
+        self.assertTrue(loaded.loaded_from_cache)
+        self.assertFalse(other.loaded_from_cache)
+        np.testing.assert_array_equal(built.tables["eta_act_a"], loaded.tables["eta_act_a"])
+
+    def test_asymmetric_kinetics(self):
+        import tempfile
+        from Units.PEMHydrogenGenerator.Models.ButlerVolmer import butler_volmer_current
+        params = PEMParameters(R=8.314, T=300, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000, E_act_c=80000,
+                               alpha_a=0.3, alpha_c=0.6, z=2)
+        with tempfile.TemporaryDirectory() as directory:
+            symmetric = PolarizationSurrogate(self.PARAMS, V0=1.23, lambda_a=20, lambda_c=10, L=0.01,
+                                              cache_dir=directory)
+            surrogate = PolarizationSurrogate(params, V0=1.23, lambda_a=20, lambda_c=10, L=0.01, cache_dir=directory)
+        self.assertFalse(surrogate.loaded_from_cache)
+        self.assertNotEqual(surrogate.parameter_hash, symmetric.parameter_hash)
+        J = np.array([10.0, 1000.0, 15000.0])
+        eta_act_a = surrogate.exact(J, 330.0)["eta_act_a"]
+        J0_a = 0.1 * np.exp(-80000 / (8.314 * 330.0))
+        np.testing.assert_allclose(butler_volmer_current(eta_act_a, J0_a, 0.3, 2, 330.0, 8.314, 96500), J, rtol=1e-9)
+        self.assertLess(surrogate.error_bound_v, 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
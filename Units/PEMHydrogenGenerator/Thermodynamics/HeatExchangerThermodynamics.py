@@ -1,7 +1,9 @@
-import sympy as sp
 from pint import UnitRegistry
 import simpy
 from State.CentralizedState import CentralizedState as HeatExchangerState
+from Utils.lazy_import import lazy_import
+
+sp = lazy_import("sympy")
 
 class HeatExchangerParameters:
     def __init__(self, Q_max, F, H_H2O_T, H_H2O_T0, T0, T_source, epsilon):
@@ -16,7 +18,7 @@ class HeatExchangerParameters:
 
 
 class HeatExchangerThermodynamics:
-    def __init__(self, env, params: HeatExchangerParameters, state: HeatExchangerState, time_step):
+    def __init__(self, env, params: HeatExchangerParameters, state: HeatExchangerState, time_step, start_process=True):
         self.ureg = UnitRegistry()
         self.env = env
         self.params = params
@@ -41,19 +43,23 @@ class HeatExchangerThermodynamics:
         self.E_heat_H2O_func = sp.lambdify((self.J, self.F, self.H_H2O_T, self.H_H2O_T0, self.T0, self.T_source),
                                            self.E_heat_H2O_eq, modules=[{'Quantity': self.ureg.Quantity}, 'math'])
 
-        # Start the process
-        self.action = env.process(self.run())
+        # Results of the latest step
+        self.Q = self.Q_theoretical = self.E_heat_H2O = None
+
+        # Start the process, unless the owner or a TickScheduler steps the heat exchanger
+        self.action = env.process(self.run()) if start_process else None
 
     def run(self):
         while True:
-            # Perform the calculations and potentially update state variables
-            Q = self.calculate_Q()
-            Q_theoretical = self.calculate_Q_theoretical()
-            E_heat_H2O = self.calculate_E_heat_H2O()
+            self.step()
 
             # Simulation waits for the next time step
             yield self.env.timeout(self.time_step)
 
+    def step(self):
+        # Perform the calculations and keep the results for the other units
+        self.Q, self.Q_theoretical, self.E_heat_H2O = self.update()
+
     def calculate_Q(self):
         return self.Q_func(self.params.epsilon, self.params.Q_max)
 
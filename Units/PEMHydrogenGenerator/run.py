@@ -1,3 +1,336 @@
-# 1. Efficiency
-# 2. Models
-# 3.
+"""
+Headless, vectorized year run of the PEM electrolyzer.
+
+A power (or current-density) profile is pushed through the electrolyzer models in one pass over
+whole arrays instead of one SimPy tick per hour:
+1. Models: current density J for each power set-point and the cell voltage breakdown
+   (PolarizationSurrogate, the equations of ActivationOverpotential and PEMOhmicOverpotentialModel).
+2. Efficiency: H2, O2 and H2O flows (H2GeneratorFlowRates), stack and feed-water heat
+   (PEMHeatExergyCalculator, HeatExchangerThermodynamics) and energy/exergy efficiencies
+   (H2GeneratorEfficiency).
+
+The model classes are reused as they are: their lambdified equations are plain arithmetic, so
+they accept numpy arrays in a CentralizedState as well as scalars. Flows and heat are stack
+totals (per-area model values times n_cells * area).
+
+Results are written to a columnar file: .npz, .parquet (needs pyarrow) or .csv.
+
+Usage (from the repository root):
+    python -m Units.PEMHydrogenGenerator.run profile.csv results.npz --column "Power (MW)" --unit MW
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from State.CentralizedState import CentralizedState
+from Units.PEMHydrogenGenerator.Efficiency.Efficiency import H2GeneratorEfficiency
+from Units.PEMHydrogenGenerator.Efficiency.FlowRates import H2GeneratorFlowRates, H2GeneratorFlowRatesParameters
+from Units.PEMHydrogenGenerator.Models.ActivationOverpotential import PEMParameters
+from Units.PEMHydrogenGenerator.Models.HeatExergy import PEMHeatExergyCalculator, PEMHeatExergyParameters
+from Units.PEMHydrogenGenerator.Models.PolarizationSurrogate import DEFAULT_CACHE_DIR, PolarizationSurrogate
+from Units.PEMHydrogenGenerator.Thermodynamics.HeatExchangerThermodynamics import HeatExchangerParameters, \
+    HeatExchangerThermodynamics
+from Utils.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+POWER_UNITS = {"W": 1.0, "kW": 1e3, "MW": 1e6}
+H2_MOLAR_MASS_KG = 2.016e-3
+
+
+class PEMYearRunParameters:
+    """
+    Stack and thermodynamic parameters of a year run.
+
+    The electrochemical defaults match PEMHydrogenGeneratorController. The thermodynamic values use
+    physical data where the controller still has placeholders:
+    - Delta_S: Entropy change of water splitting (J/(mol K)).
+    - LHV_H2 / E_H2: Lower heating value and chemical exergy of hydrogen (J/mol).
+    - H_H2O_T / H_H2O_T0: Feed-water enthalpy at the stack and reference temperature (J/mol).
+    - water_stoichiometry: Water fed per mole of water split.
+    """
+
+    def __init__(self, R=8.314, F=96500, J_ref_a=0.1, J_ref_c=0.1, E_act_a=80000, E_act_c=80000, V0=1.23,
+                 lambda_a=20, lambda_c=10, L=0.01, n_cells=200, area=1.0, J_max=20000, T=300, T0=298.15,
+                 Delta_S=163.3, LHV_H2=241.83e3, E_H2=236.09e3, H_H2O_T=5.65e3, H_H2O_T0=1.89e3, T_source=400,
+                 epsilon=0.8, Q_max=100, water_stoichiometry=2.0):
+        self.R = R
+        self.F = F
+        self.J_ref_a = J_ref_a
+        self.J_ref_c = J_ref_c
+        self.E_act_a = E_act_a
+        self.E_act_c = E_act_c
+        self.V0 = V0
+        self.lambda_a = lambda_a
+        self.lambda_c = lambda_c
+        self.L = L
+        self.n_cells = n_cells
+        self.area = area  # Active area per cell (m^2)
+        self.J_max = J_max  # A/m^2
+        self.T = T  # Stack temperature (K), used when the profile has none
+        self.T0 = T0  # Reference (dead-state) temperature (K)
+        self.Delta_S = Delta_S
+        self.LHV_H2 = LHV_H2
+        self.E_H2 = E_H2
+        self.H_H2O_T = H_H2O_T
+        self.H_H2O_T0 = H_H2O_T0
+        self.T_source = T_source  # Temperature of the heat source of the feed-water heat exchanger (K)
+        self.epsilon = epsilon  # Heat exchanger effectiveness
+        self.Q_max = Q_max  # Maximum heat exchange rate (W)
+        self.water_stoichiometry = water_stoichiometry
+
+
+class PEMYearRun:
+    """
+    Vectorized electrolyzer run over a whole profile.
+
+    The models and the polarization surrogate are built once; run() can then be called for any
+    number of profiles.
+
+    Parameters:
+    - params: PEMYearRunParameters.
+    - time_step_h: Length of one profile row in hours.
+    - cache_dir: Cache directory of the polarization surrogate (None disables caching).
+    - rtol: Relative power tolerance of the current-density solve.
+    """
+
+    def __init__(self, params=None, time_step_h=1.0, cache_dir=DEFAULT_CACHE_DIR, rtol=1e-10, max_iterations=50):
+        self.params = params = params if params is not None else PEMYearRunParameters()
+        self.time_step_h = time_step_h
+        self.rtol = rtol
+        self.max_iterations = max_iterations
+        self.scale = params.n_cells * params.area  # Total active area (m^2)
+
+        self.activation_params = PEMParameters(R=params.R, T=params.T, F=params.F, J_ref_a=params.J_ref_a,
+                                               J_ref_c=params.J_ref_c, E_act_a=params.E_act_a, E_act_c=params.E_act_c)
+        self.polarization = PolarizationSurrogate(self.activation_params, V0=params.V0, lambda_a=params.lambda_a,
+                                                  lambda_c=params.lambda_c, L=params.L, J_max=params.J_max,
+                                                  cache_dir=cache_dir)
+        self.state = CentralizedState(initial_values={'T': params.T, 'lambda_a': params.lambda_a,
+                                                      'lambda_c': params.lambda_c, 'L': params.L})
+        self.flow_rates = H2GeneratorFlowRates(H2GeneratorFlowRatesParameters(F=params.F), self.state)
+        self.heat_exergy_calculator = PEMHeatExergyCalculator()
+        # No SimPy environment: the heat exchanger is evaluated directly
+        self.heat_exchanger = HeatExchangerThermodynamics(
+            None, HeatExchangerParameters(Q_max=params.Q_max, F=params.F, H_H2O_T=params.H_H2O_T,
+                                          H_H2O_T0=params.H_H2O_T0, T0=params.T0, T_source=params.T_source,
+                                          epsilon=params.epsilon),
+            self.state, time_step_h, start_process=False)
+        self.efficiency_calculator = H2GeneratorEfficiency()
+
+    def _power(self, J, T):
+        """Stack power (W) and its derivative with respect to J at each point."""
+        p = self.params
+        RT = p.R * T
+        b = RT / p.F
+        two_J0_a = 2 * p.J_ref_a * np.exp(-p.E_act_a / RT)
+        two_J0_c = 2 * p.J_ref_c * np.exp(-p.E_act_c / RT)
+        R_PEM = self.polarization.ohmic_resistance(T)
+        V = p.V0 + b * (np.arcsinh(J / two_J0_a) + np.arcsinh(J / two_J0_c)) + J * R_PEM
+        dV = b * (1 / np.sqrt(two_J0_a ** 2 + J * J) + 1 / np.sqrt(two_J0_c ** 2 + J * J)) + R_PEM
+        return self.scale * J * V, self.scale * (V + J * dV)
+
+    def solve_current_density(self, power_w, T):
+        """
+        Current density that draws power_w at each point, by a vectorized safeguarded Newton iteration.
+
+        Returns:
+        - (J, clipped, iterations): J in A/m^2, a mask of set-points above the stack rating, and
+          the number of iterations used.
+        """
+        power_w = np.asarray(power_w, dtype=np.float64)
+        T = np.broadcast_to(np.asarray(T, dtype=np.float64), power_w.shape)
+        J_max = float(self.params.J_max)
+        max_power_w, _ = self._power(np.full(power_w.shape, J_max), T)
+        clipped = power_w >= max_power_w
+        active = (power_w > 0) & ~clipped
+
+        J = np.where(clipped, J_max, 0.0)
+        target = power_w[active]
+        T_active = T[active]
+        low = np.zeros_like(target)
+        high = np.full_like(target, J_max)
+        # Start from the chord of P(J) over [0, J_max]; P is convex-ish, so Newton converges from either side
+        J_active = target / max_power_w[active] * J_max
+        iterations = 0
+        for iterations in range(1, self.max_iterations + 1):
+            P, slope = self._power(J_active, T_active)
+            residual = P - target
+            if not len(target) or np.all(np.abs(residual) <= self.rtol * target):
+                break
+            high = np.where(residual > 0, J_active, high)
+            low = np.where(residual > 0, low, J_active)
+            J_newton = J_active - residual / slope
+            J_active = np.where((J_newton > low) & (J_newton < high), J_newton, 0.5 * (low + high))
+        J[active] = J_active
+        return J, clipped, iterations
+
+    def run(self, profile, kind="power", T=None):
+        """
+        Run the electrolyzer over a profile.
+
+        Parameters:
+        - profile: Stack power in W (kind='power') or current density in A/m^2 (kind='current_density') per row.
+        - kind: 'power' or 'current_density'.
+        - T: Stack temperature per row or a scalar (K); defaults to params.T.
+
+        Returns:
+        - Dict of column name -> np.ndarray, one value per profile row.
+
+        Raises:
+        - ValueError: If kind is unknown or the profile has negative values.
+        """
+        p = self.params
+        profile = np.asarray(profile, dtype=np.float64)
+        if np.any(profile < 0):
+            raise ValueError("The profile has negative values.")
+        T = np.broadcast_to(np.asarray(p.T if T is None else T, dtype=np.float64), profile.shape)
+        if kind == "power":
+            J, clipped, _ = self.solve_current_density(profile, T)
+        elif kind == "current_density":
+            clipped = profile > p.J_max
+            J = np.minimum(profile, p.J_max)
+        else:
+            raise ValueError(f"Unknown profile kind: {kind}")
+
+        # Models
+        breakdown = self.polarization.exact(J, T)
+        V = breakdown["V"]
+        power_w = self.scale * J * V
+
+        # Array-valued state for the Efficiency and Thermodynamics classes
+        state = self.state
+        state.update_J(J)
+        state.update_T(T)
+        state.update_V(V)
+        state.update_Q_electric(power_w)
+        state.update_N_H2O_in(p.water_stoichiometry * J / (2 * p.F))
+
+        N_H2_out, N_O2_out, N_H2O_out = (flow.magnitude * self.scale for flow in self.flow_rates.update())
+        state.update_N_H2_out_dot(N_H2_out)
+
+        heat_params = PEMHeatExergyParameters(F=p.F, eta_act_a=breakdown["eta_act_a"],
+                                              eta_act_c=breakdown["eta_act_c"], eta_ohm=breakdown["eta_ohm"],
+                                              Delta_S=p.Delta_S, T0=p.T0)
+        entropy_generation, Q_heat_PEM, E_heat_PEM = self.heat_exergy_calculator.update(heat_params, state)
+        Q_heat_PEM = Q_heat_PEM * self.scale
+        E_heat_PEM = E_heat_PEM * self.scale
+        Q_exchanger, Q_heat_H2O, E_heat_H2O = self.heat_exchanger.update()
+        Q_heat_H2O = Q_heat_H2O * self.scale
+        E_heat_H2O = E_heat_H2O * self.scale
+
+        # Only heat drawn by the stack is an input; heat released by the overpotentials is not
+        heat_in_pem = np.maximum(Q_heat_PEM, 0.0)
+        exergy_in_pem = np.maximum(E_heat_PEM, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            eta_en = self.efficiency_calculator.eta_en_func(p.LHV_H2, N_H2_out, power_w, heat_in_pem, Q_heat_H2O)
+            eta_ex = self.efficiency_calculator.eta_ex_func(p.E_H2, N_H2_out, power_w, exergy_in_pem, E_heat_H2O)
+        operating = J > 0
+        seconds = self.time_step_h * 3600
+
+        return {
+            "J": J,
+            "V": V,
+            "power_w": power_w,
+            "clipped": clipped,
+            "T": np.array(T),
+            "V_rev": breakdown["V_rev"],
+            "eta_act_a": breakdown["eta_act_a"],
+            "eta_act_c": breakdown["eta_act_c"],
+            "eta_ohm": breakdown["eta_ohm"],
+            "N_H2_out": N_H2_out,
+            "N_O2_out": N_O2_out,
+            "N_H2O_in": state.N_H2O_in * self.scale,
+            "N_H2O_out": N_H2O_out,
+            "h2_kg": N_H2_out * seconds * H2_MOLAR_MASS_KG,
+            "entropy_generation": entropy_generation,
+            "Q_heat_PEM": Q_heat_PEM,
+            "E_heat_PEM": E_heat_PEM,
+            "Q_heat_exchanger": np.full(J.shape, float(Q_exchanger)),
+            "Q_heat_H2O": Q_heat_H2O,
+            "E_heat_H2O": E_heat_H2O,
+            "eta_en": np.where(operating, eta_en, np.nan),
+            "eta_ex": np.where(operating, eta_ex, np.nan),
+        }
+
+
+def load_profile(path, column=None, temperature_column=None):
+    """
+    Read a profile column (the first numeric non-Datetime column by default) from a CSV file.
+
+    Returns:
+    - (values, temperatures or None, timestamps or None)
+    """
+    frame = pd.read_csv(path)
+    if column is None:
+        numeric = [name for name in frame.columns
+                   if name not in ("Datetime", temperature_column) and pd.api.types.is_numeric_dtype(frame[name])]
+        if not numeric:
+            raise ValueError(f"No numeric profile column in {path}")
+        column = numeric[0]
+    timestamps = pd.to_datetime(frame["Datetime"]).to_numpy() if "Datetime" in frame.columns else None
+    temperatures = frame[temperature_column].to_numpy(dtype=np.float64) if temperature_column else None
+    return frame[column].to_numpy(dtype=np.float64), temperatures, timestamps
+
+
+def write_results(results, path, timestamps=None):
+    """Write the result columns to .npz, .parquet or .csv, chosen by the file extension."""
+    columns = dict(results)
+    if timestamps is not None:
+        columns = {"Datetime": timestamps, **columns}
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npz":
+        np.savez_compressed(path, **columns)
+    elif extension == ".parquet":
+        pd.DataFrame(columns).to_parquet(path, index=False)
+    elif extension == ".csv":
+        pd.DataFrame(columns).to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unsupported output format: {extension} (use .npz, .parquet or .csv)")
+    return path
+
+
+def summarize(results, time_step_h=1.0):
+    energy_mwh = float(np.sum(results["power_w"])) * time_step_h / 1e6
+    h2_kg = float(np.sum(results["h2_kg"]))
+    operating = results["J"] > 0
+    return {
+        "hours": len(results["J"]) * time_step_h,
+        "operating_hours": int(np.count_nonzero(operating)) * time_step_h,
+        "clipped_hours": int(np.count_nonzero(results["clipped"])) * time_step_h,
+        "energy_mwh": energy_mwh,
+        "h2_kg": h2_kg,
+        "specific_energy_kwh_per_kg": energy_mwh * 1e3 / h2_kg if h2_kg else float("nan"),
+        "mean_eta_en": float(np.nanmean(results["eta_en"])) if operating.any() else float("nan"),
+        "mean_eta_ex": float(np.nanmean(results["eta_ex"])) if operating.any() else float("nan"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vectorized year run of the PEM electrolyzer.")
+    parser.add_argument("profile_file", help="CSV with a power or current-density column (and optionally Datetime)")
+    parser.add_argument("output_file", help=".npz, .parquet or .csv")
+    parser.add_argument("--column", default=None, help="Profile column (default: first numeric column)")
+    parser.add_argument("--kind", choices=("power", "current_density"), default="power")
+    parser.add_argument("--unit", choices=sorted(POWER_UNITS), default="W", help="Unit of a power profile")
+    parser.add_argument("--temperature-column", default=None, help="Stack temperature column (K)")
+    parser.add_argument("--time-step-h", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    values, temperatures, timestamps = load_profile(args.profile_file, args.column, args.temperature_column)
+    if args.kind == "power":
+        values = values * POWER_UNITS[args.unit]
+    year_run = PEMYearRun(time_step_h=args.time_step_h)
+    start = time.perf_counter()
+    results = year_run.run(values, kind=args.kind, T=temperatures)
+    elapsed = time.perf_counter() - start
+    write_results(results, args.output_file, timestamps)
+    for name, value in summarize(results, args.time_step_h).items():
+        print(f"{name}: {value}")
+    print(f"Processed {len(values)} rows in {elapsed:.3f} s; results in {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,100 @@
 import simpy
-import pandas as pd
+from Utils.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
 
 
 class SolarFarm:
-    def __init__(self, env, file_path):
+    def __init__(self, env, file_path, time_index=None):
         self.env = env
         self.energy_data = pd.read_csv(file_path, parse_dates=['Datetime'])
-        self.current_hour = 0
+        self.time_index = time_index  # Shared TimeIndex; when set, the row follows the simulation time
+        self._current_hour = 0
+
+    @property
+    def current_hour(self):
+        if self.time_index is not None:
+            return self.time_index.row(self.env.now)
+        return self._current_hour
+
+    @current_hour.setter
+    def current_hour(self, hour):
+        self._current_hour = hour
+
+    def get_energy_supplied(self):
+        # Energy Supplied for the current hour in MJ
+        if self.time_index is not None:
+            return self.time_index.value('Energy Supplied (MJ)', self.env.now)
+        return self.energy_data.iloc[self._current_hour]['Energy Supplied (MJ)']
 
     def process(self):
         while True:
-            # Get the energy supplied for the current hour
-            energy_supplied = self.energy_data.iloc[self.current_hour]['Energy Supplied (MJ)']
-            print(f"Hour: {self.current_hour}, Energy Supplied by Solar Farm: {energy_supplied} MJ")
-            # Go to the next hour
-            self.current_hour += 1
-            if self.current_hour >= len(self.energy_data):
-                self.current_hour = 0  # Reset to the first hour after a year
+            self.step()
             # Process runs every hour
             yield self.env.timeout(1)
 
+    def step(self):
+        # Get the energy supplied for the current hour
+        energy_supplied = self.get_energy_supplied()
+        print(f"Hour: {self.current_hour}, Energy Supplied by Solar Farm: {energy_supplied} MJ")
+        # Go to the next hour; with a shared time index the row follows the simulation time instead
+        if self.time_index is None:
+            self._current_hour += 1
+            if self._current_hour >= len(self.energy_data):
+                self._current_hour = 0  # Reset to the first hour after a year
+
+    def get_checkpoint_state(self):
+        return {"current_hour": self._current_hour}
+
+    def restore_checkpoint_state(self, checkpoint_state):
+        self._current_hour = checkpoint_state["current_hour"]
+
 
 class Houses:
-    def __init__(self, env, file_path):
+    def __init__(self, env, file_path, time_index=None):
         self.env = env
         self.demand_data = pd.read_csv(file_path, parse_dates=['Datetime'])
-        self.current_hour = 0
+        self.time_index = time_index  # Shared TimeIndex; when set, the row follows the simulation time
+        self._current_hour = 0
+
+    @property
+    def current_hour(self):
+        if self.time_index is not None:
+            return self.time_index.row(self.env.now)
+        return self._current_hour
+
+    @current_hour.setter
+    def current_hour(self, hour):
+        self._current_hour = hour
+
+    def get_energy_demand(self):
+        # Energy Demand for the current hour in MJ
+        if self.time_index is not None:
+            return self.time_index.value('Energy Demand (MJ)', self.env.now)
+        return self.demand_data.iloc[self._current_hour]['Energy Demand (MJ)']
 
     def process(self):
         while True:
-            # Get the energy demand for the current hour
-            energy_demand = self.demand_data.iloc[self.current_hour]['Energy Demand (MJ)']
-            print(f"Hour: {self.current_hour}, Energy Demand by 3200 Houses: {energy_demand} MJ")
-            # Go to the next hour
-            self.current_hour += 1
-            if self.current_hour >= len(self.demand_data):
-                self.current_hour = 0  # Reset to the first hour after a year
+            self.step()
             # Process runs every hour
             yield self.env.timeout(1)
 
+    def step(self):
+        # Get the energy demand for the current hour
+        energy_demand = self.get_energy_demand()
+        print(f"Hour: {self.current_hour}, Energy Demand by 3200 Houses: {energy_demand} MJ")
+        # Go to the next hour; with a shared time index the row follows the simulation time instead
+        if self.time_index is None:
+            self._current_hour += 1
+            if self._current_hour >= len(self.demand_data):
+                self._current_hour = 0  # Reset to the first hour after a year
+
+    def get_checkpoint_state(self):
+        return {"current_hour": self._current_hour}
+
+    def restore_checkpoint_state(self, checkpoint_state):
+        self._current_hour = checkpoint_state["current_hour"]
+
 
 # # Initialize SimPy environment
 # env = simpy.Environment()
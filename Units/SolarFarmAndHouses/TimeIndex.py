@@ -0,0 +1,193 @@
+import logging
+import unittest
+
+import numpy as np
+
+from Utils.lazy_import import lazy_import
+
+pd = lazy_import("pandas")
+
+try:
+    from pytz.exceptions import InvalidTimeError  # Raised for ambiguous times by pandas < 3 (pytz time zones)
+    AMBIGUOUS_TIME_ERRORS = (ValueError, InvalidTimeError)
+except ImportError:
+    AMBIGUOUS_TIME_ERRORS = (ValueError,)
+
+
+class TimeIndex:
+    """
+    Shared, precomputed time index over several hourly (or finer) profiles.
+
+    The profiles are aligned once onto a regular grid covering the period all of them have in
+    common, so simulation time maps to a row with a single integer operation and every profile
+    is a plain array indexed by that row. Simulation time wraps around at the end of the grid,
+    like the per-unit hour counters did.
+
+    Timestamps are handled as follows:
+    - tz: local wall-clock timestamps are localized to this zone and converted to UTC, so the
+      missing spring-forward hour and the repeated fall-back hour of DST become a regular grid.
+    - Leap years need no special case: the grid follows the real calendar, and a missing 29
+      February in a leap year is a gap like any other.
+    - Gaps (and rows dropped while cleaning) are filled according to `fill`; timestamps off the
+      grid are snapped to it. Rows that fall on the same grid step are summed for energy columns
+      (per-interval totals such as "Energy Supplied (MJ)") and keep their first value otherwise.
+
+    Parameters:
+    - timestamps: pandas DatetimeIndex of the grid.
+    - columns: Dict of column name -> np.ndarray aligned with the grid.
+    """
+
+    def __init__(self, timestamps, columns):
+        self.timestamps = timestamps
+        self.n = len(timestamps)
+        if self.n == 0:
+            raise ValueError("The profiles have no period in common.")
+        self.step_h = (timestamps[1] - timestamps[0]) / pd.Timedelta(hours=1) if self.n > 1 else 1.0
+        self.columns = {}
+        for name, values in columns.items():
+            values = np.ascontiguousarray(values, dtype=np.float64)
+            values.flags.writeable = False
+            self.columns[name] = values
+        self.filled = {}  # Column -> number of rows filled in
+        self.duplicates = {}  # Column -> number of duplicate rows summed or dropped
+        self.trimmed = {}  # Column -> number of rows outside the common period
+
+    @classmethod
+    def from_frames(cls, *frames, step='1h', tz=None, fill='interpolate', datetime_column='Datetime',
+                    sum_columns=None):
+        """
+        Build a time index from data frames with a Datetime column and one or more value columns.
+
+        Parameters:
+        - frames: Data frames, e.g. SolarFarm.energy_data and Houses.demand_data.
+        - step: Grid step (pandas offset string).
+        - tz: Time zone of naive wall-clock timestamps, or None if they are already uniform.
+        - fill: 'interpolate', 'ffill' or 'zero' for rows missing from a profile.
+        - sum_columns: Columns whose rows on the same grid step are summed (default: the columns
+          named "Energy ..."); the other columns keep the first row.
+
+        Raises:
+        - ValueError: If a value column appears in more than one frame or fill is unknown.
+        """
+        if fill not in ('interpolate', 'ffill', 'zero'):
+            raise ValueError(f"Unknown fill method: {fill}")
+        step_delta = pd.Timedelta(step)
+        series = {}
+        for frame in frames:
+            timestamps = pd.DatetimeIndex(pd.to_datetime(frame[datetime_column]))
+            if tz is not None:
+                timestamps = cls._localize(timestamps, tz)
+            for column in frame.columns:
+                if column == datetime_column:
+                    continue
+                if column in series:
+                    raise ValueError(f"Column {column} appears in more than one profile.")
+                values = pd.Series(frame[column].to_numpy(dtype=np.float64), index=timestamps)
+                series[column] = values[values.index.notna()]
+
+        start = max(values.index.min() for values in series.values()).ceil(step_delta)
+        end = min(values.index.max() for values in series.values()).floor(step_delta)
+        grid = pd.date_range(start, end, freq=step_delta)
+
+        columns = {}
+        filled, duplicates, trimmed = {}, {}, {}
+        for column, values in series.items():
+            values.index = values.index.round(step_delta)
+            duplicates[column] = int(values.index.duplicated().sum())
+            if duplicates[column]:
+                summed = column in sum_columns if sum_columns is not None else column.startswith('Energy')
+                grouped = values.groupby(level=0, sort=False)
+                values = grouped.sum(min_count=1) if summed else grouped.first()
+            trimmed[column] = int(((values.index < start) | (values.index > end)).sum())
+            aligned = values.reindex(grid)
+            filled[column] = int(aligned.isna().sum())
+            if fill == 'interpolate':
+                aligned = aligned.interpolate(limit_direction='both')
+            elif fill == 'ffill':
+                aligned = aligned.ffill().bfill()
+            else:
+                aligned = aligned.fillna(0.0)
+            columns[column] = aligned.to_numpy()
+            if filled[column] or duplicates[column]:
+                logging.warning(f"Profile {column}: filled {filled[column]} missing rows, "
+                                f"merged {duplicates[column]} duplicate rows")
+
+        time_index = cls(grid, columns)
+        time_index.filled, time_index.duplicates, time_index.trimmed = filled, duplicates, trimmed
+        return time_index
+
+    @staticmethod
+    def _localize(timestamps, tz):
+        if timestamps.tz is None:
+            try:
+                timestamps = timestamps.tz_localize(tz, ambiguous='infer', nonexistent='NaT')
+            except AMBIGUOUS_TIME_ERRORS:
+                # The repeated hour cannot be inferred (e.g. it is not repeated); drop ambiguous rows instead
+                timestamps = timestamps.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+        return timestamps.tz_convert('UTC')
+
+    def row(self, t):
+        """Row of the grid at simulation time t (hours since the start of the grid)."""
+        return int(t / self.step_h) % self.n
+
+    def timestamp(self, t):
+        return self.timestamps[self.row(t)]
+
+    def column(self, name):
+        """Read-only array of one profile, aligned with the grid."""
+        return self.columns[name]
+
+    def value(self, name, t):
+        return self.columns[name][self.row(t)]
+
+
+# Test Suite
+class TestTimeIndex(unittest.TestCase):
+    @staticmethod
+    def _frame(timestamps, **columns):
+        return pd.DataFrame(dict(Datetime=timestamps, **columns))
+
+    def test_dst_transitions_become_a_regular_utc_grid(self):
+        # Spring forward: 02:00 does not exist; fall back: 01:00 appears twice
+        spring = ['2023-03-12 00:00', '2023-03-12 01:00', '2023-03-12 03:00', '2023-03-12 04:00']
+        time_index = TimeIndex.from_frames(self._frame(spring, x=[0.0, 1.0, 2.0, 3.0]), tz='America/New_York')
+        self.assertEqual(time_index.n, 4)
+        np.testing.assert_array_equal(time_index.column('x'), [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(time_index.filled['x'], 0)
+
+        fall = ['2023-11-05 00:00', '2023-11-05 01:00', '2023-11-05 01:00', '2023-11-05 02:00']
+        time_index = TimeIndex.from_frames(self._frame(fall, x=[0.0, 1.0, 2.0, 3.0]), tz='America/New_York')
+        self.assertEqual(time_index.n, 4)
+        np.testing.assert_array_equal(time_index.column('x'), [0.0, 1.0, 2.0, 3.0])
+        self.assertEqual(time_index.duplicates['x'], 0)
+
+        # A single 01:00 cannot be inferred; it is dropped and both 01:00 hours are filled in
+        single = ['2023-11-05 00:00', '2023-11-05 01:00', '2023-11-05 02:00']
+        time_index = TimeIndex.from_frames(self._frame(single, x=[0.0, 1.0, 3.0]), tz='America/New_York')
+        self.assertEqual(time_index.filled['x'], 2)
+
+    def test_gaps_are_filled(self):
+        frame = self._frame(['2024-01-01 00:00', '2024-01-01 01:00', '2024-01-01 04:00'], x=[0.0, 1.0, 4.0])
+        time_index = TimeIndex.from_frames(frame)
+        np.testing.assert_allclose(time_index.column('x'), [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(time_index.filled['x'], 2)
+        time_index = TimeIndex.from_frames(frame, fill='zero')
+        np.testing.assert_array_equal(time_index.column('x'), [0.0, 1.0, 0.0, 0.0, 4.0])
+        time_index = TimeIndex.from_frames(frame, fill='ffill')
+        np.testing.assert_array_equal(time_index.column('x'), [0.0, 1.0, 1.0, 1.0, 4.0])
+
+    def test_duplicates_are_summed_for_energy_columns(self):
+        timestamps = ['2024-01-01 00:00', '2024-01-01 00:10', '2024-01-01 01:00', '2024-01-01 02:00']
+        frame = self._frame(timestamps, **{'Energy Supplied (MJ)': [1.0, 2.0, 4.0, 8.0],
+                                           'Temperature (K)': [300.0, 301.0, 302.0, 303.0]})
+        time_index = TimeIndex.from_frames(frame)
+        np.testing.assert_array_equal(time_index.column('Energy Supplied (MJ)'), [3.0, 4.0, 8.0])
+        np.testing.assert_array_equal(time_index.column('Temperature (K)'), [300.0, 302.0, 303.0])
+        self.assertEqual(time_index.duplicates, {'Energy Supplied (MJ)': 1, 'Temperature (K)': 1})
+
+        time_index = TimeIndex.from_frames(frame, sum_columns=())
+        np.testing.assert_array_equal(time_index.column('Energy Supplied (MJ)'), [1.0, 4.0, 8.0])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -1,12 +1,10 @@
 import unittest
 import logging
-import sympy as sp
-from scipy.integrate import solve_ivp
 from pint import UnitRegistry
+from Utils.lazy_import import lazy_import
+
+scipy_integrate = lazy_import("scipy.integrate")
 
-# Set up logging
-logging.basicConfig(filename='hydrogen_container_log.txt', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s: %(message)s')
 class HydrogenContainerParameters:
     def __init__(self, V, T, n, a, b, inflow_rate, outflow_rate, heat_exchange_rate):
         self.V = V  # Volume of the container
@@ -103,7 +101,7 @@ class HydrogenContainerModel:
             return [dn_dt.magnitude, dT_dt.magnitude]
 
         try:
-            sol = solve_ivp(dydt, t_span, y0, method='RK45')
+            sol = scipy_integrate.solve_ivp(dydt, t_span, y0, method='RK45')
         except Exception as e:
             raise RuntimeError("Failed to perform dynamic simulation.") from e
 
@@ -148,4 +146,7 @@ class TestHydrogenContainerModel(unittest.TestCase):
 
 
 if __name__ == '__main__':
+    # Set up logging
+    logging.basicConfig(filename='hydrogen_container_log.txt', level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s: %(message)s')
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
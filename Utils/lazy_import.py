@@ -0,0 +1,34 @@
+import importlib
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Return a module object whose actual import is deferred until an attribute is first accessed.
+
+    Used for heavy libraries (sympy, pandas, scipy, ...) that a module needs in some code paths
+    only, so that importing the module stays cheap and free of side effects.
+
+    Parameters:
+    - name (str): Absolute module name, e.g. "sympy" or "scipy.integrate".
+
+    Returns:
+    - The already imported module if present in sys.modules, otherwise a lazily loading module.
+
+    Raises:
+    - ModuleNotFoundError: If the module cannot be found at all.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module